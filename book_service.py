@@ -0,0 +1,216 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import pickle
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import chess  # type: ignore
+import chess.polyglot  # type: ignore
+
+INDEX_VERSION = 1  # bump when the layout of the index file changes
+INDEX_FILE = "books.idx"  # merged index cache, next to books.ini
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedBookReader(chess.polyglot.MemoryMappedReader):
+    """MemoryMappedReader that finds its entries through the merged BookService index."""
+
+    def __init__(self, filename: str, service: "BookService", book_no: int):
+        super().__init__(filename)
+        self.service = service
+        self.book_no = book_no
+
+    def bisect_key_left(self, key: int) -> int:
+        rows = self.service.lookup_key(key)
+        if rows is None:
+            return super().bisect_key_left(key)  # index still building
+        start_count = rows.get(self.book_no)
+        # no entry in this book: any index past the end makes find_all() stop
+        return start_count[0] if start_count else len(self)
+
+    def close(self) -> None:
+        pass  # the mapping is shared - BookService.close() unmaps all books
+
+
+class BookService(object):
+    """All polyglot books memory mapped once, with one merged index over their keys.
+
+    The index holds every distinct key of all books (sorted) and for each key the
+    books containing it with the first entry number and entry count. A lookup is a
+    single bisect on the merged keys instead of one per book. The index is cached
+    in books/books.idx and rebuilt in a background thread when a book changed.
+    """
+
+    def __init__(self, book_files: List[str], index_file: Optional[str] = None, background: bool = True):
+        self.book_files = list(book_files)
+        self.readers: Dict[str, IndexedBookReader] = {}
+        for book_no, book_file in enumerate(self.book_files):
+            try:
+                self.readers[book_file] = IndexedBookReader(book_file, self, book_no)
+            except (OSError, IOError) as exc:
+                logger.warning("cannot open book %s: %s", book_file, exc)
+        if index_file is None:
+            book_dir = os.path.dirname(self.book_files[0]) if self.book_files else "books"
+            index_file = os.path.join(book_dir, INDEX_FILE)
+        self.index_file = index_file
+        self._keys: Optional[array] = None  # sorted distinct keys
+        self._first: array = array("I")  # first row for key i, rows of key i are _first[i] to _first[i + 1]
+        self._row_book: array = array("H")
+        self._row_start: array = array("I")
+        self._row_count: array = array("I")
+        self._ready = threading.Event()
+        if not self._load_index():
+            if background:
+                threading.Thread(target=self._build_index, name="book_index", daemon=True).start()
+            else:
+                self._build_index()
+
+    def reader(self, book_file: str) -> chess.polyglot.MemoryMappedReader:
+        """Return the already mapped reader for book_file - switching books costs nothing."""
+        book_reader = self.readers.get(book_file)
+        if book_reader is None:
+            logger.warning("book %s not in books.ini - opening it separately", book_file)
+            return chess.polyglot.open_reader(book_file)
+        return book_reader
+
+    def is_ready(self) -> bool:
+        """True once the merged index is loaded or built."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def lookup_key(self, key: int) -> Optional[Dict[int, Tuple[int, int]]]:
+        """Return {book number: (first entry, entry count)} for a zobrist key, None while the index is building."""
+        if not self._ready.is_set():
+            return None
+        keys = self._keys
+        if keys is None:
+            return None
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return {}
+        return {
+            self._row_book[row]: (self._row_start[row], self._row_count[row])
+            for row in range(self._first[i], self._first[i + 1])
+        }
+
+    def weights(self, board: chess.Board) -> Dict[str, Dict[chess.Move, int]]:
+        """Return {book file: {move: weight}} for all books having legal moves in this position."""
+        result: Dict[str, Dict[chess.Move, int]] = {}
+        key = chess.polyglot.zobrist_hash(board)
+        rows = self.lookup_key(key)
+        book_files = (self.book_files[book_no] for book_no in rows) if rows is not None else self.book_files
+        for book_file in book_files:
+            book_reader = self.readers.get(book_file)
+            if book_reader is None:
+                continue
+            moves: Dict[chess.Move, int] = {}
+            for entry in book_reader.find_all(board):
+                moves[entry.move] = moves.get(entry.move, 0) + entry.weight
+            if moves:
+                result[book_file] = moves
+        return result
+
+    def coverage(self, board: chess.Board) -> Dict[str, int]:
+        """Return {book file: number of book moves} for the position - used by the book menu."""
+        return {book_file: len(moves) for book_file, moves in self.weights(board).items()}
+
+    def close(self):
+        for book_reader in self.readers.values():
+            chess.polyglot.MemoryMappedReader.close(book_reader)
+        self.readers = {}
+
+    def _stamps(self) -> list:
+        stamps: List[Tuple[str, Optional[int], Optional[int]]] = []
+        for book_file in self.book_files:
+            try:
+                stat = os.stat(book_file)
+                stamps.append((book_file, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                stamps.append((book_file, None, None))
+        return stamps
+
+    def _load_index(self) -> bool:
+        try:
+            with open(self.index_file, "rb") as file:
+                index = pickle.load(file)
+            if index["version"] != INDEX_VERSION or index["stamps"] != self._stamps():
+                return False
+            self._first, self._row_book = index["first"], index["row_book"]
+            self._row_start, self._row_count = index["row_start"], index["row_count"]
+            self._keys = index["keys"]
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            return False
+        self._ready.set()
+        logger.debug("book index loaded: %d keys", len(self._keys))
+        return True
+
+    def _book_keys(self, book_reader: IndexedBookReader) -> array:
+        """All keys of one book in file order - polyglot entries are 16 bytes, big endian key first."""
+        entries = array("Q", bytes(book_reader.mmap[: book_reader.mmap.size()]))
+        keys = entries[0::2]
+        if sys.byteorder == "little":
+            keys.byteswap()
+        return keys
+
+    def _build_index(self):
+        stamps = self._stamps()
+        rows: List[Tuple[int, int, int, int]] = []  # (key, book number, first entry, entry count)
+        for book_no, book_file in enumerate(self.book_files):
+            book_reader = self.readers.get(book_file)
+            if book_reader is None or len(book_reader) == 0:
+                continue
+            keys = self._book_keys(book_reader)
+            start = 0
+            for i in range(1, len(keys) + 1):
+                if i == len(keys) or keys[i] != keys[start]:
+                    rows.append((keys[start], book_no, start, i - start))
+                    start = i
+        rows.sort()
+        merged_keys, first = array("Q"), array("I")
+        row_book, row_start, row_count = array("H"), array("I"), array("I")
+        for row, (key, book_no, start, count) in enumerate(rows):
+            if not merged_keys or merged_keys[-1] != key:
+                merged_keys.append(key)
+                first.append(row)
+            row_book.append(book_no)
+            row_start.append(start)
+            row_count.append(count)
+        first.append(len(rows))
+        self._first, self._row_book, self._row_start, self._row_count = first, row_book, row_start, row_count
+        self._keys = merged_keys
+        self._ready.set()
+        logger.debug("book index built: %d keys in %d books", len(merged_keys), len(self.readers))
+        index = {
+            "version": INDEX_VERSION,
+            "stamps": stamps,
+            "keys": merged_keys,
+            "first": first,
+            "row_book": row_book,
+            "row_start": row_start,
+            "row_count": row_count,
+        }
+        try:
+            with open(self.index_file + ".tmp", "wb") as file:
+                pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.index_file + ".tmp", self.index_file)
+        except OSError as exc:
+            logger.debug("could not write book index %s: %s", self.index_file, exc)
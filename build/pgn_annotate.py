@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Annotate the games of a pgn file like PicoTutor does during a game.
+
+Example: python3 build/pgn_annotate.py -o games/games-annotated.pgn games/games.pgn
+
+The games are handed to a pool of worker processes, each with its own tutor
+engine (tutor-engine of picochess.ini unless given). Every position of a game
+is searched twice, deep and shallow (the depths of PicoTutor), which gives the
+centipawn loss of each move and the score difference between the depths.
+PicoTutor's rules turn them into nags (??, ?, ?!, !!, !, !?) and comments with
+the CPL. The annotated games are written in the order of the input file. A
+checkpoint file next to the output remembers how many games are done, an
+interrupted run continues from there when started again.
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.util import Finalize
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import chess  # type: ignore
+import chess.engine  # type: ignore
+import chess.pgn  # type: ignore
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+import picotutor_constants as c  # noqa: E402
+from games_index import iter_pgn_games  # noqa: E402
+from pgn import add_evaluations  # noqa: E402
+from picotutor import PicoTutor  # noqa: E402
+
+PICOCHESS_INI = "picochess.ini"
+TUTOR_ENGINE = "/opt/picochess/engines/aarch64/a-stockf"  # default of tutor-engine in configuration.py
+MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHECKPOINT_SUFFIX = ".ckpt"  # the checkpoint of x-annotated.pgn is x-annotated.pgn.ckpt
+MATE_SCORE = 99999  # as PicoTutor.get_score
+
+Search = Tuple[int, int, chess.Move]  # score, mate (0 = none), best move - seen from the side to move
+
+_engine: Optional[chess.engine.SimpleEngine] = None  # the tutor engine of this worker process
+
+
+def tutor_engine(ini_file: str = PICOCHESS_INI) -> str:
+    """The tutor-engine of picochess.ini, the default one if it is not set."""
+    try:
+        with open(ini_file) as file:
+            for line in file:
+                match = re.match(r"\s*tutor-engine\s*=\s*(\S.*)$", line)
+                if match:
+                    return match.group(1).strip()
+    except OSError:
+        pass
+    return TUTOR_ENGINE
+
+
+def _open_engine(engine_path: str):
+    """Worker initializer: start the tutor engine, configured like PicoTutor's."""
+    global _engine
+    _engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    options = {name: value for name, value in (("Contempt", 0), ("Threads", c.NUM_THREADS)) if name in _engine.options}
+    _engine.configure(options)
+    # quit before the worker process waits for its threads at exit, the engine thread would block it
+    Finalize(_engine, _engine.quit, exitpriority=10)
+
+
+def _search(engine: chess.engine.SimpleEngine, board: chess.Board, depth: int) -> Search:
+    outcome = board.outcome()
+    if outcome is not None:
+        # mated: the worst, stalemate and other draws: even
+        return (-MATE_SCORE if outcome.winner is not None else 0), 0, chess.Move.null()
+    info = engine.analyse(board, chess.engine.Limit(depth=depth))
+    move, score, mate = PicoTutor.get_score(info, board.turn)
+    return (score if score is not None else 0), mate, move
+
+
+def evaluate_game(game: chess.pgn.Game, engine, deep_depth: int, low_depth: int) -> Dict[tuple, dict]:
+    """PicoTutor evaluations of all mainline moves of game, keyed like PicoTutor.get_eval_moves()."""
+    boards = [game.board()]
+    for move in game.mainline_moves():
+        board = boards[-1].copy(stack=False)
+        board.push(move)
+        boards.append(board)
+    deep = [_search(engine, board, deep_depth) for board in boards]
+    low = [_search(engine, board, low_depth) for board in boards]
+    evaluations: Dict[tuple, dict] = {}
+    scores: List[int] = []  # deep score of each move, seen from its side
+    for ply, board in enumerate(boards[:-1]):
+        move = boards[ply + 1].peek()
+        best_score, _, best_move = deep[ply]
+        current_score, current_mate = -deep[ply + 1][0], -deep[ply + 1][1]
+        low_score = -low[ply + 1][0]
+        scores.append(current_score)
+        before_score = scores[ply - 2] if ply >= 2 else None
+        best_deep_diff = best_score - current_score
+        deep_low_diff = current_score - low_score
+        legal_no = board.legal_moves.count()
+        if legal_no < 2:
+            continue  # there is no point evaluating the only legal move
+        eval_string = PicoTutor.classify_move(
+            best_deep_diff,
+            deep_low_diff,
+            current_score - before_score if before_score is not None else 0,
+            legal_no,
+            history_in_use=before_score is not None,
+            forced_mate=best_score == MATE_SCORE and deep[ply][1] == current_mate,
+        )
+        value = {"nag": PicoTutor.symbol_to_nag(eval_string)}
+        if best_move:
+            value["best_move"] = board.san(best_move)
+        value["user_move"] = board.san(move)
+        if value["nag"] == chess.pgn.NAG_NULL and best_deep_diff <= c.INACCURACY_TH:
+            continue  # nothing to say
+        value["CPL"] = best_deep_diff  # lost centipawns
+        if value["nag"] != chess.pgn.NAG_NULL:
+            if current_mate != 0:
+                value["mate"] = current_mate
+            value["deep_low_diff"] = deep_low_diff
+            if before_score is not None:
+                value["score_hist_diff"] = current_score - before_score
+        value["score"] = current_score
+        after = boards[ply + 1]
+        evaluations[(after.ply(), move, after.turn)] = value
+    return evaluations
+
+
+def annotate_text(text: str, deep_depth: int = c.DEEP_DEPTH, low_depth: int = c.LOW_DEPTH) -> Tuple[str, int]:
+    """Worker: the annotated pgn of one game text and its number of annotated moves."""
+    game = chess.pgn.read_game(io.StringIO(text))
+    if game is None:
+        return "", 0
+    if game.errors:
+        return str(game) + "\n\n", 0  # do not guess at broken games
+    annotated = add_evaluations(game, evaluate_game(game, _engine, deep_depth, low_depth))
+    game.headers["Annotator"] = "PicoTutor"
+    return str(game) + "\n\n", annotated
+
+
+def _checkpoint_file(output: str) -> str:
+    return output + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(pgn_file: str, output: str) -> Tuple[int, int]:
+    """(games, output bytes) done by an earlier run on pgn_file, (0, 0) if there is none."""
+    try:
+        with open(_checkpoint_file(output)) as file:
+            checkpoint = json.load(file)
+        if checkpoint["input"] == os.path.abspath(pgn_file) and os.path.getsize(output) >= checkpoint["size"]:
+            return checkpoint["games"], checkpoint["size"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return 0, 0
+
+
+def write_checkpoint(pgn_file: str, output: str, games: int, size: int):
+    checkpoint_file = _checkpoint_file(output)
+    with open(checkpoint_file + ".tmp", "w") as file:
+        json.dump({"input": os.path.abspath(pgn_file), "games": games, "size": size}, file)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+
+def _texts(pgn_file: str, skip: int) -> Iterator[Tuple[int, str]]:
+    with open(pgn_file, "rb") as file:
+        for game_no, (_, text) in enumerate(iter_pgn_games(file)):
+            if game_no >= skip:
+                yield game_no, text
+
+
+def annotate_file(
+    pgn_file: str,
+    output: str,
+    engine_path: str,
+    deep_depth: int = c.DEEP_DEPTH,
+    low_depth: int = c.LOW_DEPTH,
+    max_workers: int = MAX_WORKERS,
+    checkpoint_every: int = 10,
+    verbose: bool = True,
+) -> dict:
+    """Write the annotated games of pgn_file to output - returns the counters and the speed."""
+    started = time.monotonic()
+    done, size = read_checkpoint(pgn_file, output)
+    skipped = done
+    moves = 0
+    with open(output, "a+b") as out:
+        out.truncate(size)  # a game written after the last checkpoint is written again
+        out.seek(size)
+        results: Dict[int, Tuple[str, int]] = {}  # finished games waiting for the ones before them
+        with ProcessPoolExecutor(max_workers, initializer=_open_engine, initargs=(engine_path,)) as executor:
+            pending: dict = {}
+
+            def collect(futures):
+                nonlocal done, moves
+                for future in futures:
+                    results[pending.pop(future)] = future.result()
+                while done in results:
+                    annotated_pgn, annotated = results.pop(done)
+                    out.write(annotated_pgn.encode("utf-8"))
+                    moves += annotated
+                    done += 1
+                    if (done - skipped) % checkpoint_every == 0:
+                        out.flush()
+                        write_checkpoint(pgn_file, output, done, out.tell())
+                        if verbose:
+                            _progress(done - skipped, moves, started)
+
+            for game_no, text in _texts(pgn_file, done):
+                pending[executor.submit(annotate_text, text, deep_depth, low_depth)] = game_no
+                if len(pending) >= max_workers * 2:
+                    # do not read further ahead than the workers can annotate
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        out.flush()
+        write_checkpoint(pgn_file, output, done, out.tell())
+    elapsed = time.monotonic() - started
+    games = done - skipped
+    result = {
+        "games": games,
+        "skipped": skipped,
+        "moves": moves,
+        "seconds": elapsed,
+        "games_per_minute": 60 * games / elapsed if elapsed else 0.0,
+    }
+    if verbose:
+        print(
+            "{games} games annotated ({skipped} done before), {moves} moves with comments; "
+            "{seconds:.1f}s ({games_per_minute:.1f} games/min)".format(**result)
+        )
+    return result
+
+
+def _progress(games: int, moves: int, started: float):
+    elapsed = time.monotonic() - started
+    print("{} games, {} moves, {:.1f} games/min".format(games, moves, 60 * games / elapsed if elapsed else 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="annotate the games of a pgn file with PicoTutor evaluations")
+    parser.add_argument("pgn_file", help="pgn file, e.g. games/games.pgn")
+    parser.add_argument("-o", "--output", required=True, help="annotated pgn file, e.g. games/games-annotated.pgn")
+    parser.add_argument("-e", "--engine", default=None, help="uci engine, default is tutor-engine of picochess.ini")
+    parser.add_argument("-d", "--depth", type=int, default=c.DEEP_DEPTH, help="depth of the deep search")
+    parser.add_argument("-l", "--low-depth", type=int, default=c.LOW_DEPTH, help="depth of the shallow search")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, help="engine processes")
+    parser.add_argument("-c", "--checkpoint", type=int, default=10, help="games between two checkpoints")
+    args = parser.parse_args()
+    annotate_file(
+        args.pgn_file,
+        args.output,
+        args.engine or tutor_engine(),
+        args.depth,
+        args.low_depth,
+        args.workers,
+        args.checkpoint,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Build a polyglot opening book from pgn files.
+
+Example: python3 build/pgn_book.py -o books/u-mygames.bin games/games.pgn
+
+The games are cut into batches which a process pool parses. Every worker
+writes the (position, move) weights of its batch as a sorted run file, the
+runs are then merged on disk - memory use does not depend on the number of
+games. A move gets 2 points for each won game, 1 for each draw or unfinished
+game and 0 for a loss, seen from the side making the move.
+"""
+
+import argparse
+import configparser
+import heapq
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import chess  # type: ignore
+import chess.pgn  # type: ignore
+import chess.polyglot  # type: ignore
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from games_index import iter_pgn_games  # noqa: E402
+
+MAX_PLY = 30  # book depth in half moves
+BATCH_GAMES = 2000  # games parsed by one worker task - also the size of a run file
+MERGE_FANIN = 64  # run files merged at once
+MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+RUN_ENTRY = struct.Struct(">QHII")  # key, polyglot move, weight, games
+BOOK_ENTRY = struct.Struct(">QHHI")  # key, polyglot move, weight, learn
+
+POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}  # (white, black) points, others count as draw
+
+
+def polyglot_move(board: chess.Board, move: chess.Move) -> int:
+    """Encode move like polyglot does - castling is king takes own rook."""
+    move = board._to_chess960(move)
+    promotion = move.promotion - 1 if move.promotion else 0
+    return move.to_square | (move.from_square << 6) | (promotion << 12)
+
+
+def game_entries(text: str, max_ply: int) -> Iterator[Tuple[int, int, int]]:
+    """Yield (key, polyglot move, points) for the first max_ply mainline moves of one pgn game."""
+    game = chess.pgn.read_game(io.StringIO(text))
+    if game is None or game.errors:
+        return
+    white_points, black_points = POINTS.get(game.headers.get("Result", "*"), (1, 1))
+    board = game.board()
+    for ply, move in enumerate(game.mainline_moves()):
+        if ply >= max_ply:
+            break
+        points = white_points if board.turn == chess.WHITE else black_points
+        yield chess.polyglot.zobrist_hash(board), polyglot_move(board, move), points
+        board.push(move)
+
+
+def write_run(texts: List[str], max_ply: int, run_dir: str) -> Tuple[str, int, int]:
+    """Worker: parse a batch of games, write their summed weights as a sorted run file."""
+    weights: Dict[Tuple[int, int], List[int]] = {}
+    positions = 0
+    for text in texts:
+        for key, move, points in game_entries(text, max_ply):
+            entry = weights.setdefault((key, move), [0, 0])
+            entry[0] += points
+            entry[1] += 1
+            positions += 1
+    fd, path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, "wb") as file:
+        for (key, move), (weight, games) in sorted(weights.items()):
+            file.write(RUN_ENTRY.pack(key, move, weight, games))
+    return path, len(texts), positions
+
+
+def read_run(path: str) -> Iterator[Tuple[int, int, int, int]]:
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(RUN_ENTRY.size * 4096)
+            if not data:
+                return
+            yield from RUN_ENTRY.iter_unpack(data)
+
+
+def merge_runs(paths: List[str]) -> Iterator[Tuple[int, int, int, int]]:
+    """Merge sorted run files, summing the weights of equal (key, move) entries."""
+    current = None
+    for key, move, weight, games in heapq.merge(*(read_run(path) for path in paths)):
+        if current is not None and current[0] == key and current[1] == move:
+            current = (key, move, current[2] + weight, current[3] + games)
+            continue
+        if current is not None:
+            yield current
+        current = (key, move, weight, games)
+    if current is not None:
+        yield current
+
+
+def merge_to_run(paths: List[str], run_dir: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, "wb") as file:
+        for entry in merge_runs(paths):
+            file.write(RUN_ENTRY.pack(*entry))
+    for old_path in paths:
+        os.remove(old_path)
+    return path
+
+
+def _book_entries(position: List[Tuple[int, int, int, int]], min_games: int) -> Iterator[bytes]:
+    """Entries of one position, best first, weights scaled into 16 bits."""
+    position = [entry for entry in position if entry[3] >= min_games and entry[2] > 0]
+    if not position:
+        return
+    max_weight = max(entry[2] for entry in position)
+    scale = 65535 / max_weight if max_weight > 65535 else 1
+    for key, move, weight, _ in sorted(position, key=lambda entry: entry[2], reverse=True):
+        yield BOOK_ENTRY.pack(key, move, max(1, int(weight * scale)), 0)
+
+
+def write_book(entries: Iterable[Tuple[int, int, int, int]], book_file: str, min_games: int) -> int:
+    """Write merged (key, move, weight, games) entries as polyglot book - returns the number of entries."""
+    count = 0
+    with open(book_file + ".tmp", "wb") as file:
+        position: List[Tuple[int, int, int, int]] = []
+        for entry in entries:
+            if position and position[0][0] != entry[0]:
+                for data in _book_entries(position, min_games):
+                    file.write(data)
+                    count += 1
+                position = []
+            position.append(entry)
+        for data in _book_entries(position, min_games):
+            file.write(data)
+            count += 1
+    os.replace(book_file + ".tmp", book_file)
+    return count
+
+
+def _batches(pgn_files: List[str], batch_games: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for pgn_file in pgn_files:
+        with open(pgn_file, "rb") as file:
+            for _, text in iter_pgn_games(file):
+                batch.append(text)
+                if len(batch) >= batch_games:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def build_book(
+    pgn_files: List[str],
+    book_file: str,
+    max_ply: int = MAX_PLY,
+    min_games: int = 1,
+    max_workers: int = MAX_WORKERS,
+    batch_games: int = BATCH_GAMES,
+    verbose: bool = True,
+) -> dict:
+    """Build book_file from pgn_files - returns the counters and timings."""
+    started = time.monotonic()
+    games = positions = 0
+    run_dir = tempfile.mkdtemp(prefix="pgnbook-", dir=os.path.dirname(os.path.abspath(book_file)))
+    runs: List[str] = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending: set = set()
+            for batch in _batches(pgn_files, batch_games):
+                pending.add(executor.submit(write_run, batch, max_ply, run_dir))
+                if len(pending) < max_workers * 2:
+                    continue
+                # do not read further ahead than the workers can parse
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, batch_games_done, batch_positions = future.result()
+                    runs.append(path)
+                    games, positions = games + batch_games_done, positions + batch_positions
+                if verbose:
+                    _progress(games, positions, started)
+            for future in pending:
+                path, batch_games_done, batch_positions = future.result()
+                runs.append(path)
+                games, positions = games + batch_games_done, positions + batch_positions
+        parsed = time.monotonic()
+        while len(runs) > MERGE_FANIN:
+            runs = [merge_to_run(runs[i : i + MERGE_FANIN], run_dir) for i in range(0, len(runs), MERGE_FANIN)]
+        entries = write_book(merge_runs(runs), book_file, min_games)
+    finally:
+        for path in runs:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(run_dir)
+    finished = time.monotonic()
+    result = {
+        "games": games,
+        "positions": positions,
+        "entries": entries,
+        "parse_seconds": parsed - started,
+        "merge_seconds": finished - parsed,
+        "games_per_second": games / (parsed - started) if parsed > started else 0.0,
+    }
+    if verbose:
+        print(
+            "{games} games, {positions} positions -> {entries} book entries; "
+            "parsing {parse_seconds:.1f}s ({games_per_second:.0f} games/s), merging {merge_seconds:.1f}s".format(
+                **result
+            )
+        )
+    return result
+
+
+def _progress(games: int, positions: int, started: float):
+    elapsed = time.monotonic() - started
+    print("{} games, {} positions, {:.0f} games/s".format(games, positions, games / elapsed if elapsed else 0.0))
+
+
+def register_book(book_file: str, books_ini: str):
+    """Add book_file to books.ini (same names as build/books.py would give it)."""
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(books_ini)
+    book_file_name = os.path.basename(book_file)
+    book = book_file_name[2:-4]
+    config[book_file_name] = {"small": book[:6], "medium": book[:8].title(), "large": book[:11].title()}
+    with open(books_ini, "w") as configfile:
+        config.write(configfile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build a polyglot opening book from pgn files")
+    parser.add_argument("pgn_files", nargs="+", help="pgn files, e.g. games/games.pgn")
+    parser.add_argument("-o", "--output", required=True, help="book file, e.g. books/u-mygames.bin")
+    parser.add_argument("-d", "--max-ply", type=int, default=MAX_PLY, help="book depth in half moves")
+    parser.add_argument("-m", "--min-games", type=int, default=1, help="minimum number of games for a move")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, help="parser processes")
+    parser.add_argument("-b", "--batch", type=int, default=BATCH_GAMES, help="games per parser task")
+    parser.add_argument("--no-register", action="store_true", help="do not add the book to books.ini")
+    args = parser.parse_args()
+    build_book(args.pgn_files, args.output, args.max_ply, args.min_games, args.workers, args.batch)
+    if not args.no_register:
+        books_ini = os.path.join(os.path.dirname(os.path.abspath(args.output)), "books.ini")
+        register_book(args.output, books_ini)
+        print("registered {} in {}".format(os.path.basename(args.output), books_ini))
+
+
+if __name__ == "__main__":
+    main()
@@ -113,6 +113,34 @@ class Configuration:
             metavar="PORT",
             help="launch web server",
         )
+        self.parser.add_argument(
+            "-osp",
+            "--opening-stats-port",
+            type=int,
+            default=7777,
+            help="port of the built-in opening statistics service for the web page (replaces obooksrv), 0 = off",
+        )
+        self.parser.add_argument(
+            "-osd",
+            "--opening-stats-data",
+            type=str,
+            default="obooksrv/opening.data",
+            help="opening statistics file used by the opening statistics service",
+        )
+        self.parser.add_argument(
+            "-gdp",
+            "--games-db-port",
+            type=int,
+            default=7778,
+            help="port of the built-in games database for the web page (replaces the tcscid gamesdb), 0 = off",
+        )
+        self.parser.add_argument(
+            "-gdb",
+            "--games-db-pgn",
+            type=str,
+            default="gamesdb/games.pgn",
+            help="comma separated pgn files searched by the games database in addition to your own games",
+        )
         self.parser.add_argument("-m", "--email", type=str, help="email used to send pgn/log files", default=None)
         self.parser.add_argument("-ms", "--smtp-server", type=str, help="address of email server", default=None)
         self.parser.add_argument("-mu", "--smtp-user", type=str, help="username for email server", default=None)
@@ -138,6 +166,13 @@ class Configuration:
             help="key used to send emails via Mailgun Webservice",
             default=None,
         )
+        self.parser.add_argument(
+            "-mbd",
+            "--mail-batch-delay",
+            type=float,
+            default=30.0,
+            help="seconds a finished game waits in the outbox for more games to go in the same email, default is 30",
+        )
         self.parser.add_argument(
             "-bc",
             "--beep-config",
@@ -274,6 +309,19 @@ class Configuration:
             action="store_true",
             help="continue last game after (re)start of picochess",
         )
+        self.parser.add_argument(
+            "-pgnan",
+            "--pgn-animate",
+            action="store_true",
+            help="show the headers and replay the last move when a pgn game is loaded, default is a bulk load",
+        )
+        self.parser.add_argument(
+            "-jsyn",
+            "--journal-sync",
+            type=float,
+            default=5.0,
+            help="seconds between two syncs of the game journal to the sd card (0 = every move), default is 5",
+        )
         self.parser.add_argument(
             "-seng",
             "--show-engine",
@@ -312,6 +360,46 @@ class Configuration:
             action="store_true",
             help="Pico Opening Explorer: shows the name(s) of the opening (based on ECO file), default is off",
         )
+        self.parser.add_argument(
+            "-tada",
+            "--tutor-adaptive",
+            action="store_true",
+            help="PicoTutor analyses only the best few moves deeply and searches a missed user move separately, default is off",
+        )
+        self.parser.add_argument(
+            "-spec",
+            "--speculate-moves",
+            type=int,
+            default=0,
+            help="in normal mode the engine searches the positions after the best few tutor moves while you think, default is 0 (off)",
+        )
+        self.parser.add_argument(
+            "-spcpu",
+            "--speculate-cpu",
+            type=int,
+            default=50,
+            help="percentage of one cpu core the speculative engine searches may use, default is 50",
+        )
+        self.parser.add_argument(
+            "-tbp",
+            "--tablebase-path",
+            type=str,
+            default="tablebases/syzygy",
+            help="syzygy tablebase directory probed by picochess itself for tutor and analysis, empty to switch off",
+        )
+        self.parser.add_argument(
+            "-tbpc",
+            "--tablebase-pieces",
+            type=int,
+            default=5,
+            help="probe the tablebases in positions with at most this many pieces, default is 5",
+        )
+        self.parser.add_argument(
+            "-tbm",
+            "--tablebase-moves",
+            action="store_true",
+            help="a playing engine at full strength takes its moves from the tablebases, default is off",
+        )
         self.parser.add_argument(
             "-tcom",
             "--tutor-comment",
@@ -319,6 +407,13 @@ class Configuration:
             default="off",
             help="show game comments based on specific engines (=single) or in general (=all). Default value is off",
         )
+        self.parser.add_argument(
+            "-eii",
+            "--engine-info-interval",
+            type=float,
+            default=0.5,
+            help="seconds between two engine analysis updates (multipv sets) parsed by picochess, 0 parses every info line",
+        )
         self.parser.add_argument(
             "-loc",
             "--location",
@@ -926,6 +926,7 @@ class DgtDisplay(DisplayMsg):
         self.dgtmenu.set_mode(message.info["interaction_mode"])
         self.dgtmenu.set_book(message.info["book_index"])
         self.dgtmenu.all_books = message.info["books"]
+        self.dgtmenu.book_coverage_fn = message.info.get("book_coverage")
         tc_init = message.info["tc_init"]
         timectrl = self.time_control = TimeControl(**tc_init)
 
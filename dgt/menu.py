@@ -20,9 +20,10 @@ import subprocess
 import logging
 import dgt.util
 import asyncio
+import copy
 from configobj import ConfigObj  # type: ignore
 from collections import OrderedDict
-from typing import Dict, List, Set
+from typing import Callable, Dict, List, Optional, Set
 from pgn import ModeInfo
 import chess  # type: ignore
 from timecontrol import TimeControl
@@ -78,6 +79,7 @@ from dgt.api import Dgt, Event
 from dgt.board import Rev2Info
 from dgt.translate import DgtTranslate
 from uci.engine_provider import EngineProvider
+from pgn_index import PAGE_SIZE
 
 
 logger = logging.getLogger(__name__)
@@ -218,6 +220,8 @@ class MenuState(object):
     GAME_GAMEREAD_GAME1 = 922000
     GAME_GAMEREAD_GAME2 = 923000
     GAME_GAMEREAD_GAME3 = 924000
+    GAME_GAMEREAD_ARCHIVE = 925000
+    GAME_GAMEREAD_ARCHIVE_GAME = 925100
     GAME_GAMEALTMOVE = 930000
     GAME_GAMEALTMOVE_ONOFF = 931000
     GAME_GAMECONTLAST = 940000
@@ -325,6 +329,11 @@ class DgtMenu(object):
 
         self.menu_book = 0
         self.all_books: List[Dict[str, str]] = []
+        self.book_coverage_fn: Optional[Callable[[], Dict[str, int]]] = None  # {book file: book moves} for position
+        self.pgn_library = None  # PgnLibrary of the games folder, the archive menu browses its pgn_file
+        self.pgn_file = "games.pgn"
+        self.menu_game_read_archive_index = 0  # game number within pgn_file
+        self.menu_game_read_archive_page: Dict = {}  # the page of headers the game number is on
 
         self.menu_system = System.POWER
         self.menu_system_sound = self.dgttranslate.beep
@@ -1148,6 +1157,52 @@ class DgtMenu(object):
         text = self.dgttranslate.text("B00_game_read_game3")
         return text
 
+    def enter_game_gameread_archive_menu(self):
+        """Set the gameread state."""
+        self.state = MenuState.GAME_GAMEREAD_ARCHIVE
+        text = self.dgttranslate.text("B00_game_read_archive")
+        return text
+
+    def _archive_games(self) -> int:
+        index = self.pgn_library.index(self.pgn_file) if self.pgn_library is not None else None
+        return len(index) if index is not None else 0
+
+    def _get_current_archive_game(self):
+        """Number and players of the archive game - its headers come page by page from the library."""
+        page_size = PAGE_SIZE
+        page = self.menu_game_read_archive_index // page_size
+        if self.menu_game_read_archive_page.get("page") != page:
+            self.menu_game_read_archive_page = self.pgn_library.page(self.pgn_file, page, page_size)
+        games = self.menu_game_read_archive_page["games"]
+        headers = games[min(self.menu_game_read_archive_index % page_size, len(games) - 1)] if games else {}
+
+        def player(tag: str) -> str:
+            return headers.get(tag, "?").split(",")[0].strip() or "?"
+
+        msg = "{} {}-{} {}".format(
+            self.menu_game_read_archive_index + 1, player("White"), player("Black"), headers.get("Result", "*")
+        )
+        return self.dgttranslate.text("B00_default", msg)
+
+    def enter_game_gameread_archive_game_menu(self):
+        """Set the gameread state - start with the newest game."""
+        self.menu_game_read_archive_page = {}
+        games = self._archive_games()
+        if not games:
+            return self.dgttranslate.text("Y00_errormenu")
+        self.state = MenuState.GAME_GAMEREAD_ARCHIVE_GAME
+        self.menu_game_read_archive_index = games - 1
+        return self._get_current_archive_game()
+
+    def _step_archive_game(self, step: int):
+        games = self._archive_games()
+        if not games:
+            return self.enter_game_gameread_archive_menu()
+        if games != self.menu_game_read_archive_page.get("total"):
+            self.menu_game_read_archive_page = {}  # games were added
+        self.menu_game_read_archive_index = (self.menu_game_read_archive_index + step) % games
+        return self._get_current_archive_game()
+
     def enter_game_contlast_menu(self):
         """Set the CONTLAST state."""
         self.state = MenuState.GAME_GAMECONTLAST
@@ -1377,6 +1432,13 @@ class DgtMenu(object):
 
     def _get_current_book_name(self):
         text = self.all_books[self.menu_book]["text"]
+        if self.book_coverage_fn is not None:
+            # show how many book moves this book has for the current position
+            moves = self.book_coverage_fn().get(self.all_books[self.menu_book]["file"], 0)
+            text = copy.copy(text)
+            text.web_text = "{} ({})".format(text.web_text, moves)
+            if len(text.large_text) + len(str(moves)) < 11:
+                text.large_text = "{} {}".format(text.large_text, moves)
         text.beep = self.dgttranslate.bl(BeepLevel.BUTTON)
         return text
 
@@ -2181,6 +2243,12 @@ class DgtMenu(object):
         elif self.state == MenuState.GAME_GAMEREAD_GAME3:
             text = self.enter_game_gameread_menu()
 
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE:
+            text = self.enter_game_gameread_menu()
+
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE_GAME:
+            text = self.enter_game_gameread_archive_menu()
+
         elif self.state == MenuState.GAME_GAMEALTMOVE:
             text = self.enter_game_menu()
 
@@ -2282,6 +2350,8 @@ class DgtMenu(object):
                 text = self.enter_game_gameread_game2_menu()
             if self.menu_game_read == GameRead.GAME3:
                 text = self.enter_game_gameread_game3_menu()
+            if self.menu_game_read == GameRead.ARCHIVE:
+                text = self.enter_game_gameread_archive_menu()
 
         elif self.state == MenuState.GAME_GAMENEW:
             text = self.enter_game_new_yesno_menu()
@@ -2369,6 +2439,14 @@ class DgtMenu(object):
             await Observable.fire(event)
             text = await self._fire_dispatchdgt(self.dgttranslate.text("B10_okreadgame"))
 
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE:
+            text = self.enter_game_gameread_archive_game_menu()
+
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE_GAME:
+            event = Event.READ_GAME(pgn_filename=self.pgn_file, game_index=self.menu_game_read_archive_index)
+            await Observable.fire(event)
+            text = await self._fire_dispatchdgt(self.dgttranslate.text("B10_okreadgame"))
+
         elif self.state == MenuState.PICOTUTOR:
             if self.menu_picotutor == PicoTutor.WATCHER:
                 text = self.enter_picotutor_picowatcher_menu()
@@ -3188,7 +3266,7 @@ class DgtMenu(object):
             text = self.dgttranslate.text(self.menu_game.value)
 
         elif self.state == MenuState.GAME_GAMEREAD_GAMELAST:
-            self.state = MenuState.GAME_GAMEREAD_GAME3
+            self.state = MenuState.GAME_GAMEREAD_ARCHIVE
             self.menu_game_read = GameReadLoop.prev(self.menu_game_read)
             text = self.dgttranslate.text(self.menu_game_read.value)
 
@@ -3207,6 +3285,14 @@ class DgtMenu(object):
             self.menu_game_read = GameReadLoop.prev(self.menu_game_read)
             text = self.dgttranslate.text(self.menu_game_read.value)
 
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE:
+            self.state = MenuState.GAME_GAMEREAD_GAME3
+            self.menu_game_read = GameReadLoop.prev(self.menu_game_read)
+            text = self.dgttranslate.text(self.menu_game_read.value)
+
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE_GAME:
+            text = self._step_archive_game(-1)
+
         elif self.state == MenuState.GAME_GAMECONTLAST:
             self.state = MenuState.GAME_GAMEALTMOVE
             self.menu_game = GameLoop.prev(self.menu_game)
@@ -3808,10 +3894,18 @@ class DgtMenu(object):
             text = self.dgttranslate.text(self.menu_game_read.value)
 
         elif self.state == MenuState.GAME_GAMEREAD_GAME3:
+            self.state = MenuState.GAME_GAMEREAD_ARCHIVE
+            self.menu_game_read = GameReadLoop.next(self.menu_game_read)
+            text = self.dgttranslate.text(self.menu_game_read.value)
+
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE:
             self.state = MenuState.GAME_GAMEREAD_GAMELAST
             self.menu_game_read = GameReadLoop.next(self.menu_game_read)
             text = self.dgttranslate.text(self.menu_game_read.value)
 
+        elif self.state == MenuState.GAME_GAMEREAD_ARCHIVE_GAME:
+            text = self._step_archive_game(1)
+
         elif self.state == MenuState.GAME_GAMECONTLAST:
             self.state = MenuState.GAME_GAMENEW
             self.menu_game = GameLoop.next(self.menu_game)
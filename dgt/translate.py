@@ -4006,6 +4006,33 @@ class DgtTranslate(object):
             )
             frtxt = entxt
             estxt = entxt
+        if text_id == "game_read_archive":
+            entxt = Dgt.DISPLAY_TEXT(
+                web_text="",
+                large_text="Archive    ",
+                medium_text="Archive ",
+                small_text="archiv",
+            )
+            detxt = Dgt.DISPLAY_TEXT(
+                web_text="",
+                large_text="Archiv     ",
+                medium_text="Archiv  ",
+                small_text="archiv",
+            )
+            nltxt = Dgt.DISPLAY_TEXT(
+                web_text="",
+                large_text="Archief    ",
+                medium_text="Archief ",
+                small_text="archif",
+            )
+            ittxt = Dgt.DISPLAY_TEXT(
+                web_text="Sfoglia l'archivio delle partite",
+                large_text="Archivio   ",
+                medium_text="Archivio",
+                small_text="archiv",
+            )
+            frtxt = entxt
+            estxt = entxt
         if text_id == "okreadgame":
             entxt = Dgt.DISPLAY_TEXT(
                 web_text="",
@@ -183,10 +183,11 @@ class GameRead(MyEnum):
     GAME1 = "B00_game_read_game1"
     GAME2 = "B00_game_read_game2"
     GAME3 = "B00_game_read_game3"
+    ARCHIVE = "B00_game_read_archive"
 
     @classmethod
     def items(cls):
-        return [GameRead.GAMELAST, GameRead.GAME1, GameRead.GAME2, GameRead.GAME3]
+        return [GameRead.GAMELAST, GameRead.GAME1, GameRead.GAME2, GameRead.GAME3, GameRead.ARCHIVE]
 
 
 class GameReadLoop(object):
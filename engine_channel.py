@@ -0,0 +1,155 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+from typing import Dict, Optional
+
+CHANNEL_PATH = "/tmp/picochess_engines.sock"
+CHANNEL_ENV = "PICOCHESS_CHANNEL"  # tells the helper engines started by picochess where the channel is
+MAX_LINE = 64 * 1024
+
+# the states and the files which hold them for helpers not using the channel
+PGN_GAME_INFO = "pgn_game_info"
+PGN_GAME_INFO_FILE = "/opt/picochess/engines/" + platform.machine() + "/extra/pgn_game_info.txt"
+ONLINE_GAME = "online_game"
+ONLINE_GAME_FILE = "online_game.txt"
+
+logger = logging.getLogger(__name__)
+
+
+def read_state_file(path: str) -> Optional[Dict[str, str]]:
+    """The NAME=value lines of a state file as dict, None if it cannot be read."""
+    state: Dict[str, str] = {}
+    try:
+        with open(path) as file:
+            for line in file:
+                name, value = line.partition("=")[::2]
+                if name.strip():
+                    state[name.strip()] = value.strip()
+    except OSError:
+        return None
+    return state
+
+
+class EngineChannel(object):
+    """Unix socket on which helper engines (pgn, online) push their state as json lines.
+
+    A helper sends {"t": kind, "state": {NAME: value, ...}} whenever its state
+    changes, the same names as in its state file. The latest state of each kind
+    is kept in memory: get() needs no file read and wait() returns as soon as a
+    new state arrived. Helpers which do not use the channel still write their
+    state file, the readers fall back to it (read_state_file) while no state was pushed.
+    """
+
+    def __init__(self, path: str = CHANNEL_PATH):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._states: Dict[str, Dict[str, str]] = {}
+        self._updated: Dict[str, asyncio.Event] = {}
+        self.messages = 0
+
+    async def start(self) -> bool:
+        """Listen on the socket - the helper engines started from now on find it by CHANNEL_ENV."""
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # left over by a picochess which did not exit cleanly
+            self._server = await asyncio.start_unix_server(self._client, path=self.path, limit=MAX_LINE)
+        except OSError as exc:
+            logger.warning("engine channel %s not available, reading state files: %s", self.path, exc)
+            return False
+        os.environ[CHANNEL_ENV] = self.path
+        logger.debug("engine channel listening on %s", self.path)
+        return True
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    self.update(message["t"], message["state"])
+                except (ValueError, KeyError, TypeError) as exc:
+                    logger.warning("broken engine channel message %s: %s", line[:80], exc)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as exc:
+            logger.warning("engine channel connection lost: %s", exc)
+        finally:
+            writer.close()
+
+    def update(self, kind: str, state: dict):
+        """New state of kind - wakes up whoever waits for it."""
+        self._states[kind] = {str(name): str(value) for name, value in state.items()}
+        self.messages += 1
+        event = self._updated.pop(kind, None)
+        if event is not None:
+            event.set()
+
+    def get(self, kind: str) -> Optional[Dict[str, str]]:
+        """Latest pushed state of kind, None if there was none."""
+        return self._states.get(kind)
+
+    async def wait(self, kind: str, timeout: float) -> Optional[Dict[str, str]]:
+        """Latest state of kind once the next one arrived, or after timeout seconds."""
+        event = self._updated.setdefault(kind, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.get(kind)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class ChannelClient(object):
+    """Helper engine side of the EngineChannel - send() fails quietly, the state file is the fallback."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(CHANNEL_ENV, CHANNEL_PATH)
+        self._sock: Optional[socket.socket] = None
+
+    def send(self, kind: str, state: dict) -> bool:
+        """Push the state of kind to picochess - returns False if it is not listening."""
+        line = json.dumps({"t": kind, "state": state}) + "\n"
+        for _ in range(2):  # a connection closed by a restarted picochess is opened again once
+            try:
+                if self._sock is None:
+                    self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._sock.settimeout(1.0)
+                    self._sock.connect(self.path)
+                self._sock.sendall(line.encode("utf-8"))
+                return True
+            except OSError:
+                self.close()
+        return False
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
@@ -9,15 +9,21 @@
 #
 ############################################################################
 
+import os
 import sys
 import time
 import chess
 import chess.pgn
 import chess.engine
-import random
 import pygame
 from pathlib import Path
 
+## the picochess folder, three levels up from engines/<arch>/extra
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from pgn_index import GameSequence, PgnIndex  # noqa: E402
+from guess_analysis import GuessAnalyzer  # noqa: E402
+from engine_channel import ChannelClient, PGN_GAME_INFO  # noqa: E402
+
 ###########################################################################################
 # UCI Wrapper
 ###########################################################################################
@@ -59,13 +65,15 @@ j = 0
 i = 0
 
 move_list = []
-game_list = []
-orig_game_list = []
-pgn_file = ""
+pgn_index = None  ## offsets and headers of the games, they are parsed when played
+game_sequence = None
 pgn_game = None
 board = None
 input_board = None
 engine = None
+analyzer = None  ## analyses the next master moves in the background while the user thinks
+guess_move = ""  ## last user move which was not the master move
+channel = ChannelClient()  ## game infos are pushed to picochess on its engine channel
 info_handler = None
 info_str = ""
 fen = ""
@@ -107,6 +115,28 @@ def write_log(x):
         log.flush()
 
 
+def schedule_analysis():
+    """Let the analyzer work on the coming master moves while the user thinks."""
+    if analyzer and board is not None:
+        analyzer.schedule(board, move_list[move_counter:])
+
+
+def guess_feedback(master_uci):
+    """Info string comparing the last (wrong) guess with the master move, from the background analysis."""
+    if not analyzer or not guess_move or input_board is None or not input_board.move_stack:
+        return ""
+    before = input_board.copy()
+    before.pop()
+    if before.board_fen() != board.board_fen() or before.turn != board.turn:
+        return ""  ## not a guess in the current position of the game
+    guess_score, master_score = analyzer.compare(
+        board, chess.Move.from_uci(guess_move), chess.Move.from_uci(master_uci), p_think_time
+    )
+    if guess_score is None or master_score is None:
+        return ""
+    return "info string guess %s cp %d master %s cp %d" % (guess_move, guess_score, master_uci, master_score)
+
+
 def convert_to_uci(move):
     global p_own_color
 
@@ -188,6 +218,14 @@ def get_move():
                 ponder_move = ""
 
                 info_str = "info depth 0"
+                if analyzer and guess_ok and move_pgn not in ("0000", "ABORT", ""):
+                    ## analysed while the user was thinking - only a master move which is no top move
+                    ## of this position waits (at most think time) for the analysis of the position after it
+                    evaluation = analyzer.evaluation(board)
+                    score = analyzer.move_score(board, chess.Move.from_uci(move_pgn), p_think_time)
+                    if score is not None:
+                        depth = evaluation["depth"] if evaluation is not None else 0
+                        info_str = "info depth %d score cp %d pv %s" % (depth, score, move_pgn)
 
             ponder_move = move  ## molli: the ponder move for pico is the current engine move
             ##else:
@@ -213,6 +251,8 @@ def pub_move():
     if uci_move != "" and uci_move != "ABORT" and guess_ok:
         board.push(chess.Move.from_uci(uci_move))
     else:
+        if not guess_ok and uci_move != "" and uci_move != "ABORT":
+            info_str = guess_feedback(uci_move)  ## how good was the guess
         move_counter = move_counter - 1
         uci_move = "ABORT"
         ponder_move = ""
@@ -236,26 +276,7 @@ def pub_move():
         log.flush()
 
     guess_ok = True
-
-
-def get_orig_game_index(find_game):
-    global orig_game_list
-    found = False
-    orig_index = 0
-    i = 0
-
-    while not found:
-        if orig_game_list[i].headers == find_game.headers:
-            orig_index = i
-            found = True
-        i = i + 1
-
-    ##for game in orig_game_list:
-    ##    if game.headers == find_game.headers:
-    ##       orig_index = i
-    ##   i = i + 1
-
-    return orig_index
+    schedule_analysis()
 
 
 def newgame():
@@ -271,11 +292,9 @@ def newgame():
     global info_handler
     global max_moves
     global pgn_game
-    global pgn_file
-    global game_list
     global game_counter
     global max_games
-    global orig_game_list
+    global game_sequence
     global fen
     global l_continue
 
@@ -283,6 +302,7 @@ def newgame():
         move_counter = 0
         board = get_start_pos(board)
         input_board = get_start_pos(input_board)
+        schedule_analysis()
         return
 
     result = ""
@@ -290,6 +310,8 @@ def newgame():
     event = ""
     white = ""
     black = ""
+    white_elo = "?"
+    black_elo = "?"
     orig_index = 0
 
     move_counter = 0
@@ -297,29 +319,21 @@ def newgame():
     j = 0
     move_list = []
 
-    if game_counter == 0:
-        ## reset list to all games
-        game_counter = max_games
-        game_list = orig_game_list.copy()
-
-    ## get game from remaining games by specified sequence
-    if p_game_sequence == "random":
-        game_index = int(random.randint(0, game_counter - 1))
-    elif p_game_sequence == "forward":
-        game_index = max_games - game_counter
-    elif p_game_sequence == "backward":
-        game_index = game_counter - 1
-    else:
-        game_index = int(random.randint(0, game_counter - 1))
+    if game_sequence is None or game_sequence.count != max_games or game_sequence.sequence != p_game_sequence:
+        game_sequence = GameSequence(max_games, p_game_sequence)
 
-    if game_index < 0:
-        game_index = 0
+    ## get game from remaining games by specified sequence, parse only this one
+    game_index = 0
+    if l_continue and max_games > 0:
+        game_index = game_sequence.next()
+        pgn_game = pgn_index.read_game(game_index)
+        if pgn_game is None:
+            l_continue = False
 
     if log:
         log.write("game index: %s\n" % str(game_index))
 
     if l_continue:
-        pgn_game = game_list[game_index]
 
         if "FEN" in pgn_game.headers:
             fen = pgn_game.headers["FEN"]
@@ -363,10 +377,7 @@ def newgame():
 
         if log:
             log.write("FEN: %s\n" % str(fen))
-    ## delete this game from current list
-    if l_continue:
-        del game_list[game_index]
-        game_counter = game_counter - 1
+    game_counter = len(game_sequence)
 
     ## create move list of the new game
     move_counter = 0
@@ -389,65 +400,51 @@ def newgame():
         log.write("Number of moves: %s\n" % str(max_moves))
         log.flush()
 
-    ## log current pgn game infos for picochess control in main program
-
-    try:
-        log_p = open(log_file_pgn_info, "w")
-    except OSError:
-        log_p = ""
-        print("# Could not create user log file")
-
     game_started = True
 
     if p_audio_comment:
         play_audio()
 
-    if log_p:
-
-        if l_continue:
-            orig_index = get_orig_game_index(pgn_game)
-
-            if p_pgn_game_file == "/opt/picochess/games/last_game.pgn":
-                event = "LastGame"
-            elif "/opt/picochess/games/picochess_game_1.pgn" == p_pgn_game_file:
-                event = "SaveGame_1"
-            elif "/opt/picochess/games/picochess_game_2.pgn" == p_pgn_game_file:
-                event = "SaveGame_2"
-            elif "/opt/picochess/games/picochess_game_3.pgn" == p_pgn_game_file:
-                event = "SaveGame_3"
-            elif "PicoChess Game" in event:
-                event = "PicoGame" + str(orig_index + 1)
-            elif "Online" in event:
-                event = "PicoOnlineGame" + str(orig_index + 1)
-        else:
-            event = "File-Error"
-
-        log_p.write("PGN_GAME=%s\n" % event)
-        log_p.flush()
-
-        log_p.write("PGN_GAME_INDEX=%s\n" % str(orig_index + 1))
-        log_p.flush()
-
-        log_p.write("PGN_PROBLEM=%s\n" % problem)
-        log_p.flush()
-
-        log_p.write("PGN_White=%s\n" % white)
-        log_p.flush()
-
-        log_p.write("PGN_Black=%s\n" % black)
-        log_p.flush()
-
-        log_p.write("PGN_FEN=%s\n" % fen)
-        log_p.flush()
-
-        log_p.write("PGN_RESULT=%s\n" % result)
-        log_p.flush()
-
-        log_p.write("PGN_White_ELO=%s\n" % white_elo)
-        log_p.flush()
+    if l_continue:
+        orig_index = game_index
+
+        if p_pgn_game_file == "/opt/picochess/games/last_game.pgn":
+            event = "LastGame"
+        elif "/opt/picochess/games/picochess_game_1.pgn" == p_pgn_game_file:
+            event = "SaveGame_1"
+        elif "/opt/picochess/games/picochess_game_2.pgn" == p_pgn_game_file:
+            event = "SaveGame_2"
+        elif "/opt/picochess/games/picochess_game_3.pgn" == p_pgn_game_file:
+            event = "SaveGame_3"
+        elif "PicoChess Game" in event:
+            event = "PicoGame" + str(orig_index + 1)
+        elif "Online" in event:
+            event = "PicoOnlineGame" + str(orig_index + 1)
+    else:
+        event = "File-Error"
+
+    ## current pgn game infos for picochess control in main program
+    pgn_info = {
+        "PGN_GAME": event,
+        "PGN_GAME_INDEX": str(orig_index + 1),
+        "PGN_PROBLEM": problem,
+        "PGN_White": white,
+        "PGN_Black": black,
+        "PGN_FEN": fen,
+        "PGN_RESULT": result,
+        "PGN_White_ELO": white_elo,
+        "PGN_Black_ELO": black_elo,
+    }
+    ## pushed to picochess at once, the file is kept for a picochess without the channel
+    channel.send(PGN_GAME_INFO, pgn_info)
+    try:
+        with open(log_file_pgn_info, "w") as log_p:
+            for name, value in pgn_info.items():
+                log_p.write("%s=%s\n" % (name, value))
+    except OSError:
+        print("# Could not create user log file")
 
-        log_p.write("PGN_Black_ELO=%s\n" % black_elo)
-        log_p.flush()
+    schedule_analysis()
 
 
 def push_uci_move(uci_move):
@@ -538,9 +535,11 @@ while True:
             if flag_audio_playing:
                 pygame.mixer.music.stop()
 
-            if is_uci and p_pgn_game_file and pgn_file != "" and game_started:
-                pgn_file.close()
+            if analyzer:
+                analyzer.close()
+            channel.close()
 
+            if is_uci and game_started:
                 game_started = False
             is_uci = False
             sys.exit(0)
@@ -591,6 +590,7 @@ while True:
                 log.flush()
 
             guess_ok = set_move_counter_from_fen(last_move)
+            guess_move = "" if guess_ok else last_move
 
             if game_started:
                 push_uci_move(last_move)
@@ -632,6 +632,7 @@ while True:
 
             if last_move != "":
                 guess_ok = set_move_counter_from_fen(last_move)
+                guess_move = "" if guess_ok else last_move
                 push_uci_move(last_move)
 
         elif "setoption name pgn_audio_file value" in line:
@@ -664,22 +665,19 @@ while True:
             if p_pgn_game_file:
                 l_continue = True
                 try:
-                    pgn_file = open(p_pgn_game_file)
+                    ## the index is read from pgn_file.idx, only a changed file is scanned again
+                    if pgn_index is None or pgn_index.pgn_file != p_pgn_game_file:
+                        pgn_index = PgnIndex(p_pgn_game_file)
+                    else:
+                        pgn_index.refresh()
                 except OSError:
                     l_continue = False
                     print2("# Error: opening file %s" % p_pgn_game_file)
 
                 if l_continue:
-                    while True:
-                        game = chess.pgn.read_game(pgn_file)
-                        if game == None:
-                            break
-                        j = j + 1
-                        max_games = j
-                        game_list.append(game)
-
-                orig_game_list = game_list.copy()
-                if max_games > 0:
+                    max_games = len(pgn_index)
+
+                if max_games > 0 and (game_sequence is None or game_sequence.count != max_games):
                     game_counter = max_games
 
                 if log:
@@ -692,6 +690,16 @@ while True:
             if p_engine_path != "" and p_think_time > 0:
 
                 think_time = p_think_time * 1000
+                if analyzer and analyzer.engine_path != p_engine_path:
+                    analyzer.close()
+                    analyzer = None
+                if analyzer is None:
+                    analyzer = GuessAnalyzer(p_engine_path, p_think_time)
+                analyzer.think_time = p_think_time
+            elif analyzer:
+                analyzer.close()
+                analyzer = None
+                think_time = 0
 
             if is_uci:
                 print2("id name %s" % engine_name)
@@ -0,0 +1,151 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+import chess  # type: ignore
+
+CACHE_SIZE = 512  # answers kept per service
+PREFETCH_BOOK_MOVES = 4  # most played book moves whose positions are prefetched
+PREFETCH_PV_PLIES = 2  # engine pv moves whose positions are prefetched
+
+logger = logging.getLogger(__name__)
+
+BOOK_MOVES = "book_moves"
+GAMES = "games"
+
+
+def normalize_fen(fen: str) -> str:
+    """Position part of a fen - move counters do not change the explorer answers."""
+    return " ".join(fen.split()[:4])
+
+
+class ExplorerCache(object):
+    """LRU cache in front of the opening statistics and games database of the web page.
+
+    Both lookups run in a worker thread. After a move prefetch() looks up the new
+    position and the positions after its most played book moves and after the
+    first moves of the engine pv, so the explorer tables are filled from memory
+    when the position changes. get_stats() reports the hit rates.
+    """
+
+    def __init__(self, opening_stats=None, games_index=None, cache_size: int = CACHE_SIZE):
+        self.opening_stats = opening_stats
+        self.games_index = games_index
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()  # (service, fen) -> answer
+        self._prefetched: set = set()  # keys filled by prefetch and not requested yet
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+
+    def _lookup(self, service: str, fen: str) -> dict:
+        if service == BOOK_MOVES:
+            return self.opening_stats.get_book_moves(fen) if self.opening_stats else {"data": []}
+        return self.games_index.get_games(fen) if self.games_index else {"data": []}
+
+    def _store(self, key: tuple, answer: dict):
+        self._cache[key] = answer
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size * 2:  # two services share the cache
+            old_key, _ = self._cache.popitem(last=False)
+            self._prefetched.discard(old_key)
+
+    async def get(self, service: str, fen: str) -> dict:
+        """Return the answer of service for fen, from the cache if possible."""
+        key = (service, normalize_fen(fen))
+        answer = self._cache.get(key)
+        if answer is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.prefetch_hits += 1
+            return answer
+        self.misses += 1
+        answer = await asyncio.to_thread(self._lookup, service, key[1])
+        self._store(key, answer)
+        return answer
+
+    async def get_book_moves(self, fen: str) -> dict:
+        return await self.get(BOOK_MOVES, fen)
+
+    async def get_games(self, fen: str) -> dict:
+        return await self.get(GAMES, fen)
+
+    def prefetch(self, board: chess.Board, pv: Optional[List[chess.Move]] = None):
+        """Fill the cache for board and its likely next positions in the background."""
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            if pv is not None:
+                return  # pv updates come often - the running prefetch is good enough
+            self._prefetch_task.cancel()
+        self._prefetch_task = asyncio.create_task(self._prefetch(board.copy(), list(pv or [])))
+
+    def _next_fens(self, board: chess.Board, book_moves: dict, pv: List[chess.Move]) -> List[str]:
+        fens = []
+        rows = sorted(book_moves.get("data", []), key=lambda row: row["count"], reverse=True)
+        for row in rows[:PREFETCH_BOOK_MOVES]:
+            try:
+                board.push_uci(row["move"])
+            except ValueError:
+                continue
+            fens.append(board.fen())
+            board.pop()
+        pv_board = board.copy(stack=False)
+        for move in pv[:PREFETCH_PV_PLIES]:
+            if not pv_board.is_legal(move):
+                break
+            pv_board.push(move)
+            fens.append(pv_board.fen())
+        return fens
+
+    async def _prefetch(self, board: chess.Board, pv: List[chess.Move]):
+        try:
+            fens = [board.fen()]
+            book_moves = await self._prefetch_fen(BOOK_MOVES, board.fen())
+            fens += self._next_fens(board, book_moves, pv)
+            for fen in fens:
+                for service in (BOOK_MOVES, GAMES):
+                    await self._prefetch_fen(service, fen)
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:  # noqa - never let a prefetch error reach the event loop
+            logger.debug("explorer prefetch failed: %s", exc)
+
+    async def _prefetch_fen(self, service: str, fen: str) -> dict:
+        key = (service, normalize_fen(fen))
+        answer = self._cache.get(key)
+        if answer is None:
+            answer = await asyncio.to_thread(self._lookup, service, key[1])
+            self._store(key, answer)
+            self._prefetched.add(key)
+            self.prefetches += 1
+        return answer
+
+    def get_stats(self) -> dict:
+        """Return cache counters and hit rates."""
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "prefetches": self.prefetches,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_hit_rate": round(self.prefetch_hits / self.prefetches, 3) if self.prefetches else 0.0,
+            "size": len(self._cache),
+        }
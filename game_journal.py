@@ -0,0 +1,269 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, TextIO
+
+import chess  # type: ignore
+
+from dgt.util import TimeMode
+
+JOURNAL_FILE = "games/game_journal.jsonl"
+SYNC_INTERVAL = 5.0  # seconds between two fsyncs of the journal, 0 syncs every record
+
+logger = logging.getLogger(__name__)
+
+
+def _clock(tc_init: dict) -> Optional[List[float]]:
+    internal_time = tc_init.get("internal_time")
+    if not internal_time:
+        return None
+    return [round(float(internal_time[chess.WHITE]), 1), round(float(internal_time[chess.BLACK]), 1)]
+
+
+def _time_control(tc_init: dict) -> dict:
+    """Time control settings of tc_init (TimeControl.get_parameters) without the clock times, as json values."""
+    settings = {key: value for key, value in tc_init.items() if key != "internal_time"}
+    settings["mode"] = tc_init["mode"].name
+    return settings
+
+
+class JournalGame(object):
+    """The game of a journal: start position, moves with the clock times after them, time control and headers."""
+
+    def __init__(self, fen: str, time_control: dict, clock: Optional[List[float]], headers: Dict[str, str]):
+        self.fen = fen
+        self.time_control = time_control
+        self.headers = headers
+        self.moves: List[str] = []  # uci
+        self.clocks: List[Optional[List[float]]] = [clock]  # clock at start and after each move
+        self.result: Optional[str] = None  # set when the game ended
+
+    def board(self) -> chess.Board:
+        """Board with the journaled moves played - stops at the first move that is not legal."""
+        board = chess.Board(self.fen)
+        for uci in self.moves:
+            move = chess.Move.from_uci(uci)
+            if move not in board.legal_moves:
+                logger.warning("journal move %s not legal in %s", uci, board.fen())
+                break
+            board.push(move)
+        return board
+
+    def tc_init(self) -> Optional[dict]:
+        """Time control for TimeControl(**tc_init) with the clock times of the last journaled move."""
+        try:
+            tc_init = dict(self.time_control, mode=TimeMode[self.time_control["mode"]])
+        except (KeyError, TypeError):
+            return None
+        clock = self.clocks[len(self.board().move_stack)]
+        tc_init["internal_time"] = {chess.WHITE: clock[0], chess.BLACK: clock[1]} if clock else None
+        return tc_init
+
+
+def read_journal(path: str = JOURNAL_FILE) -> Optional[JournalGame]:
+    """Game of the journal at path, None if there is none.
+
+    A torn last line (power lost during the write) ends the journal,
+    everything before it is restored.
+    """
+    game: Optional[JournalGame] = None
+    try:
+        with open(path, encoding="utf-8") as file:
+            for line_no, line in enumerate(file, 1):
+                try:
+                    record = json.loads(line)
+                    kind = record["t"]
+                    if kind == "game":
+                        game = JournalGame(record["fen"], record["tc"], record.get("clock"), record.get("headers", {}))
+                    elif game is None:
+                        continue
+                    elif kind == "move":
+                        del game.moves[record["ply"] :]  # normally nothing, ply is the number of earlier moves
+                        del game.clocks[record["ply"] + 1 :]
+                        game.moves.append(record["uci"])
+                        game.clocks.append(record.get("clock"))
+                        game.result = None
+                    elif kind == "takeback":
+                        del game.moves[record["ply"] :]
+                        del game.clocks[record["ply"] + 1 :]
+                        game.result = None
+                    elif kind == "update":
+                        game.time_control = record.get("tc", game.time_control)
+                        game.headers = record.get("headers", game.headers)
+                    elif kind == "end":
+                        game.result = record.get("result", "*")
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("game journal %s ends with a broken record in line %d", path, line_no)
+                    break
+    except OSError:
+        return None
+    return game
+
+
+def read_unfinished_game(path: str = JOURNAL_FILE) -> Optional[JournalGame]:
+    """Game of the journal at path if it has moves and did not end, else None."""
+    game = read_journal(path)
+    if game is None or game.result is not None or not game.moves:
+        return None
+    return game
+
+
+class GameJournal(object):
+    """Append-only journal of the game being played, one json line per record.
+
+    record() is called whenever the game may have changed and appends the new
+    moves (with the clock times after them), takebacks and changed time control
+    or headers. A new game rewrites the journal with just its start record, so
+    the file never holds more than one game. Each record is written to the
+    operating system right away - a crash of picochess loses nothing - while
+    fsyncs are batched to one per sync_interval seconds to spare SD cards; a
+    power loss loses at most the moves of the last sync_interval seconds.
+    end() and close() sync at once.
+    """
+
+    def __init__(self, path: str = JOURNAL_FILE, sync_interval: float = SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._file: Optional[TextIO] = None
+        self._fen = ""  # start position of the journaled game
+        self._moves: List[chess.Move] = []
+        self._time_control: dict = {}
+        self._headers: Dict[str, str] = {}
+        self._ended = False
+        self._synced = 0.0  # monotonic time of the last fsync
+        self._dirty = False
+        self._sync_handle: Optional[asyncio.TimerHandle] = None
+        self.records = 0
+        self.syncs = 0
+
+    def resume(self, game: JournalGame):
+        """Continue the journal of game (restored from it) instead of starting a new one."""
+        self._fen = game.fen
+        self._moves = list(game.board().move_stack)
+        self._time_control = game.time_control
+        self._headers = game.headers
+        self._ended = game.result is not None
+
+    def record(self, game: chess.Board, tc_init: dict, headers: Optional[dict] = None):
+        """Journal what changed in game (and its time control and headers) since the last call."""
+        moves = game.move_stack
+        if len(moves) == len(self._moves) and (not moves or moves[-1] == self._moves[-1]):
+            if game.root().fen() == self._fen:
+                return  # the usual case: called on every event, nothing moved
+        time_control = _time_control(tc_init)
+        headers = dict(headers or {})
+        root_fen = game.root().fen()
+        common = 0
+        if root_fen == self._fen:
+            common = next(
+                (ply for ply, (move, old) in enumerate(zip(moves, self._moves)) if move != old),
+                min(len(moves), len(self._moves)),
+            )
+        if root_fen != self._fen or not moves:
+            # also a (new) game without moves: the journal is compacted to its start record
+            self._new_game(root_fen, time_control, headers, tc_init)
+            common = 0
+        elif common < len(self._moves):
+            self._write({"t": "takeback", "ply": common})
+            del self._moves[common:]
+            self._ended = False  # taken back after the game ended: it goes on
+        if time_control != self._time_control or headers != self._headers:
+            self._write({"t": "update", "tc": time_control, "headers": headers})
+            self._time_control, self._headers = time_control, headers
+        for move in moves[common:]:
+            self._write({"t": "move", "ply": len(self._moves), "uci": move.uci(), "clock": _clock(tc_init)})
+            self._moves.append(move)
+            self._ended = False
+
+    def _new_game(self, fen: str, time_control: dict, headers: dict, tc_init: dict):
+        record = {"t": "game", "fen": fen, "tc": time_control, "clock": _clock(tc_init), "headers": headers}
+        self._close_file()
+        try:
+            # compact: the journal only holds the new game
+            with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(self.path + ".tmp", self.path)
+            self.records += 1
+        except OSError as exc:
+            logger.warning("could not start game journal %s: %s", self.path, exc)
+        self._fen, self._time_control, self._headers = fen, time_control, headers
+        self._moves = []
+        self._ended = False
+        self._synced = time.monotonic()
+
+    def end(self, game: chess.Board, tc_init: dict, result: str):
+        """Game ended with result - journal its last moves and that there is nothing left to restore."""
+        moves = game.move_stack
+        if game.root().fen() != self._fen or moves[: len(self._moves)] != self._moves:
+            return  # not the journaled game - ended in a mode without journal
+        self.record(game, tc_init, self._headers)
+        if self._ended:
+            return
+        self._write({"t": "end", "result": result})
+        self._ended = True
+        self.sync()
+
+    def _write(self, record: dict):
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+        except OSError as exc:
+            logger.warning("could not write game journal %s: %s", self.path, exc)
+            self._close_file()
+            return
+        self.records += 1
+        self._dirty = True
+        wait = self._synced + self.sync_interval - time.monotonic()
+        if wait <= 0:
+            self.sync()
+        elif self._sync_handle is None:
+            try:
+                self._sync_handle = asyncio.get_running_loop().call_later(wait, self.sync)
+            except RuntimeError:
+                self.sync()  # no event loop to sync later
+
+    def sync(self):
+        """Force the written records to the storage."""
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        if self._dirty and self._file is not None:
+            try:
+                os.fsync(self._file.fileno())
+                self.syncs += 1
+            except OSError as exc:
+                logger.warning("could not sync game journal %s: %s", self.path, exc)
+        self._dirty = False
+        self._synced = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self.sync()
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def close(self):
+        """Sync and close the journal file, a later record() opens it again."""
+        self._close_file()
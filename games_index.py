@@ -0,0 +1,356 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+import io
+import logging
+import os
+import pickle
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import chess  # type: ignore
+import chess.pgn  # type: ignore
+import chess.polyglot  # type: ignore
+
+INDEX_VERSION = 1  # bump when the layout of the index file changes
+INDEX_FILE = "games" + os.sep + "games.idx"
+MAX_GAMES = 50  # games returned per position, same as get_games.tcl
+MAX_PLY = 60  # positions indexed per game - the web page shows games for opening positions
+MERGE_LIMIT = 50000  # appended positions kept outside the sorted arrays before merging
+
+logger = logging.getLogger(__name__)
+
+
+class PgnGameSplitter(object):
+    """Split pgn bytes into the texts of their games, line by line or in chunks of any size.
+
+    A game starts with the first tag line after movetext (or at start). Unlike
+    chess.pgn.read_game this does not depend on empty lines between the games.
+    """
+
+    def __init__(self, start: int = 0):
+        self._offset = start  # byte offset of the game being collected
+        self._position = start  # byte offset of the next line
+        self._lines: List[bytes] = []
+        self._in_moves = False
+        self._partial = b""  # chunk data after its last newline
+
+    def feed_line(self, line: bytes) -> Optional[Tuple[int, str]]:
+        """Add a line - returns (byte offset, pgn text) of the game it ended, if it did."""
+        game = None
+        stripped = line.strip().lstrip(codecs.BOM_UTF8)
+        if stripped.startswith(b"[") and self._in_moves:
+            game = self._offset, b"".join(self._lines).decode("utf-8-sig", errors="replace")
+            self._lines, self._in_moves = [], False
+        if stripped and not stripped.startswith(b"["):
+            self._in_moves = True
+        if stripped or self._lines:
+            if not self._lines:
+                self._offset = self._position
+            self._lines.append(line)
+        self._position += len(line)
+        return game
+
+    def feed(self, data: bytes) -> List[Tuple[int, str]]:
+        """Add a chunk - returns (byte offset, pgn text) of the games it ended."""
+        games = []
+        data = self._partial + data
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            game = self.feed_line(data[start : end + 1])
+            if game is not None:
+                games.append(game)
+            start = end + 1
+        self._partial = data[start:]
+        return games
+
+    def close(self) -> List[Tuple[int, str]]:
+        """Add the data after the last newline - returns (byte offset, pgn text) of the games it ended."""
+        games = []
+        if self._partial:
+            game = self.feed_line(self._partial)
+            if game is not None:
+                games.append(game)
+            self._partial = b""
+        if self._lines:
+            games.append((self._offset, b"".join(self._lines).decode("utf-8-sig", errors="replace")))
+        self._lines, self._in_moves = [], False
+        return games
+
+
+def iter_pgn_games(file: BinaryIO, start: int = 0) -> Iterator[Tuple[int, str]]:
+    """Yield (byte offset, pgn text) of every game in a binary file object from offset start."""
+    file.seek(start)
+    splitter = PgnGameSplitter(start)
+    for line in file:
+        game = splitter.feed_line(line)
+        if game is not None:
+            yield game
+    yield from splitter.close()
+
+
+class _PositionVisitor(chess.pgn.BaseVisitor):
+    """Collect the zobrist keys of the first MAX_PLY mainline positions and the headers."""
+
+    def begin_game(self):
+        self.headers: Dict[str, str] = {}
+        self.keys: Set[int] = set()
+        self.board: Optional[chess.Board] = None
+
+    def visit_header(self, tagname: str, tagvalue: str):
+        self.headers[tagname] = tagvalue
+
+    def visit_board(self, board: chess.Board):
+        if self.board is None:  # called again with the final position
+            self.board = board.copy(stack=False)
+            self.keys.add(chess.polyglot.zobrist_hash(self.board))
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move):
+        if self.board is not None and len(self.board.move_stack) < MAX_PLY:
+            self.board.push(move)
+            self.keys.add(chess.polyglot.zobrist_hash(self.board))
+
+    def result(self):
+        return self.headers, self.keys
+
+
+class GamesIndex(object):
+    """Position index over PGN files - replaces the tcscid games database server.
+
+    Every game gets a number, its file and its offset in that file. The index maps
+    the zobrist key of each mainline position (up to MAX_PLY) to the numbers of the
+    games reaching it: two parallel arrays sorted by key, so a lookup is a bisect.
+    Games appended to a file later (games.pgn) go into a small dict first and are
+    merged into the arrays when there are many of them. The index is cached in
+    games/games.idx - unchanged files are not parsed again, grown files only from
+    where indexing stopped.
+    """
+
+    def __init__(self, pgn_files: List[str], index_file: str = INDEX_FILE, background: bool = True):
+        self.pgn_files = list(pgn_files)
+        self.index_file = index_file
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._clear()
+        if background:
+            threading.Thread(target=self._load_or_build, name="games_index", daemon=True).start()
+        else:
+            self._load_or_build()
+
+    def _clear(self):
+        self._indexed: Dict[str, Tuple[int, int]] = {}  # file -> (indexed size, mtime)
+        self._game_file = array("H")
+        self._game_offset = array("Q")
+        self._keys = array("Q")  # sorted position keys ...
+        self._games = array("I")  # ... and the game number for each of them
+        self._appended: Dict[int, List[int]] = {}  # key -> game numbers, not yet merged
+        self._appended_count = 0
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def __len__(self) -> int:
+        return len(self._game_offset)
+
+    def find_games(self, board: chess.Board, max_games: int = MAX_GAMES) -> List[int]:
+        """Return the numbers of the (first max_games) games which reached this position."""
+        key = chess.polyglot.zobrist_hash(board)
+        with self._lock:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_right(self._keys, key, lo)
+            games = sorted(set(self._games[lo:hi]).union(self._appended.get(key, ())))
+        return games[:max_games]
+
+    def read_game(self, game_no: int) -> Optional[chess.pgn.Game]:
+        with self._lock:
+            path = self.pgn_files[self._game_file[game_no]]
+            offset = self._game_offset[game_no]
+        try:
+            with open(path, "rb") as file:
+                for _, text in iter_pgn_games(file, offset):
+                    return chess.pgn.read_game(io.StringIO(text))
+        except (OSError, ValueError) as exc:
+            logger.warning("cannot read game %d from %s: %s", game_no, path, exc)
+        return None
+
+    def get_games(self, fen: str, max_games: int = MAX_GAMES) -> dict:
+        """Return the same json object as get_games.tcl for action=get_games."""
+        try:
+            board = chess.Board(fen)
+        except ValueError:
+            return {"data": []}
+        data = []
+        for game_no in self.find_games(board, max_games):
+            game = self.read_game(game_no)
+            if game is not None:
+                data.append(self._game_info(game))
+        return {"data": data}
+
+    @staticmethod
+    def _game_info(game: chess.pgn.Game) -> dict:
+        def player(name: str, elo: str) -> str:
+            return "{} ({})".format(name, elo) if elo.isdigit() and int(elo) else name
+
+        headers = game.headers
+        result = headers.get("Result", "*")
+        year = headers.get("Date", "????")[:4].replace("?", "")
+        return {
+            "white": player(headers.get("White", "?"), headers.get("WhiteElo", "")),
+            "black": player(headers.get("Black", "?"), headers.get("BlackElo", "")),
+            "result": result if result in ("1-0", "0-1", "1/2-1/2") else "*",
+            "event": "{}, {}".format(year, headers.get("Event", "?")) if year else headers.get("Event", "?"),
+            "pgn": str(game) + "\n",
+        }
+
+    def update(self, path: Optional[str] = None) -> int:
+        """Index games appended to path (or all files) since the last update - returns the number of new games."""
+        self.wait_ready()
+        new_games = 0
+        for pgn_file in [path] if path else self.pgn_files:
+            if pgn_file not in self.pgn_files:
+                self.pgn_files.append(pgn_file)
+            with self._lock:
+                indexed_size = self._indexed.get(pgn_file, (0, 0))[0]
+            try:
+                size = os.path.getsize(pgn_file)
+            except OSError:
+                continue
+            if size < indexed_size:
+                logger.info("%s was rewritten - rebuilding the games index", pgn_file)
+                self._build()
+                return len(self)
+            if size > indexed_size:
+                new_games += self._index_file(pgn_file, indexed_size, appended=True)
+        if new_games:
+            with self._lock:
+                if self._appended_count > MERGE_LIMIT:
+                    self._merge_appended()
+            self._save_index()
+        return new_games
+
+    def _index_file(self, path: str, start: int, appended: bool) -> int:
+        """Parse path from offset start, add its games - appended games go to the unmerged dict."""
+        rows: List[Tuple[int, int]] = []
+        file_no = self.pgn_files.index(path)
+        games = 0
+        try:
+            with open(path, "rb") as file:
+                for offset, text in iter_pgn_games(file, start):
+                    result = chess.pgn.read_game(io.StringIO(text), Visitor=_PositionVisitor)
+                    if result is None:
+                        continue
+                    keys = result[1]
+                    with self._lock:
+                        game_no = len(self._game_offset)
+                        self._game_file.append(file_no)
+                        self._game_offset.append(offset)
+                        if appended:
+                            for key in keys:
+                                self._appended.setdefault(key, []).append(game_no)
+                            self._appended_count += len(keys)
+                    if not appended:
+                        rows.extend((key, game_no) for key in keys)
+                    games += 1
+                end = file.tell()
+            stat = os.stat(path)
+        except OSError as exc:
+            logger.warning("cannot index %s: %s", path, exc)
+            return games
+        with self._lock:
+            self._indexed[path] = (end, stat.st_mtime_ns)
+            if rows:
+                self._merge_rows(rows)
+        logger.debug("indexed %d games from %s", games, path)
+        return games
+
+    def _merge_rows(self, rows: List[Tuple[int, int]]):
+        if self._keys:
+            rows.extend(zip(self._keys, self._games))
+        rows.sort()
+        self._keys = array("Q", (key for key, _ in rows))
+        self._games = array("I", (game_no for _, game_no in rows))
+
+    def _merge_appended(self):
+        rows = [(key, game_no) for key, games in self._appended.items() for game_no in games]
+        self._appended, self._appended_count = {}, 0
+        self._merge_rows(rows)
+
+    def _build(self):
+        with self._lock:
+            self._clear()
+        for pgn_file in self.pgn_files:
+            if os.path.isfile(pgn_file):
+                self._index_file(pgn_file, 0, appended=False)
+        self._save_index()
+
+    def _load_or_build(self):
+        try:
+            if self._load_index():
+                self._ready.set()
+                self.update()
+                return
+            self._build()
+        finally:
+            self._ready.set()
+
+    def _load_index(self) -> bool:
+        try:
+            with open(self.index_file, "rb") as file:
+                index = pickle.load(file)
+            if index["version"] != INDEX_VERSION or index["pgn_files"] != self.pgn_files:
+                return False
+            for path, (size, mtime) in index["indexed"].items():
+                stat = os.stat(path)
+                if stat.st_size < size or (stat.st_size == size and stat.st_mtime_ns != mtime):
+                    return False  # rewritten, not appended
+            with self._lock:
+                self._indexed = index["indexed"]
+                self._game_file, self._game_offset = index["game_file"], index["game_offset"]
+                self._keys, self._games = index["keys"], index["games"]
+                self._appended, self._appended_count = index["appended"], index["appended_count"]
+        except (OSError, EOFError, KeyError, TypeError, ValueError, pickle.UnpicklingError):
+            return False
+        logger.debug("games index loaded: %d games", len(self))
+        return True
+
+    def _save_index(self):
+        with self._lock:
+            index = {
+                "version": INDEX_VERSION,
+                "pgn_files": list(self.pgn_files),
+                "indexed": dict(self._indexed),
+                "game_file": self._game_file,
+                "game_offset": self._game_offset,
+                "keys": self._keys,
+                "games": self._games,
+                "appended": self._appended,
+                "appended_count": self._appended_count,
+            }
+            try:
+                with open(self.index_file + ".tmp", "wb") as file:
+                    pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(self.index_file + ".tmp", self.index_file)
+            except OSError as exc:
+                logger.debug("could not write games index %s: %s", self.index_file, exc)
@@ -0,0 +1,19 @@
+# Exports the scid database 'games' to games.pgn for the games database of picochess.
+# Usage: ./tcscid export_games.tcl
+
+set baseName games
+set pgnFile games.pgn
+
+if [catch {set baseNum [sc_base open -readonly $baseName]}] {
+    puts "Error: could not open database $baseName"
+    exit 1
+}
+set out [open $pgnFile w]
+set numGames [sc_base numGames $baseNum]
+for {set gameNum 1} {$gameNum <= $numGames} {incr gameNum} {
+    sc_game load $gameNum
+    puts $out [sc_game pgn]
+}
+close $out
+sc_base close $baseNum
+puts "exported $numGames games to $pgnFile"
@@ -0,0 +1,193 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+import chess  # type: ignore
+import chess.engine  # type: ignore
+import chess.polyglot  # type: ignore
+
+LOOKAHEAD = 4  # master moves analysed ahead of the game
+MULTIPV = 3  # best moves of each position, the alternatives a guess is most likely to be
+MAX_CACHE = 2000  # positions kept, least recently used ones go first
+MATE_SCORE = 99999  # as PicoTutor.get_score
+
+logger = logging.getLogger(__name__)
+
+
+class Evaluation(TypedDict):
+    """Analysis of a position, scores seen from the side to move."""
+
+    depth: int
+    best: str  # uci, empty if there is no legal move
+    score: int
+    moves: Dict[str, int]  # uci: score of the multipv best moves
+
+
+class GuessAnalyzer(object):
+    """Analysis of the positions a pgn replay reaches next, done in the background while the user thinks.
+
+    schedule() is called with the current position and the master moves to
+    come: a worker thread analyses the position after each of the next
+    lookahead moves with multipv best moves each, so the master move and the
+    top alternatives to it are evaluated before the user guesses. Evaluations
+    are cached by position (zobrist key), a guess is answered from the cache at
+    once - only a move which is no top move waits for the analysis of the
+    position after it. The engine is started with the first schedule().
+    """
+
+    def __init__(
+        self,
+        engine_path: str,
+        think_time: float = 3.0,
+        lookahead: int = LOOKAHEAD,
+        multipv: int = MULTIPV,
+        max_cache: int = MAX_CACHE,
+    ):
+        self.engine_path = engine_path
+        self.think_time = think_time  # seconds per position
+        self.lookahead = lookahead
+        self.multipv = multipv
+        self.max_cache = max_cache
+        self._cache: "OrderedDict[int, Evaluation]" = OrderedDict()
+        self._queue: List[chess.Board] = []  # positions to analyse, next one first
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[chess.engine.SimpleEngine] = None
+        self._closed = False
+        self.analysed = 0
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, board: chess.Board, moves: List[str]):
+        """Analyse board and the positions after the next lookahead of the (uci) master moves from there."""
+        boards = [board.copy(stack=False)]
+        for uci in moves[: self.lookahead]:
+            try:
+                move = chess.Move.from_uci(uci)
+            except ValueError:
+                break
+            if move not in boards[-1].legal_moves:
+                break
+            boards.append(boards[-1].copy(stack=False))
+            boards[-1].push(move)
+        with self._condition:
+            # what is left of the former schedule is not needed anymore
+            self._queue = [position for position in boards if chess.polyglot.zobrist_hash(position) not in self._cache]
+            self._condition.notify_all()
+        self._start()
+
+    def _start(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._worker, name="guess_analysis", daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        try:
+            self._engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        except (OSError, chess.engine.EngineError) as exc:
+            logger.warning("guess analysis engine %s did not start: %s", self.engine_path, exc)
+            with self._condition:
+                self._closed = True
+                self._queue = []
+                self._condition.notify_all()
+            return
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    break
+                board = self._queue.pop(0)
+            key = chess.polyglot.zobrist_hash(board)
+            if key in self._cache:
+                continue
+            try:
+                evaluation = self._analyse(board)
+            except (chess.engine.EngineError, chess.engine.EngineTerminatedError) as exc:
+                logger.warning("guess analysis failed: %s", exc)
+                with self._condition:
+                    self._closed = True
+                    self._condition.notify_all()
+                break
+            with self._condition:
+                self._cache[key] = evaluation
+                while len(self._cache) > self.max_cache:
+                    self._cache.popitem(last=False)
+                self.analysed += 1
+                self._condition.notify_all()
+        try:
+            self._engine.quit()
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError):
+            pass
+
+    def _analyse(self, board: chess.Board) -> Evaluation:
+        if board.is_game_over():
+            score = -MATE_SCORE if board.is_checkmate() else 0
+            return {"depth": 0, "best": "", "score": score, "moves": {}}
+        assert self._engine is not None  # started by the worker before it analyses
+        infos = self._engine.analyse(board, chess.engine.Limit(time=self.think_time), multipv=self.multipv)
+        moves: Dict[str, int] = {}
+        depth = 0
+        for info in infos:
+            if info.get("pv") and "score" in info:
+                moves[info["pv"][0].uci()] = info["score"].pov(board.turn).score(mate_score=MATE_SCORE)
+                depth = max(depth, info.get("depth", 0))
+        best = max(moves, key=lambda uci: moves[uci]) if moves else ""
+        return {"depth": depth, "best": best, "score": moves[best] if best else 0, "moves": moves}
+
+    def evaluation(self, board: chess.Board, wait: float = 0.0) -> Optional[Evaluation]:
+        """Cached evaluation of board, waiting up to wait seconds for the analysis if there is none yet."""
+        key = chess.polyglot.zobrist_hash(board)
+        with self._condition:
+            evaluation = self._cache.get(key)
+            if evaluation is None and wait > 0 and not self._closed:
+                if all(chess.polyglot.zobrist_hash(position) != key for position in self._queue):
+                    self._queue.insert(0, board.copy(stack=False))  # needed now, before the lookahead
+                    self._condition.notify_all()
+                    self._start()
+                self._condition.wait_for(lambda: key in self._cache or self._closed, wait)
+                evaluation = self._cache.get(key)
+            if evaluation is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return evaluation
+
+    def move_score(self, board: chess.Board, move: chess.Move, wait: float = 0.0) -> Optional[int]:
+        """Score of move in board (seen from the side playing it), None if it is not analysed (within wait)."""
+        evaluation = self.evaluation(board)
+        if evaluation is not None and move.uci() in evaluation["moves"]:
+            return evaluation["moves"][move.uci()]
+        after = board.copy(stack=False)
+        after.push(move)
+        evaluation = self.evaluation(after, wait)
+        return -evaluation["score"] if evaluation is not None else None
+
+    def compare(self, board: chess.Board, guess: chess.Move, master: chess.Move, wait: float = 0.0) -> Tuple:
+        """Scores (guess, master move) in board - how good the guess was compared to the master move."""
+        return self.move_score(board, guess, wait), self.move_score(board, master, wait)
+
+    def close(self):
+        """Stop the worker, the engine quits after its current analysis."""
+        with self._condition:
+            self._closed = True
+            self._queue = []
+            self._condition.notify_all()
+
+    def get_stats(self) -> dict:
+        return {"analysed": self.analysed, "cached": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -235,12 +235,8 @@ sudo -u pi /opt/picochess/venv/bin/pip3 install --upgrade pip
 sudo -u pi /opt/picochess/venv/bin/pip3 install --upgrade -r requirements.txt
 
 echo " ------- "
-echo "setting up picochess, obooksrv, gamesdb, and update services"
+echo "setting up picochess and update services"
 cp etc/picochess.service /etc/systemd/system/
-ln -sf /opt/picochess/obooksrv/$(uname -m)/obooksrv /opt/picochess/obooksrv/obooksrv
-cp etc/obooksrv.service /etc/systemd/system/
-ln -sf /opt/picochess/gamesdb/$(uname -m)/tcscid /opt/picochess/gamesdb/tcscid
-cp etc/gamesdb.service /etc/systemd/system/
 cp etc/picochess-update.service /etc/systemd/system/
 cp etc/run-picochess-if-flagged.sh /usr/local/bin/
 chmod +x /usr/local/bin/run-picochess-if-flagged.sh
@@ -248,10 +244,21 @@ touch /var/log/picochess-update.log /var/log/picochess-last-update
 chown root:root /var/log/picochess-*
 systemctl daemon-reload
 systemctl enable picochess.service
-systemctl enable obooksrv.service
-systemctl enable gamesdb.service
+# picochess serves the opening statistics itself (port 7777), the obooksrv binary would take that port
+systemctl disable --now obooksrv.service 2>/dev/null || true
+# picochess serves the games database itself (port 7778), the tcscid gamesdb would take that port
+systemctl disable --now gamesdb.service 2>/dev/null || true
 systemctl enable picochess-update.service
 
+echo " ------- "
+if [ ! -f /opt/picochess/gamesdb/games.pgn ]; then
+    echo "exporting the games database to gamesdb/games.pgn"
+    cd /opt/picochess/gamesdb
+    chmod +x $(uname -m)/tcscid
+    sudo -u pi ./$(uname -m)/tcscid export_games.tcl
+    cd /opt/picochess
+fi
+
 echo " ------- "
 echo "after each system update we need to rerun the cap_net rights"
 echo "giving bluetooth rights so that communication works to DGT board etc"
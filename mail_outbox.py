@@ -0,0 +1,209 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List, Optional
+
+SPOOL_DIR = "games/outbox"
+BATCH_DELAY = 30.0  # seconds a queued mail waits for more games to go with it
+RETRY_DELAY = 60.0  # seconds before the first retry of a failed delivery, doubled for each further one
+MAX_RETRY_DELAY = 3600.0
+IDLE_TIMEOUT = 60.0  # an smtp connection unused that long is closed
+
+logger = logging.getLogger(__name__)
+
+
+class MailOutbox(object):
+    """Mails of the Emailer sent by a background worker from a spool directory.
+
+    queue() only writes the mail to the spool directory, so a slow or
+    unreachable mail server does not hold up the caller and a mail survives
+    failed deliveries and restarts. The worker sends the spooled mails that
+    were queued within batch_delay seconds of each other as one mail, keeps
+    the smtp connection open for idle_timeout seconds for the next one and
+    retries failed deliveries after retry_delay seconds, doubled up to
+    max_retry_delay for every further failure.
+    """
+
+    def __init__(
+        self,
+        emailer,
+        spool_dir: str = SPOOL_DIR,
+        batch_delay: float = BATCH_DELAY,
+        retry_delay: float = RETRY_DELAY,
+        max_retry_delay: float = MAX_RETRY_DELAY,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ):
+        self.emailer = emailer  # pgn.Emailer
+        self.spool_dir = spool_dir
+        self.batch_delay = batch_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.idle_timeout = idle_timeout
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0  # deliveries failed in a row
+        self._started = 0.0  # mails spooled before the worker started are sent without batch delay
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+
+    def queue(self, subject: str, body: str, path: str) -> Optional[str]:
+        """Spool a mail with the file path attached - returns its spool file, None if mail is not configured."""
+        transports = self.emailer.transports()
+        if not transports:
+            return None
+        queued = time.time()
+        item = {"subject": subject, "body": body, "path": path, "queued": queued, "transports": transports}
+        spool_file = os.path.join(self.spool_dir, "{:d}.json".format(time.time_ns()))
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._write(spool_file, item)
+        except OSError as exc:
+            logger.error("could not spool mail %s: %s", subject, exc)
+            return None
+        self.queued += 1
+        self._wakeup.set()
+        return spool_file
+
+    @staticmethod
+    def _write(spool_file: str, item: dict):
+        with open(spool_file + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(item, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(spool_file + ".tmp", spool_file)
+
+    def start(self) -> asyncio.Task:
+        """Start the worker - it sends what is left in the spool directory right away."""
+        self._started = time.time()
+        self._task = asyncio.create_task(self._worker())
+        return self._task
+
+    async def close(self):
+        """Stop the worker, the spooled mails are sent after the next start."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await asyncio.to_thread(self.emailer.close)
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            items = await asyncio.to_thread(self._read_spool)
+            if not items:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self.emailer.close)
+                    await self._wakeup.wait()
+                continue
+            wait = items[0]["queued"] + self.batch_delay - time.time()
+            if wait > 0 and self._failures == 0 and items[0]["queued"] >= self._started:
+                # the mails queued within batch_delay of the first one go together
+                await asyncio.sleep(wait)
+                items = await asyncio.to_thread(self._read_spool)
+            if await asyncio.to_thread(self._deliver, items):
+                self._failures = 0
+            else:
+                delay = min(self.max_retry_delay, self.retry_delay * 2**self._failures)
+                self._failures += 1
+                logger.warning("mail delivery failed %d times, retry in %.0f seconds", self._failures, delay)
+                await asyncio.sleep(delay)
+
+    def _read_spool(self) -> List[dict]:
+        """The spooled mails, oldest first - each with the name of its file."""
+        items = []
+        try:
+            names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+        except OSError:
+            return []
+        for name in names:
+            spool_file = os.path.join(self.spool_dir, name)
+            try:
+                with open(spool_file, encoding="utf-8") as file:
+                    item = json.load(file)
+                if not all(key in item for key in ("subject", "body", "queued", "transports")):
+                    raise KeyError("incomplete")
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                logger.warning("broken spooled mail %s moved aside: %s", spool_file, exc)
+                try:
+                    os.replace(spool_file, spool_file + ".bad")
+                except OSError:
+                    pass
+                continue
+            item["file"] = spool_file
+            items.append(item)
+        return items
+
+    @staticmethod
+    def _batch_mail(batch: List[dict]):
+        """Subject, body and attachments of the one mail for all mails of batch."""
+        subject = batch[0]["subject"]
+        if len(batch) > 1:
+            subject = "{} ({:d} games)".format(subject, len(batch))
+        body = "\n\n".join(item["body"] for item in batch)
+        paths = []
+        for item in batch:
+            path = item.get("path")
+            if path and path not in paths and os.path.isfile(path):
+                paths.append(path)
+        return subject, body, paths
+
+    def _deliver(self, items: List[dict]) -> bool:
+        """Send items batched, one mail per transport - returns False if a delivery failed."""
+        delivered = True
+        for transport in ("mailgun", "smtp"):
+            batch = [item for item in items if transport in item["transports"]]
+            if not batch:
+                continue
+            subject, body, paths = self._batch_mail(batch)
+            try:
+                if transport == "mailgun":
+                    self.emailer.deliver_mailgun(subject, body)
+                else:
+                    self.emailer.deliver_smtp(subject, body, paths)
+            except Exception as exc:  # noqa - whatever failed, the mails stay spooled for the retry
+                logger.warning("%s delivery of %d mails failed: %s", transport, len(batch), exc)
+                self.failed += 1
+                delivered = False
+                continue
+            logger.debug("%s delivered %d mails in one", transport, len(batch))
+            self.sent += 1
+            for item in batch:
+                item["transports"].remove(transport)
+                try:
+                    if item["transports"]:
+                        self._write(item["file"], {key: value for key, value in item.items() if key != "file"})
+                    else:
+                        os.remove(item["file"])
+                except OSError as exc:
+                    logger.warning("could not update spooled mail %s: %s", item["file"], exc)
+        return delivered
+
+    def get_stats(self) -> dict:
+        """Return the outbox counters."""
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "smtp_connects": self.emailer.smtp_connects,
+        }
@@ -0,0 +1,166 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import csv
+import functools
+import logging
+import os
+import pickle
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ECO_FILE = "chess-eco_pos.txt"
+FEN_FILE = "opening_name_fen.txt"
+FEN_INDEX_VERSION = 1  # bump when the layout of the fen index file changes
+
+logger = logging.getLogger(__name__)
+
+Opening = Tuple[str, str, str]  # opening name, san moves, eco
+NO_OPENING: Opening = ("", "", "")
+
+
+def _plain_san(san: str) -> str:
+    """san without check or mate suffix - eco rows do not always write it."""
+    return san.rstrip("+#")
+
+
+class OpeningTrie(object):
+    """Eco openings as a tree of san moves.
+
+    Every node knows the longest opening whose moves lead to it or to one of its
+    parents, so following the played moves one node per move gives the opening
+    name without looking at the other openings. Moves are compared without their
+    check suffix, like the former prefix search matched "Bb4" of a played "Bb4+".
+    """
+
+    ROOT = 0
+
+    def __init__(self, rows: Iterable[dict]):
+        self._children: List[Dict[str, int]] = [{}]
+        self._parent: List[int] = [self.ROOT]
+        self._opening: List[Optional[Opening]] = [None]
+        for row in rows:
+            moves = row.get("moves") or ""
+            if not moves:
+                continue  # start position is no opening
+            node = self.ROOT
+            for san in map(_plain_san, moves.split()):
+                next_node = self._children[node].get(san)
+                if next_node is None:
+                    next_node = len(self._children)
+                    self._children[node][san] = next_node
+                    self._children.append({})
+                    self._parent.append(node)
+                    self._opening.append(None)
+                node = next_node
+            if self._opening[node] is None:  # first of equal move lists wins
+                self._opening[node] = (row.get("opening_name") or "", moves, row.get("eco") or "")
+        # parents are created before their children
+        for node in range(1, len(self._opening)):
+            if self._opening[node] is None:
+                self._opening[node] = self._opening[self._parent[node]]
+
+    def __len__(self):
+        return len(self._children) - 1
+
+    def child(self, node: int, san: str) -> Optional[int]:
+        """Node after san, None if no opening continues with san."""
+        return self._children[node].get(_plain_san(san))
+
+    def opening(self, node: int) -> Opening:
+        """Longest opening matching the moves of node."""
+        return self._opening[node] or NO_OPENING
+
+    def find(self, played: str) -> Opening:
+        """Longest opening whose moves start the space separated san moves of played."""
+        node = self.ROOT
+        for san in played.split():
+            next_node = self.child(node, san)
+            if next_node is None:
+                break
+            node = next_node
+        return self.opening(node)
+
+
+@functools.lru_cache(maxsize=None)
+def eco_openings(eco_file: str = ECO_FILE) -> OpeningTrie:
+    """Opening trie of eco_file - read once, shared by all tutors."""
+    try:
+        with open(eco_file) as fp:
+            rows = list(csv.DictReader(filter(lambda row: row[0] != "#", fp.readlines()), delimiter="|"))
+    except EnvironmentError:
+        logger.warning("could not read eco openings from %s", eco_file)
+        rows = []
+    trie = OpeningTrie(rows)
+    logger.debug("eco openings loaded: %d nodes", len(trie))
+    return trie
+
+
+def _parse_fen_openings(lines: List[str]) -> Dict[str, str]:
+    """Board fen -> name line (as read, first one wins) of the alternating fen and name lines."""
+    openings: Dict[str, str] = {}
+    for index, line in enumerate(lines[:-1]):
+        fields = line.split()
+        if fields and "/" in fields[0]:
+            openings.setdefault(fields[0], lines[index + 1])
+    return openings
+
+
+def _fen_index_file(fen_file: str) -> str:
+    return os.path.splitext(fen_file)[0] + ".idx"
+
+
+def _load_fen_index(fen_file: str, stamp: Tuple[int, int]) -> Optional[Dict[str, str]]:
+    try:
+        with open(_fen_index_file(fen_file), "rb") as file:
+            index = pickle.load(file)
+        if index["version"] != FEN_INDEX_VERSION or tuple(index["stamp"]) != stamp:
+            return None
+        return index["openings"]
+    except (OSError, EOFError, KeyError, TypeError, ValueError, pickle.UnpicklingError):
+        return None
+
+
+def _save_fen_index(fen_file: str, stamp: Tuple[int, int], openings: Dict[str, str]):
+    index_file = _fen_index_file(fen_file)
+    try:
+        with open(index_file + ".tmp", "wb") as file:
+            pickle.dump(
+                {"version": FEN_INDEX_VERSION, "stamp": stamp, "openings": openings},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(index_file + ".tmp", index_file)
+    except OSError as exc:
+        logger.debug("could not write fen opening index %s: %s", index_file, exc)
+
+
+@functools.lru_cache(maxsize=None)
+def fen_openings(fen_file: str = FEN_FILE) -> Dict[str, str]:
+    """Board fen -> opening name of fen_file - compiled once into an index file next to it, shared by all tutors."""
+    try:
+        stat = os.stat(fen_file)
+    except OSError:
+        logger.warning("could not read fen openings from %s", fen_file)
+        return {}
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    openings = _load_fen_index(fen_file, stamp)
+    if openings is None:
+        try:
+            with open(fen_file) as fp:
+                openings = _parse_fen_openings(fp.readlines())
+        except OSError:
+            logger.warning("could not read fen openings from %s", fen_file)
+            return {}
+        _save_fen_index(fen_file, stamp, openings)
+    logger.debug("fen openings loaded: %d positions", len(openings))
+    return openings
@@ -0,0 +1,227 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import time
+import urllib.parse
+from typing import Iterable, List, Optional, Tuple
+
+import chess  # type: ignore
+import chess.polyglot  # type: ignore
+
+try:
+    import numpy  # type: ignore
+
+    numpy_support = True
+except ImportError:
+    numpy_support = False
+
+OPENING_DATA = "obooksrv/opening.data"  # same file the obooksrv binary reads
+CACHE_SIZE = 4096  # positions kept in the lookup cache
+
+logger = logging.getLogger(__name__)
+
+# (uci move, white wins %, draws %, black wins %, game count)
+StatsRow = Tuple[str, int, int, int, int]
+
+
+class OpeningStats(object):
+    """Opening statistics from opening.data - replaces the obooksrv binary.
+
+    opening.data is a polyglot file where the 16 bit weight holds the white win
+    and draw percentage (high and low byte) and the 32 bit learn field holds the
+    number of games. The file is memory mapped. With numpy the keys are copied
+    once into a native array and found with searchsorted, otherwise the binary
+    search runs on the mapping. Results are kept in a LRU cache per position.
+    """
+
+    def __init__(self, data_file: str = OPENING_DATA, cache_size: int = CACHE_SIZE):
+        self.data_file = data_file
+        self.reader = chess.polyglot.open_reader(data_file)
+        self._keys = None
+        if numpy_support and len(self.reader):
+            # every second big endian 64 bit word of the 16 byte entries is a key
+            words = numpy.frombuffer(self.reader.mmap, dtype=">u8", count=len(self.reader) * 2)
+            self._keys = words[0::2].astype(numpy.uint64)
+        self._cached_rows = functools.lru_cache(maxsize=cache_size)(self._rows)
+        logger.debug("opening stats %s: %d entries, numpy %s", data_file, len(self.reader), numpy_support)
+
+    def __len__(self) -> int:
+        return len(self.reader)
+
+    def bisect_key_left(self, key: int) -> int:
+        if self._keys is None:
+            return self.reader.bisect_key_left(key)
+        return int(numpy.searchsorted(self._keys, numpy.uint64(key), side="left"))
+
+    def _rows(self, position: str) -> Tuple[StatsRow, ...]:
+        try:
+            board = chess.Board(position)
+        except ValueError:
+            return ()
+        key = chess.polyglot.zobrist_hash(board)
+        rows = []
+        size = len(self.reader)
+        i = self.bisect_key_left(key)
+        while i < size:
+            entry = self.reader[i]
+            i += 1
+            if entry.key != key:
+                break
+            move = board._from_chess960(
+                board.chess960, entry.move.from_square, entry.move.to_square, entry.move.promotion
+            )
+            if not board.is_legal(move):
+                continue
+            white_wins, draws = entry.weight >> 8, entry.weight & 0xFF
+            rows.append((move.uci(), white_wins, draws, 100 - white_wins - draws, entry.learn))
+        return tuple(rows)
+
+    def get_rows(self, fen: str) -> Tuple[StatsRow, ...]:
+        """Return the statistic rows in file order, empty for unknown positions or an invalid fen."""
+        # cache on the position part only - move counters in the fen do not matter
+        return self._cached_rows(" ".join(fen.split()[:4]))
+
+    def get_book_moves(self, fen: str) -> dict:
+        """Return the same json object as obooksrv for action=get_book_moves."""
+        return {
+            "data": [
+                {"move": move, "whitewins": white_wins, "draws": draws, "blackwins": black_wins, "count": count}
+                for move, white_wins, draws, black_wins, count in self.get_rows(fen)
+            ]
+        }
+
+    def get_stats(self) -> dict:
+        """Return lookup cache counters."""
+        info = self._cached_rows.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+    def clear_cache(self):
+        self._cached_rows.cache_clear()
+
+    def close(self):
+        self._keys = None
+        self.reader.close()
+
+
+def open_opening_stats(data_file: str = OPENING_DATA) -> Optional[OpeningStats]:
+    """Return the opening stats service or None if the data file cannot be read."""
+    try:
+        return OpeningStats(data_file)
+    except (OSError, IOError) as exc:
+        logger.warning("cannot open opening stats %s: %s", data_file, exc)
+        return None
+
+
+def benchmark(stats: OpeningStats, fens: Iterable[str], rounds: int = 3) -> dict:
+    """Time uncached and cached lookups of the given positions - returns lookups per second."""
+    fens = list(fens)
+    stats.clear_cache()
+    start = time.perf_counter()
+    for fen in fens:
+        stats.get_book_moves(fen)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for fen in fens:
+            stats.get_book_moves(fen)
+    warm = time.perf_counter() - start
+    return {
+        "positions": len(fens),
+        "cold_per_second": len(fens) / cold if cold else 0.0,
+        "cached_per_second": len(fens) * rounds / warm if warm else 0.0,
+        "numpy": stats._keys is not None,
+    }
+
+
+async def benchmark_http(url: str, fens: Iterable[str], stats: Optional[OpeningStats] = None) -> dict:
+    """Time get_book_moves queries of a running service, e.g. the obooksrv binary - returns lookups per second.
+
+    One query at a time like the web page sends them. With stats the answers are
+    compared to the ones from opening.data, "mismatches" counts the differing positions.
+    """
+    from tornado.httpclient import AsyncHTTPClient  # type: ignore
+
+    client = AsyncHTTPClient()
+    fens = list(fens)
+    answers = []
+    start = time.perf_counter()
+    for fen in fens:
+        query = urllib.parse.urlencode({"action": "get_book_moves", "fen": fen})
+        answers.append((await client.fetch(url.rstrip("/") + "/query?" + query)).body)
+    elapsed = time.perf_counter() - start
+    mismatches = 0
+    if stats is not None:
+        mismatches = sum(json.loads(body) != stats.get_book_moves(fen) for fen, body in zip(fens, answers))
+    return {
+        "positions": len(fens),
+        "per_second": len(fens) / elapsed if elapsed else 0.0,
+        "mismatches": mismatches,
+    }
+
+
+def opening_fens(stats: OpeningStats, max_plies: int = 8, max_positions: int = 2000) -> List[str]:
+    """Positions reachable through opening.data moves - breadth first, used for benchmarks."""
+    fens: List[str] = []
+    todo = [chess.STARTING_FEN]
+    seen = set()
+    while todo and len(fens) < max_positions:
+        fen = todo.pop(0)
+        board = chess.Board(fen)
+        if board.ply() > max_plies or board.epd() in seen:
+            continue
+        seen.add(board.epd())
+        fens.append(fen)
+        for row in stats.get_rows(fen):
+            board.push_uci(row[0])
+            todo.append(board.fen())
+            board.pop()
+    return fens
+
+
+async def _compare(args):
+    from explorer_cache import ExplorerCache
+    from server import WebServer
+    from tornado.httpserver import HTTPServer  # type: ignore
+    from tornado.netutil import bind_sockets  # type: ignore
+
+    stats = OpeningStats(args.data)
+    fens = opening_fens(stats, max_positions=args.positions)
+    result = benchmark(stats, fens)
+    print("%d entries, %d positions, numpy %s" % (len(stats), len(fens), result["numpy"]))
+    print("in process      uncached %8.0f/s  cached %8.0f/s" % (result["cold_per_second"], result["cached_per_second"]))
+    # the picochess service over http on a free port, the same way the web page queries it
+    sockets = bind_sockets(0, "127.0.0.1")
+    server = HTTPServer(WebServer().make_opening_app(ExplorerCache(opening_stats=stats)))
+    server.add_sockets(sockets)
+    urls = [("picochess", "http://127.0.0.1:%d" % sockets[0].getsockname()[1])]
+    urls += [(url, url) for url in args.url]
+    for name, url in urls:
+        stats.clear_cache()
+        result = await benchmark_http(url, fens, stats)
+        print("%-15s http %8.0f/s  mismatches %d" % (name, result["per_second"], result["mismatches"]))
+    server.stop()
+    stats.close()
+
+
+if __name__ == "__main__":
+    # python3 opening_stats.py --url http://localhost:7777 compares with a running obooksrv on the same opening.data
+    parser = argparse.ArgumentParser(description="benchmark the opening statistics against obooksrv")
+    parser.add_argument("--data", default=OPENING_DATA, help="opening.data file")
+    parser.add_argument("--url", action="append", default=[], help="running service to compare, e.g. obooksrv")
+    parser.add_argument("--positions", type=int, default=2000, help="number of opening positions")
+    asyncio.run(_compare(parser.parse_args()))
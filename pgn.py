@@ -28,9 +28,9 @@ from email.mime.audio import MIMEAudio
 from email.mime.base import MIMEBase
 from email.mime.image import MIMEImage
 from email.mime.text import MIMEText
-from typing import Optional
+from typing import List, Optional
 from smtplib import SMTP_SSL as SMTP
-from smtplib import SMTP
+from smtplib import SMTP, SMTPException
 from ssl import create_default_context
 
 import requests
@@ -44,6 +44,8 @@ from dgt.api import Dgt, Message
 from dgt.util import PlayMode, Mode, TimeMode
 from picotutor import PicoTutor
 
+MAIL_TIMEOUT = 60  # seconds a mail server may take to answer
+
 logger = logging.getLogger(__name__)
 
 
@@ -196,6 +198,61 @@ class ModeInfo:
         return ModeInfo.online_own_user
 
 
+def eval_comment(nag: int, value: dict, turn: chess.Color) -> str:
+    """comment of a move with the picotutor evaluations in value dict"""
+    if nag != chess.pgn.NAG_NULL:
+        comment = PicoTutor.nag_to_symbol(nag)  # back to !!, ! etc
+    else:
+        # special case inaccuracy - its not a nag, but CPL > INACCURACY_TH
+        # its the only case where there is a No-NULL evaluation
+        if "best_move" in value:
+            comment = "Best: " + value["best_move"]
+        else:
+            comment = "Inaccuracy "  # should never happen, fallback
+    if "mate" in value:
+        comment += " Mate in: " + str(value["mate"])
+    else:
+        if "score" in value:
+            score_value = value["score"]
+            if turn == chess.WHITE:
+                # always show score from white's perspective
+                # as turn is AFTER move this is now Black perspective
+                score_value = -score_value  # change to white's perspective
+            comment += " Score: " + str(score_value)
+    if "CPL" in value:
+        comment += " CPL: " + str(value["CPL"])
+    if "deep_low_diff" in value:
+        comment += " DS: " + str(value.get("deep_low_diff"))
+    if nag in (chess.pgn.NAG_BLUNDER, chess.pgn.NAG_MISTAKE, chess.pgn.NAG_DUBIOUS_MOVE):
+        if "best_move" in value:
+            comment += " Best: " + value["best_move"]
+    return comment
+
+
+def add_evaluations(game: chess.pgn.Game, eval_moves: dict) -> int:
+    """add the nags and comments of picotutor evaluations to the mainline of game - returns how many
+
+    eval_moves keys are (ply after the move, move, turn after the move) as in PicoTutor.get_eval_moves()"""
+    nodes = list(game.mainline())  # node array: nodes[i] is the node after the (i+1)th halfmove of the game
+    first_ply = game.board().ply()  # games set up from a fen do not start with ply 0
+    added = 0
+    for (halfmove_nr, user_move, turn), value in eval_moves.items():
+        index = halfmove_nr - first_ply - 1
+        if not 0 <= index < len(nodes):
+            continue  # game does not have this ply node
+        node = nodes[index]
+        pgn_move = node.move
+        if pgn_move == user_move and node.turn() == turn:  # checksum
+            nag = value["nag"]  # $N symbol for !!, ! etc
+            if nag != chess.pgn.NAG_NULL:
+                node.nags.add(nag)
+            node.comment = eval_comment(nag, value, turn)
+            added += 1
+        else:
+            logger.debug("skipped move %s-%s picotutor eval mismatch", pgn_move.uci(), user_move.uci())
+    return added
+
+
 class Emailer(object):
     """Handle eMail with subject, body and an attached file."""
 
@@ -212,32 +269,23 @@ class Emailer(object):
         self.smtp_port = None
         self.smtp_starttls = None
 
+        self.smtp_connects = 0
+        self._smtp_conn: Optional[SMTP] = None  # kept open between deliveries
+        self._mailgun_session: Optional[requests.Session] = None
+
         if email and mailgun_key:
             self.mailgun_key = base64.b64decode(str.encode(mailgun_key)).decode("utf-8")
         else:
             self.mailgun_key = False
 
-    def _use_smtp(self, subject, body, path):
-        # if self.smtp_server is not provided than don't try to send email via smtp service
-        logger.debug("SMTP Mail delivery: Started")
-        # change to smtp based mail delivery
-        # depending on encrypted mail delivery, we need to import the right lib
-        if self.smtp_encryption:
-            # lib with ssl encryption
-            logger.debug("SMTP Mail delivery: Import SSL SMTP Lib")
-        elif self.smtp_starttls:
-            logger.debug("SMTP Mail delivery: Import SSL SMTP Lib (with STARTTLS)")
-        else:
-            # lib without encryption (SMTP-port 21)
-            logger.debug("SMTP Mail delivery: Import standard SMTP Lib (no SSL encryption)")
-        conn = False
-        try:
-            outer = MIMEMultipart()
-            outer["Subject"] = subject  # put subject to mail
-            outer["From"] = "Your PicoChess computer <{}>".format(self.smtp_from)
-            outer["To"] = self.email
-            outer.attach(MIMEText(body, "plain"))  # pack the pgn to Email body
+    def _smtp_message(self, subject: str, body: str, paths: List[str]) -> MIMEMultipart:
+        outer = MIMEMultipart()
+        outer["Subject"] = subject  # put subject to mail
+        outer["From"] = "Your PicoChess computer <{}>".format(self.smtp_from)
+        outer["To"] = self.email
+        outer.attach(MIMEText(body, "plain"))  # pack the pgn to Email body
 
+        for path in paths:
             ctype, encoding = mimetypes.guess_type(path)
             if ctype is None or encoding is not None:
                 ctype = "application/octet-stream"
@@ -258,44 +306,66 @@ class Emailer(object):
                 encoders.encode_base64(msg)
             msg.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
             outer.attach(msg)
+        return outer
+
+    def _smtp_connection(self) -> SMTP:
+        """The open smtp connection if the server still answers, else a new (logged in) one."""
+        if self._smtp_conn is not None:
+            try:
+                if self._smtp_conn.noop()[0] == 250:
+                    return self._smtp_conn
+            except (SMTPException, OSError):
+                pass
+            self.close()
+        # change to smtp based mail delivery
+        if self.smtp_starttls:
+
+            # handle starttls smtp server connections
+            logger.debug(
+                "SMTP Mail delivery: trying to connect to " + self.smtp_server + " via port " + str(self.smtp_port)
+            )
+            context = create_default_context()
+            conn = SMTP(self.smtp_server, self.smtp_port, timeout=MAIL_TIMEOUT)
+            conn.set_debuglevel(1)
+            # conn.ehlo()  # Can be omitted
+            conn.starttls(context=context)
+            # conn.ehlo()  # Can be omitted
+            logger.debug("SMTP Username, password: " + self.smtp_user + ", " + "XXXXXXX")
 
-            if self.smtp_starttls:
-
-                # handle starttls smtp server connections
-                logger.debug(
-                    "SMTP Mail delivery: trying to connect to " + self.smtp_server + " via port " + str(self.smtp_port)
-                )
-                context = create_default_context()
-                conn = SMTP(self.smtp_server, self.smtp_port)
-                conn.set_debuglevel(1)
-                # conn.ehlo()  # Can be omitted
-                conn.starttls(context=context)
-                # conn.ehlo()  # Can be omitted
-                logger.debug("SMTP Username, password: " + self.smtp_user + ", " + "XXXXXXX")
-
-            else:
+        else:
 
-                logger.debug("SMTP Mail delivery: trying to connect to " + self.smtp_server)
-                conn = SMTP(self.smtp_server)  # contact smtp server
-                conn.set_debuglevel(False)  # no debug info from smtp lib
+            logger.debug("SMTP Mail delivery: trying to connect to " + self.smtp_server)
+            conn = SMTP(self.smtp_server, timeout=MAIL_TIMEOUT)  # contact smtp server
+            conn.set_debuglevel(False)  # no debug info from smtp lib
 
+        try:
             if self.smtp_user is not None and self.smtp_pass is not None:
                 logger.debug("SMTP Mail delivery: trying to log to SMTP Server")
                 conn.login(self.smtp_user, self.smtp_pass)  # login at smtp server
-
-            logger.debug("SMTP Mail delivery: trying to send email")
+        except Exception:
+            conn.close()
+            raise
+        self._smtp_conn = conn
+        self.smtp_connects += 1
+        return conn
+
+    def deliver_smtp(self, subject: str, body: str, paths: List[str]):
+        """Send the mail over the (kept open) smtp connection - raises on failure."""
+        outer = self._smtp_message(subject, body, paths)
+        conn = self._smtp_connection()
+        logger.debug("SMTP Mail delivery: trying to send email")
+        try:
             conn.sendmail(self.smtp_from, self.email, outer.as_string())
-            logger.debug("SMTP Mail delivery: successfuly delivered message to SMTP server")
-        except Exception as smtp_exc:
-            logger.error("SMTP Mail delivery: Failed")
-            logger.error("SMTP Mail delivery: " + str(smtp_exc))
-        finally:
-            if conn:
-                conn.close()
-            logger.debug("SMTP Mail delivery: Ended")
-
-    def _use_mailgun(self, subject, body):
-        out = requests.post(
+        except Exception:
+            self.close()  # do not reuse a connection in an unknown state
+            raise
+        logger.debug("SMTP Mail delivery: successfuly delivered message to SMTP server")
+
+    def deliver_mailgun(self, subject: str, body: str):
+        """Send the mail with the mailgun api over a kept alive session - raises on failure."""
+        if self._mailgun_session is None:
+            self._mailgun_session = requests.Session()
+        out = self._mailgun_session.post(
             "https://api.mailgun.net/v3/picochess.org/messages",
             auth=("api", self.mailgun_key),
             data={
@@ -304,8 +374,40 @@ class Emailer(object):
                 "subject": subject,
                 "text": body,
             },
+            timeout=MAIL_TIMEOUT,
         )
         logger.debug(out)
+        out.raise_for_status()
+
+    def close(self):
+        """Close the kept open smtp connection and mailgun session."""
+        if self._smtp_conn is not None:
+            try:
+                self._smtp_conn.quit()
+            except (SMTPException, OSError):
+                self._smtp_conn.close()
+            self._smtp_conn = None
+        if self._mailgun_session is not None:
+            self._mailgun_session.close()
+            self._mailgun_session = None
+
+    def _use_smtp(self, subject, body, path):
+        # if self.smtp_server is not provided than don't try to send email via smtp service
+        logger.debug("SMTP Mail delivery: Started")
+        try:
+            self.deliver_smtp(subject, body, [path])
+        except Exception as smtp_exc:
+            logger.error("SMTP Mail delivery: Failed")
+            logger.error("SMTP Mail delivery: " + str(smtp_exc))
+        finally:
+            self.close()
+            logger.debug("SMTP Mail delivery: Ended")
+
+    def _use_mailgun(self, subject, body):
+        try:
+            self.deliver_mailgun(subject, body)
+        except requests.RequestException as mailgun_exc:
+            logger.error("Mailgun delivery failed: %s", mailgun_exc)
 
     def set_smtp(self, sserver=None, sencryption=None, suser=None, spass=None, sfrom=None, sport=None, sstarttls=None):
         """Store information for SMTP based mail delivery."""
@@ -317,6 +419,12 @@ class Emailer(object):
         self.smtp_port = sport
         self.smtp_starttls = sstarttls
 
+    def transports(self) -> List[str]:
+        """The configured ways to deliver a mail: mailgun and/or smtp."""
+        if not self.email:
+            return []
+        return [transport for transport, used in (("mailgun", self.mailgun_key), ("smtp", self.smtp_server)) if used]
+
     def send(self, subject: str, body: str, path: str):
         """Send the email out."""
         if self.email:  # check if email address to send the pgn to is provided
@@ -352,12 +460,32 @@ class PgnDisplay(DisplayMsg):
         self.startime = datetime.datetime.now().strftime("%H:%M:%S")
         self.last_saved_game = None
         self.picotutor: PicoTutor | None = None
+        self.games_index = None  # GamesIndex of the web server, updated after a game was appended
+        self.pgn_library = None  # PgnLibrary of the games folder, updated after a game was appended
+        self.game_journal = None  # GameJournal of the game being played, told when it ended
+        self.mail_outbox = None  # MailOutbox sending the saved games in the background
         self.shared = shared  # shared headers needed in generate_pgn_from_message
 
     def set_picotutor(self, picotutor: PicoTutor):
         """Assign a reference to the picotutor object."""
         self.picotutor = picotutor
 
+    def set_games_index(self, games_index):
+        """Assign the games index which has to learn about newly saved games."""
+        self.games_index = games_index
+
+    def set_pgn_library(self, pgn_library):
+        """Assign the games folder library whose index of file_name is extended after each saved game."""
+        self.pgn_library = pgn_library
+
+    def set_mail_outbox(self, mail_outbox):
+        """Assign the outbox which sends the mails instead of the emailer itself."""
+        self.mail_outbox = mail_outbox
+
+    def set_game_journal(self, game_journal):
+        """Assign the game journal which has to learn about the end of the game."""
+        self.game_journal = game_journal
+
     def _pgn_game_from_message(self, message) -> chess.pgn.Game:
         """common routine for pgn creators to create a savable game
         wraps the two _generate_pgn_from... functions"""
@@ -505,61 +633,11 @@ class PgnDisplay(DisplayMsg):
 
         return pgn_game
 
-    def get_node_at_halfmove_nr(self, game: chess.Board, halfmove_nr: int) -> Optional[chess.pgn.GameNode]:
-        """get the node halfmove_nr (ply) in the game tree - 0 is like 1. e4"""
-        nodes = list(game.mainline())
-        if halfmove_nr - 1 < len(nodes):
-            return nodes[halfmove_nr - 1]  # first halfmove index zero
-        else:
-            return None
-
-    def add_picotutor_evaluation(self, game: chess.Board):
+    def add_picotutor_evaluation(self, game: chess.pgn.Game):
         """add picotutor evaluations to the game"""
         # see if we have an evaluation in picotutor
         if self.picotutor:
-            eval_moves = self.picotutor.get_eval_moves()
-            for (halfmove_nr, user_move, turn), value in eval_moves.items():
-                # key=(ply halfmove number, move)
-                node = self.get_node_at_halfmove_nr(game, halfmove_nr)
-                if node:  # game has this ply node
-                    pgn_move = node.move
-                    if pgn_move == user_move and node.turn() == turn:  # checksum
-                        nag = value["nag"]  # $N symbol for !!, ! etc
-                        if nag != chess.pgn.NAG_NULL:
-                            node.nags.add(nag)
-                        node.comment = self._get_picotutor_eval_comments(nag, value, turn)
-                    else:
-                        logger.debug("skipped move %s-%s picotutor eval mismatch", pgn_move.uci(), user_move.uci())
-
-    def _get_picotutor_eval_comments(self, nag: int, value: dict, turn: chess.Color) -> str:
-        """get comments found in picotutor evaluations value dict"""
-        if nag != chess.pgn.NAG_NULL:
-            comment = PicoTutor.nag_to_symbol(nag)  # back to !!, ! etc
-        else:
-            # special case inaccuracy - its not a nag, but CPL > INACCURACY_TH
-            # its the only case where there is a No-NULL evaluation
-            if "best_move" in value:
-                comment = "Best: " + value["best_move"]
-            else:
-                comment = "Inaccuracy "  # should never happen, fallback
-        if "mate" in value:
-            comment += " Mate in: " + str(value["mate"])
-        else:
-            if "score" in value:
-                score_value = value["score"]
-                if turn == chess.WHITE:
-                    # always show score from white's perspective
-                    # as turn is AFTER move this is now Black perspective
-                    score_value = -score_value  # change to white's perspective
-                comment += " Score: " + str(score_value)
-        if "CPL" in value:
-            comment += " CPL: " + str(value["CPL"])
-        if "deep_low_diff" in value:
-            comment += " DS: " + str(value.get("deep_low_diff"))
-        if nag in (chess.pgn.NAG_BLUNDER, chess.pgn.NAG_MISTAKE, chess.pgn.NAG_DUBIOUS_MOVE):
-            if "best_move" in value:
-                comment += " Best: " + value["best_move"]
-        return comment
+            add_evaluations(game, self.picotutor.get_eval_moves())
 
     def _save_and_email_pgn(self, message):
         """when game ends the pgn file is saved and emailed"""
@@ -591,8 +669,15 @@ class PgnDisplay(DisplayMsg):
         with open(self.file_name, "a") as file:
             exporter = chess.pgn.FileExporter(file)
             pgn_game.accept(exporter)
+        if self.games_index is not None:
+            self.loop.run_in_executor(None, self.games_index.update, self.file_name)
+        if self.pgn_library is not None:
+            self.loop.run_in_executor(None, self.pgn_library.update, self.file_name)
 
-        self.emailer.send("Game PGN", str(pgn_game), self.file_name)
+        if self.mail_outbox is not None:
+            self.mail_outbox.queue("Game PGN", str(pgn_game), self.file_name)
+        else:
+            self.emailer.send("Game PGN", str(pgn_game), self.file_name)
 
     def _save_pgn(self, message):
         l_file_name = "games" + os.sep + message.pgn_filename
@@ -710,6 +795,8 @@ class PgnDisplay(DisplayMsg):
             self.old_engine_elo = self.engine_elo
 
         elif isinstance(message, Message.GAME_ENDS):
+            if self.game_journal is not None:
+                self.game_journal.end(message.game, message.tc_init, ModeInfo.get_game_ending())
             if message.game.move_stack and not ModeInfo.get_pgn_mode() and self.mode != Mode.PONDER:
                 # we do not have pgn_filename in GAME_ENDS as we have in SAVE_GAME message
                 self._save_and_email_pgn(message)
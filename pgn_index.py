@@ -0,0 +1,330 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import logging
+import os
+import pickle
+import random
+import re
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import chess.pgn  # type: ignore
+
+from games_index import PgnGameSplitter, iter_pgn_games
+
+INDEX_VERSION = 2  # bump when the layout of the index file changes
+INDEX_SUFFIX = ".idx"  # the index of games/x.pgn is games/x.pgn.idx
+GAMES_DIR = "games"
+PAGE_SIZE = 20  # games per page of the library listing
+TAIL_SIZE = 64  # bytes before the indexed end compared to tell an appended file from a rewritten one
+KEY_TAGS = ("Event", "Site", "Date", "Round", "White", "Black", "Result", "WhiteElo", "BlackElo", "ECO", "FEN")
+
+# comments, variations (innermost first), move numbers, nags and results are no plies
+_COMMENT_REGEX = re.compile(r"\{[^}]*\}|;[^\n]*")
+_VARIATION_REGEX = re.compile(r"\([^()]*\)")
+_NO_PLY_REGEX = re.compile(r"^(\d*\.+|\$\d+|1-0|0-1|1/2-1/2|\*|[!?]+)$")
+
+logger = logging.getLogger(__name__)
+
+
+def read_tags(text: str) -> Dict[str, str]:
+    """Key headers of one pgn game text and its PlyCount - the moves are counted, not parsed."""
+    headers: Dict[str, str] = {}
+    lines = text.splitlines()
+    for line_no, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith("%"):
+            continue
+        if not line.startswith("["):
+            if "PlyCount" not in headers:
+                headers["PlyCount"] = str(count_plies("\n".join(lines[line_no:])))
+            break
+        match = chess.pgn.TAG_REGEX.match(line)
+        if match and (match.group(1) in KEY_TAGS or match.group(1) == "PlyCount"):
+            headers[match.group(1)] = match.group(2).replace("\\\\", "\\").replace('\\"', '"')
+    headers.setdefault("PlyCount", "0")
+    return headers
+
+
+def count_plies(movetext: str) -> int:
+    """Number of mainline moves of a pgn movetext."""
+    movetext = _COMMENT_REGEX.sub(" ", movetext)
+    while True:
+        stripped = _VARIATION_REGEX.sub(" ", movetext)
+        if stripped == movetext:
+            break
+        movetext = stripped
+    return sum(1 for token in movetext.replace(".", ". ").split() if not _NO_PLY_REGEX.match(token))
+
+
+class PgnIndex(object):
+    """Byte offset and headers of every game in one pgn file.
+
+    The index is built by scanning the tag lines once and kept in a sidecar
+    file next to the pgn file (x.pgn.idx), stamped with size and mtime of the
+    pgn file. A grown file whose indexed part is unchanged (same bytes before
+    the old end) is scanned from where the index stopped - games.pgn only ever
+    gets games appended - any other change rebuilds the index. Games are parsed
+    on demand by read_game(), so opening a collection of many games costs a
+    scan and no game parsing.
+    """
+
+    def __init__(self, pgn_file: str, index_file: Optional[str] = None, refresh: bool = True):
+        self.pgn_file = pgn_file
+        self.index_file = index_file or pgn_file + INDEX_SUFFIX
+        self._lock = threading.RLock()
+        self._stamp: Tuple[int, int] = (0, 0)
+        self._tail = b""  # last bytes of the indexed part
+        self._offsets = array("Q")
+        self._headers: List[Dict[str, str]] = []
+        if refresh:
+            self.refresh()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(self.pgn_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    def refresh(self) -> bool:
+        """Load or rebuild the index if the pgn file changed - returns True if it did.
+
+        Raises OSError if the pgn file cannot be read.
+        """
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return False
+            if self._stamp == (0, 0) and self._load_index(stamp) and self._stamp == stamp:
+                return True
+            if 0 < self._stamp[0] < stamp[0] and self._read_tail(self._stamp[0]) == self._tail:
+                self._scan(self._stamp[0], stamp)
+            else:
+                self._offsets, self._headers = array("Q"), []
+                self._scan(0, stamp)
+            self._save_index()
+            return True
+
+    def _scan(self, start: int, stamp: Tuple[int, int]):
+        """Add the games from byte offset start on."""
+        games = 0
+        with open(self.pgn_file, "rb") as file:
+            for offset, text in iter_pgn_games(file, start):
+                self._offsets.append(offset)
+                self._headers.append(read_tags(text))
+                games += 1
+        self._stamp, self._tail = stamp, self._read_tail(stamp[0])
+        logger.debug("indexed %d games of %s from offset %d", games, self.pgn_file, start)
+
+    def _read_tail(self, end: int) -> bytes:
+        with open(self.pgn_file, "rb") as file:
+            file.seek(max(0, end - TAIL_SIZE))
+            return file.read(min(end, TAIL_SIZE))
+
+    def _load_index(self, stamp: Tuple[int, int]) -> bool:
+        try:
+            with open(self.index_file, "rb") as file:
+                index = pickle.load(file)
+            size, mtime = index["stamp"]
+            if index["version"] != INDEX_VERSION or size > stamp[0] or (size == stamp[0] and mtime != stamp[1]):
+                return False  # the tail check in refresh() tells if a grown file was only appended
+            self._stamp, self._tail = tuple(index["stamp"]), index["tail"]
+            self._offsets, self._headers = index["offsets"], index["headers"]
+        except (OSError, EOFError, KeyError, TypeError, ValueError, pickle.UnpicklingError):
+            return False
+        return True
+
+    def _save_index(self):
+        index = {
+            "version": INDEX_VERSION,
+            "stamp": self._stamp,
+            "tail": self._tail,
+            "offsets": self._offsets,
+            "headers": self._headers,
+        }
+        try:
+            with open(self.index_file + ".tmp", "wb") as file:
+                pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.index_file + ".tmp", self.index_file)
+        except OSError as exc:
+            logger.debug("could not write pgn index %s: %s", self.index_file, exc)
+
+    def headers(self, game_no: int) -> Dict[str, str]:
+        """Key headers and PlyCount of game number game_no."""
+        return self._headers[game_no]
+
+    def page(self, page: int, page_size: int = PAGE_SIZE, query: str = "") -> dict:
+        """Headers of the games on page (0 = first), only games with query in players, event or eco."""
+        with self._lock:
+            games: Sequence[int]
+            if query:
+                query = query.lower()
+                games = [
+                    game_no
+                    for game_no, headers in enumerate(self._headers)
+                    if any(query in headers.get(tag, "").lower() for tag in ("White", "Black", "Event", "ECO"))
+                ]
+            else:
+                games = range(len(self._headers))
+            pages = max(1, (len(games) + page_size - 1) // page_size)
+            page = min(max(0, page), pages - 1)
+            return {
+                "page": page,
+                "pages": pages,
+                "total": len(games),
+                "games": [
+                    dict(self._headers[game_no], index=game_no)
+                    for game_no in games[page * page_size : (page + 1) * page_size]
+                ],
+            }
+
+    def read_game(self, game_no: int) -> Optional[chess.pgn.Game]:
+        """Parse game number game_no (0 = first game of the file) - one seek, whatever the number."""
+        try:
+            with open(self.pgn_file, "rb") as file:
+                for _, text in iter_pgn_games(file, self._offsets[game_no]):
+                    return chess.pgn.read_game(io.StringIO(text))
+        except (OSError, ValueError) as exc:
+            logger.warning("cannot read game %d from %s: %s", game_no, self.pgn_file, exc)
+        return None
+
+
+class PgnIndexBuilder(object):
+    """Index of a pgn file built from its data while it is written, e.g. an upload arriving in chunks.
+
+    feed() gets the same bytes as the file, so the games are indexed as they
+    arrive and the file does not have to be scanned again once it is complete.
+    """
+
+    def __init__(self, pgn_file: str):
+        self.pgn_file = pgn_file  # where the data ends up, the index is made for it
+        self._splitter = PgnGameSplitter()
+        self._offsets = array("Q")
+        self._headers: List[Dict[str, str]] = []
+        self._tail = b""
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _add(self, games: List[Tuple[int, str]]):
+        for offset, text in games:
+            self._offsets.append(offset)
+            self._headers.append(read_tags(text))
+
+    def feed(self, data: bytes):
+        self._add(self._splitter.feed(data))
+        self._tail = (self._tail + data)[-TAIL_SIZE:]
+
+    def close(self) -> int:
+        """All data was fed - returns the number of games."""
+        self._add(self._splitter.close())
+        return len(self._offsets)
+
+    def finish(self) -> PgnIndex:
+        """Index of the complete pgn_file - saved next to it, with its size and mtime from now."""
+        self.close()
+        index = PgnIndex(self.pgn_file, refresh=False)
+        with index._lock:
+            index._offsets, index._headers, index._tail = self._offsets, self._headers, self._tail
+            index._stamp = index._file_stamp()
+            index._save_index()
+        return index
+
+
+class PgnLibrary(object):
+    """The pgn files of the games folder, each with its PgnIndex - for browsing them on the web page and the clock."""
+
+    def __init__(self, directory: str = GAMES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, PgnIndex] = {}
+
+    def files(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.lower().endswith(".pgn"))
+        except OSError:
+            return []
+
+    def index(self, name: str) -> Optional[PgnIndex]:
+        """Up to date index of the pgn file name in the games folder, None if there is no such file."""
+        if os.path.basename(name) != name or not name.lower().endswith(".pgn"):
+            return None  # no paths outside of the games folder
+        with self._lock:
+            index = self._indexes.get(name)
+            try:
+                if index is None:
+                    index = self._indexes[name] = PgnIndex(os.path.join(self.directory, name))
+                else:
+                    index.refresh()
+            except OSError:
+                self._indexes.pop(name, None)
+                return None
+        return index
+
+    def add(self, name: str, index: PgnIndex):
+        """Use index for the pgn file name in the games folder - built while the file was written."""
+        with self._lock:
+            self._indexes[name] = index
+
+    def update(self, path: str):
+        """Index the games appended to path, if it is a (known) file of the library."""
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory):
+            self.index(os.path.basename(path))
+
+    def page(self, name: str, page: int, page_size: int = PAGE_SIZE, query: str = "") -> dict:
+        index = self.index(name)
+        result = index.page(page, page_size, query) if index else {"page": 0, "pages": 1, "total": 0, "games": []}
+        result["file"] = name
+        return result
+
+    def read_game(self, name: str, game_no: int) -> Optional[chess.pgn.Game]:
+        index = self.index(name)
+        if index is None or not 0 <= game_no < len(index):
+            return None
+        return index.read_game(game_no)
+
+
+class GameSequence(object):
+    """Game numbers in random, forward or backward order - every game once per round."""
+
+    def __init__(self, count: int, sequence: str = "random"):
+        self.count = count
+        self.sequence = sequence  # random for unknown values
+        self._remaining = 0
+        self._random_games = array("I")  # games left in this round, random only
+
+    def __len__(self) -> int:
+        return self._remaining
+
+    def next(self) -> int:
+        """Number of the next game, a new round starts when all games were played."""
+        if self._remaining == 0:
+            self._remaining = self.count
+            if self.sequence not in ("forward", "backward"):
+                self._random_games = array("I", range(self.count))
+        if self._remaining == 0:
+            raise IndexError("no games")
+        self._remaining -= 1
+        if self.sequence == "forward":
+            return self.count - self._remaining - 1
+        if self.sequence == "backward":
+            return self._remaining
+        # swap a random one of the remaining games to the end and take it from there
+        pick = random.randrange(len(self._random_games))
+        games = self._random_games
+        games[pick], games[-1] = games[-1], games[pick]
+        return games.pop()
@@ -34,7 +34,6 @@ import math
 from typing import Any, List, Optional, Set, Tuple
 import asyncio
 from pathlib import Path
-import platform
 
 import paramiko
 import chess.pgn
@@ -46,8 +45,10 @@ from chess.engine import InfoDict, Limit, BestMove, PlayResult
 import dgt.util
 
 from configuration import Configuration
-from uci.engine import UciShell, UciEngine
+from uci.engine import ONLINE_PREFIX, UciShell, UciEngine
 from uci.engine_provider import EngineProvider
+from uci.protocol import ThrottledUciProtocol
+from uci.speculation import Speculation, MAX_SEARCH_TIME
 from uci.rating import Rating, determine_result
 
 from timecontrol import TimeControl
@@ -89,6 +90,15 @@ from eboard.chessnut.board import ChessnutBoard
 from eboard.ichessone.board import IChessOneBoard
 from eboard.certabo.board import CertaboBoard
 from picotutor import PicoTutor
+from book_service import BookService
+from tablebase import open_tablebase_service
+from opening_stats import open_opening_stats
+from games_index import GamesIndex
+from pgn_index import PgnLibrary
+from game_journal import GameJournal, JournalGame, read_unfinished_game
+from mail_outbox import MailOutbox
+from explorer_cache import ExplorerCache
+from engine_channel import EngineChannel, read_state_file, ONLINE_GAME, PGN_GAME_INFO, PGN_GAME_INFO_FILE
 
 FLOAT_MIN_BACKGROUND_TIME = 1.5  # dont update analysis more often than this
 # Limit analysis of engine
@@ -98,8 +108,6 @@ FLOAT_MAX_ANALYSIS_DEPTH = 28  # the famous limit of deep blue?
 # Dont make the following large as it will block engine play go
 FLOAT_MAX_ANALYSE_TIME = 0.1  # asking for hint while not pondering
 
-ONLINE_PREFIX = "Online"
-
 logger = logging.getLogger(__name__)
 
 
@@ -108,6 +116,11 @@ class AlternativeMover:
 
     def __init__(self):
         self._excludedmoves = set()
+        # book replies to the legal user moves, looked up while the user thinks
+        self._book_replies: dict = {}  # zobrist hash after user move -> BestMove or None
+        self._book_replies_key = None  # (bookreader, zobrist hash before user move) of the running lookup
+        self._book_task: Optional[asyncio.Task] = None
+        self.book_reply_hits = 0
 
     def all(self, game: chess.Board) -> Set[chess.Move]:
         """Get all remaining legal moves from game position."""
@@ -119,6 +132,16 @@ class AlternativeMover:
 
     def book(self, bookreader: chess.polyglot.MemoryMappedReader, game_copy: chess.Board):
         """Get a BookMove or None from game position."""
+        if self._book_replies and not self._excludedmoves and self._book_replies_key[0] is bookreader:
+            key = chess.polyglot.zobrist_hash(game_copy)
+            if key in self._book_replies:
+                book_res = self._book_replies.pop(key)
+                self._book_replies.clear()  # the other replies belong to moves not played
+                self.book_reply_hits += 1
+                if book_res is not None:
+                    self.exclude(book_res.move)
+                    game_copy.push(book_res.move)
+                return book_res
         try:
             choice = bookreader.weighted_choice(game_copy, exclude_moves=self._excludedmoves)
         except IndexError:
@@ -134,6 +157,32 @@ class AlternativeMover:
             book_ponder = None
         return BestMove(book_move, book_ponder)
 
+    @staticmethod
+    def book_replies(bookreader: chess.polyglot.MemoryMappedReader, game: chess.Board) -> dict:
+        """Get the book reply (BestMove or None) for every legal move of game, keyed by the zobrist hash after it."""
+        replies = {}
+        board = game.copy()
+        for move in list(board.legal_moves):
+            board.push(move)
+            replies[chess.polyglot.zobrist_hash(board)] = AlternativeMover().book(bookreader, board.copy())
+            board.pop()
+        return replies
+
+    def prepare_book(self, bookreader: chess.polyglot.MemoryMappedReader, game: chess.Board):
+        """Start looking up the book replies for all user moves of game in a worker thread."""
+        self._book_replies = {}
+        self._book_replies_key = (bookreader, chess.polyglot.zobrist_hash(game))
+        self._book_task = asyncio.create_task(self._prepare_book(self._book_replies_key, game.copy()))
+
+    async def _prepare_book(self, replies_key: tuple, game: chess.Board):
+        try:
+            replies = await asyncio.to_thread(self.book_replies, replies_key[0], game)
+        except Exception as exc:  # noqa - book closed or changed meanwhile, think() asks the book itself
+            logger.debug("book reply lookup failed: %s", exc)
+            return
+        if self._book_replies_key is replies_key:  # user still thinking on the same position
+            self._book_replies = replies
+
     def check_book(self, bookreader, game_copy: chess.Board) -> bool:
         """Checks if a BookMove exists in current game position."""
         try:
@@ -156,6 +205,11 @@ class AlternativeMover:
         """Reset the exclude move list."""
         self._excludedmoves.clear()
 
+    def reset_book_replies(self) -> None:
+        """Forget the book replies looked up in advance, e.g. after a book change."""
+        self._book_replies = {}
+        self._book_replies_key = None
+
 
 class PicochessState:
     """Class to keep track of state in Picochess."""
@@ -190,6 +244,8 @@ class PicochessState:
         self.flag_startup = False
         self.game = None or chess.Board()
         self.game_declared = False  # User declared resignation or draw
+        self.game_journal = GameJournal()  # append-only journal of the game being played
+        self.engine_channel = EngineChannel()  # state pushed by the pgn and online engines
         self.interaction_mode = Mode.NORMAL
         self.last_legal_fens: List[Any] = []
         self.last_move = None
@@ -203,6 +259,7 @@ class PicochessState:
         self.online_decrement = 0
         self.pb_move = chess.Move.null()  # Best ponder move
         self.pgn_book_test = False
+        self.pgn_library = PgnLibrary()  # offset and header index of each pgn file in the games folder
         self.picotutor: PicoTutor | None = None
         self.play_mode = PlayMode.USER_WHITE
         self.position_mode = False
@@ -454,15 +511,12 @@ def log_pgn(state: PicochessState):
     logger.debug("molli pgn: no_guess_black: %s", state.no_guess_black)
 
 
-def read_pgn_info():
-    info = {}
-    arch = platform.machine()
-    pgn_info_path = "/opt/picochess/engines/" + arch + "/extra/pgn_game_info.txt"
+def read_pgn_info(channel: Optional[EngineChannel] = None):
+    """Info of the game the pgn engine replays - as pushed on the engine channel, else from its info file."""
+    info = channel.get(PGN_GAME_INFO) if channel else None
+    if info is None:
+        info = read_state_file(PGN_GAME_INFO_FILE) or {}
     try:
-        with open(pgn_info_path) as info_file:
-            for line in info_file:
-                name, value = line.partition("=")[::2]
-                info[name.strip()] = value.strip()
         return (
             info["PGN_GAME"],
             info["PGN_PROBLEM"],
@@ -471,15 +525,19 @@ def read_pgn_info():
             info["PGN_White"],
             info["PGN_Black"],
         )
-    except (OSError, KeyError):
+    except KeyError:
         logger.error("Could not read pgn_game_info file")
         return "Game Error", "", "", "*", "", ""
 
 
-def read_online_result():
+def read_online_result(channel: Optional[EngineChannel] = None):
     result_line = ""
     winner = ""
 
+    state = channel.get(ONLINE_GAME) if channel else None
+    if state is not None:
+        return state.get("GAME_RESULT", ""), state.get("WINNER", "")
+
     try:
         log_u = open("online_game.txt", "r")
     except Exception:
@@ -503,7 +561,7 @@ def read_online_result():
     return (str(result_line), str(winner))
 
 
-def read_online_user_info() -> Tuple[str, str, str, str, int, int]:
+def read_online_user_info(channel: Optional[EngineChannel] = None) -> Tuple[str, str, str, str, int, int]:
     own_user = "unknown"
     opp_user = "unknown"
     login = "failed"
@@ -511,6 +569,22 @@ def read_online_user_info() -> Tuple[str, str, str, str, int, int]:
     game_time = 0
     fischer_inc = 0
 
+    state = channel.get(ONLINE_GAME) if channel else None
+    if state is not None:
+        try:
+            game_time = int(state.get("GAME_TIME", 0))
+            fischer_inc = int(state.get("FISCHER_INC", 0))
+        except ValueError:
+            logger.error("Could not read online game state")
+        return (
+            state.get("LOGIN", login),
+            state.get("COLOR", own_color),
+            state.get("OWN_USER", own_user),
+            state.get("OPPONENT_USER", opp_user),
+            game_time,
+            fischer_inc,
+        )
+
     try:
         log_u = open("online_game.txt", "r")
         lines = log_u.readlines()
@@ -633,10 +707,13 @@ async def main() -> None:
     if unknown:
         logger.warning("invalid parameter given %s", unknown)
 
+    await state.engine_channel.start()  # before the engines, they find it in their environment
     EngineProvider.init()
+    ThrottledUciProtocol.info_interval = args.engine_info_interval
 
     Rev2Info.set_dgtpi(args.dgtpi)
     state.flag_flexible_ponder = args.flexible_analysis
+    state.game_journal.sync_interval = args.journal_sync
     state.flag_premove = args.premove
     state.set_location = args.location
     state.online_decrement = args.online_decrement
@@ -691,6 +768,10 @@ async def main() -> None:
         args.alt_move,
         state.dgttranslate,
     )
+    # the archive menu browses the games file, index it (or extend its index) in the background
+    state.dgtmenu.pgn_library = state.pgn_library
+    state.dgtmenu.pgn_file = args.pgn_file
+    main_loop.run_in_executor(None, state.pgn_library.index, args.pgn_file)
 
     dgtdispatcher = Dispatcher(state.dgtmenu, main_loop)
 
@@ -746,12 +827,14 @@ async def main() -> None:
     non_main_tasks.add(asyncio.create_task(pico_talker.message_consumer()))
 
     # Launch web server
+    games_index = None
     if args.web_server_port:
         my_web_server = WebServer()
         shared: dict = {}
         # moved starting WebDisplayt and WebVr here so that they are in same main loop
         logger.info("initializing message queues")
         my_web_display = WebDisplay(shared, main_loop)
+        my_web_display.set_engine_channel(state.engine_channel)
         non_main_tasks.add(asyncio.create_task(my_web_display.message_consumer()))
         my_web_vr = WebVr(shared, dgtboard, main_loop)
         await my_web_vr.initialize()
@@ -759,7 +842,7 @@ async def main() -> None:
         logger.info("message queues ready - starting web server")
         dgtdispatcher.register("web")
         theme: str = calc_theme(args.theme, state.set_location)
-        web_app = my_web_server.make_app(theme, shared)
+        web_app = my_web_server.make_app(theme, shared, state.pgn_library)
         try:
             web_app.listen(args.web_server_port)
         except PermissionError:
@@ -770,6 +853,31 @@ async def main() -> None:
             logger.error("Could not start web server - port %d not available", args.web_server_port)
             logger.error("is another Picochess, or other web application already running?")
             sys.exit(1)  # fatal, cannot continue without web server
+        explorer = ExplorerCache()  # opening statistics and games of the web page
+        if args.opening_stats_port:
+            opening_stats = open_opening_stats(args.opening_stats_data)
+            if opening_stats:
+                try:
+                    my_web_server.make_opening_app(explorer).listen(args.opening_stats_port)
+                    explorer.opening_stats = opening_stats
+                    logger.info("opening statistics service listening on port %d", args.opening_stats_port)
+                except OSError:
+                    # an old obooksrv may still be running - the web page keeps using that one
+                    logger.warning("opening statistics port %d not available", args.opening_stats_port)
+                    opening_stats.close()
+        if args.games_db_port:
+            try:
+                my_web_server.make_games_app(explorer).listen(args.games_db_port)
+                games_pgn_files = ["games" + os.sep + args.pgn_file]
+                games_pgn_files += [name.strip() for name in args.games_db_pgn.split(",") if name.strip()]
+                games_index = GamesIndex(games_pgn_files)
+                explorer.games_index = games_index
+                logger.info("games database listening on port %d", args.games_db_port)
+            except OSError:
+                # an old tcscid gamesdb may still be running - the web page keeps using that one
+                logger.warning("games database port %d not available", args.games_db_port)
+        if explorer.opening_stats or explorer.games_index:
+            my_web_display.set_explorer(explorer)
 
     if board_type == dgt.util.EBoard.NOEBOARD:
         logger.debug("starting PicoChess in no eboard mode")
@@ -804,6 +912,14 @@ async def main() -> None:
     )
 
     my_pgn_display = PgnDisplay("games" + os.sep + args.pgn_file, emailer, shared, main_loop)
+    if games_index is not None:
+        my_pgn_display.set_games_index(games_index)
+    my_pgn_display.set_pgn_library(state.pgn_library)
+    my_pgn_display.set_game_journal(state.game_journal)
+    if emailer.transports():
+        mail_outbox = MailOutbox(emailer, batch_delay=args.mail_batch_delay)
+        my_pgn_display.set_mail_outbox(mail_outbox)
+        non_main_tasks.add(mail_outbox.start())
     non_main_tasks.add(asyncio.create_task(my_pgn_display.message_consumer()))
 
     # Update
@@ -842,6 +958,10 @@ async def main() -> None:
             self.login = login
             self.state = state
             self.engine = None  # placeholder for UciEngine
+            # speculative engine searches while the user thinks, None if off
+            self.speculation = (
+                Speculation(args.speculate_moves, args.speculate_cpu) if args.speculate_moves > 0 else None
+            )
             self.state.fen_timer = None  # this and next line could be removed?
             self.state.fen_timer_running = False  # already set in picostate init
             self.args = args
@@ -877,8 +997,12 @@ async def main() -> None:
                 logger.warning("selected book not present, defaulting to %s", self.all_books[7]["file"])
                 self.book_index = 7
             self.state.book_in_use = self.args.book
-            self.bookreader = chess.polyglot.open_reader(self.all_books[self.book_index]["file"])
+            # all books are mapped once - switching books later just picks another reader
+            self.book_service = BookService([book["file"] for book in self.all_books])
+            self.bookreader = self.book_service.reader(self.all_books[self.book_index]["file"])
             self.state.searchmoves = AlternativeMover()
+            # syzygy tables probed in-process, None if there are none
+            self.tablebase = open_tablebase_service(args.tablebase_path, args.tablebase_pieces)
             self.state.artwork_in_use = False
             self.always_run_tutor = self.args.coach_analyser if self.args.coach_analyser else False
 
@@ -980,6 +1104,7 @@ async def main() -> None:
                         "play_mode": self.state.play_mode,
                         "books": self.all_books,
                         "book_index": self.book_index,
+                        "book_coverage": lambda: self.book_service.coverage(self.state.game),
                         "level_text": level_text,
                         "level_name": self.state.engine_level,
                         "tc_init": self.state.time_control.get_parameters(),
@@ -1039,7 +1164,9 @@ async def main() -> None:
                 i_lang=self.args.language,
                 i_always_run_tutor=self.always_run_tutor,
                 loop=self.loop,
+                i_adaptive_multipv=self.args.tutor_adaptive,
             )
+            self.state.picotutor.set_tablebase(self.tablebase)
             # @ todo first init status should be set in init above
             await self.state.picotutor.set_status(
                 self.state.dgtmenu.get_picowatcher(),
@@ -1077,11 +1204,23 @@ async def main() -> None:
             await DisplayMsg.show(msg)
             if not self.online_mode() or self.state.game.fullmove_number > 1:
                 await self.state.start_clock()
+            speculated = await self.speculation.take(self.state.game) if self.speculation is not None else None
             book_res = self.state.searchmoves.book(self.bookreader, self.state.game.copy())
+            tb_move = self._tablebase_engine_move(searchlist) if not book_res else None
             if (book_res and not self.emulation_mode() and not self.online_mode() and not self.pgn_mode()) or (
                 book_res and (self.pgn_mode() and self.state.pgn_book_test)
             ):
                 await Observable.fire(Event.BEST_MOVE(move=book_res.move, ponder=book_res.ponder, inbook=True))
+            elif tb_move is not None:
+                # solved endgame - the tablebase move is at least as good as any search
+                await Observable.fire(Event.BEST_MOVE(move=tb_move, ponder=None, inbook=False))
+                await self.send_analyse(self.tablebase.info(self.state.game), False)
+            elif speculated and self._speculated_move_ready(speculated, searchlist):
+                # fixed move time already searched while the user thought
+                info = speculated[0]
+                ponder = info["pv"][1] if len(info["pv"]) > 1 else None
+                await Observable.fire(Event.BEST_MOVE(move=info["pv"][0], ponder=ponder, inbook=False))
+                await self.send_analyse(info, False)
             else:
                 while not self.engine.is_waiting():
                     await asyncio.sleep(0.05)
@@ -1124,8 +1263,66 @@ async def main() -> None:
             self.state.automatic_takeback = False
             self.state.ignore_next_engine_move = False  # dont ignore engine move we now request
 
+        def prepare_user_turn(self):
+            """Prepare the engine reply while the user thinks."""
+            self.prepare_book_replies()
+            self.start_speculation()
+
+        def start_speculation(self):
+            """Let the idle engine search the positions after the likely user moves."""
+            if self.speculation is None or not self.engine or not self.picotutor_mode():
+                return
+            if self.emulation_mode() or self.online_mode() or self.pgn_mode():
+                return
+            if self.state.interaction_mode == Mode.NORMAL and self.state.is_user_turn():
+                movetime = self.state.time_control.uci().get("movetime")
+                max_time = float(movetime) / 1000.0 if movetime else MAX_SEARCH_TIME
+                self.speculation.start(
+                    self.engine,
+                    self.state.game,
+                    lambda: self.state.picotutor.get_predicted_moves(self.speculation.max_moves),
+                    max_time,
+                )
+
+        def prepare_book_replies(self):
+            """Look up the book replies to all user moves while the user thinks - think() then needs no lookup."""
+            if self.emulation_mode() or self.online_mode() or self.pgn_mode():
+                return  # think() does not use the book in these modes
+            if self.state.interaction_mode in (Mode.NORMAL, Mode.BRAIN, Mode.TRAINING) and self.state.is_user_turn():
+                self.state.searchmoves.prepare_book(self.bookreader, self.state.game)
+
+        def _tablebase_engine_move(self, searchlist: bool) -> chess.Move | None:
+            """Return the tablebase move for the engine if tablebase-moves is on and the position solved"""
+            if self.tablebase is None or not self.args.tablebase_moves or searchlist:
+                return None
+            if self.emulation_mode() or self.online_mode() or self.pgn_mode() or not self.engine.plays_full_strength():
+                return None  # a weakened engine would not play perfectly
+            best = self.tablebase.best_move(self.state.game)
+            if best is None:
+                return None
+            uci_dict = self.state.time_control.uci()
+            if "movetime" in uci_dict:
+                saved = float(uci_dict["movetime"]) / 1000.0
+            else:
+                side = "wtime" if self.state.game.turn == chess.WHITE else "btime"
+                saved = float(uci_dict.get(side, 0)) / 1000.0 / 40  # rough share of the clock an engine uses
+            self.tablebase.skipping("engine", True, saved)
+            return best[0]
+
+        def _speculated_move_ready(self, speculated: tuple, searchlist: bool) -> bool:
+            """True if the speculative search can be played as engine move without a new search"""
+            info, search_time = speculated
+            movetime = self.state.time_control.uci().get("movetime")
+            if searchlist or not movetime or self.emulation_mode() or self.online_mode() or self.pgn_mode():
+                return False
+            if not self.engine.plays_full_strength():
+                return False  # the pv move is not the move a weakened engine would play
+            return search_time >= float(movetime) / 1000.0 and self.state.game.is_legal(info["pv"][0])
+
         async def stop_search(self):
             """Stop current search."""
+            if self.speculation is not None:
+                await self.speculation.stop()
             self.engine.stop()
             if not self.emulation_mode():
                 while not self.engine.is_waiting():
@@ -1134,6 +1331,9 @@ async def main() -> None:
 
         async def stop_search_and_clock(self, ponder_hit=False):
             """Depending on the interaction mode stop search and clock."""
+            if self.speculation is not None:
+                # is_waiting() is True during a speculative search - it holds the engine lock nevertheless
+                await self.speculation.stop()
             if self.state.interaction_mode in (Mode.NORMAL, Mode.BRAIN, Mode.TRAINING):
                 await self.state.stop_clock()
                 if self.engine.is_waiting():
@@ -1333,6 +1533,8 @@ async def main() -> None:
                                 play_mode=self.state.play_mode, play_mode_text=self.state.dgttranslate.text(text)
                             )
                         )
+            if not self.state.done_computer_fen:
+                self.prepare_user_turn()
             if start_search:
                 if not self.engine.is_waiting():
                     logger.warning("engine not waiting")
@@ -1447,7 +1649,9 @@ async def main() -> None:
         async def switch_online(self):
             color = ""
             if self.online_mode():
-                login, own_color, own_user, opp_user, game_time, fischer_inc = read_online_user_info()
+                login, own_color, own_user, opp_user, game_time, fischer_inc = read_online_user_info(
+                    self.state.engine_channel
+                )
                 logger.debug("molli own_color in switch_online [%s]", own_color)
                 logger.debug("molli self.own_user in switch_online [%s]", own_user)
                 logger.debug("molli self.opp_user in switch_online [%s]", opp_user)
@@ -1776,6 +1980,7 @@ async def main() -> None:
                 self.state.game.push(self.state.done_move)
                 self.state.done_computer_fen = None
                 self.state.done_move = chess.Move.null()
+                self.prepare_user_turn()
 
                 if self.online_mode() or self.emulation_mode():
                     # for online or emulation engine the user time alraedy runs with move announcement
@@ -2313,7 +2518,8 @@ async def main() -> None:
             result = not (self.is_coach_analyser() and self.state.picotutor.can_use_coach_analyser())
             # and the 2nd if in analyse()
             result = result and not self.eng_plays()
-            return result
+            # tablebase answers solved endgames
+            return result and not (self.tablebase is not None and self.tablebase.probe(self.state.game) is not None)
 
         def eng_plays(self) -> bool:
             """return true if engine is playing moves based on PlayMode"""
@@ -2335,6 +2541,9 @@ async def main() -> None:
                     await self.engine.start_analysis(self.state.game, limit=limit)
                 else:
                     self.engine.stop_analysis()
+                if self.tablebase is not None:
+                    solved = self.tablebase.probe(self.state.game) is not None
+                    self.tablebase.skipping("analysis", solved and not self.eng_plays())
 
         def debug_pv_info(self, info: InfoDict):
             if info and "pv" in info and info["pv"]:
@@ -2362,9 +2571,13 @@ async def main() -> None:
                 result = await self.state.picotutor.get_analysis()  # use tutor
                 info_list: list[InfoDict] = result.get("info")
             elif not self.eng_plays():
-                # we need to analyse both sides without tutor - use engine analyser
-                result = await self.engine.get_analysis(self.state.game)
-                info_list: list[InfoDict] = result.get("info")
+                tb_info = self.tablebase.info(self.state.game) if self.tablebase is not None else None
+                if tb_info is not None:
+                    info_list = [tb_info]  # solved endgame - no engine analysis needed
+                else:
+                    # we need to analyse both sides without tutor - use engine analyser
+                    result = await self.engine.get_analysis(self.state.game)
+                    info_list: list[InfoDict] = result.get("info")
                 # @todo - the following line here should not be needed
                 # but its safer to always correct engine analyser start/stop state
                 await self._start_or_stop_analysis_as_needed()
@@ -2416,8 +2629,13 @@ async def main() -> None:
                     await DisplayMsg.show(Message.RESTORE_GAME())
                     await asyncio.sleep(2)
 
-                    l_pgn_file_name = "last_game.pgn"
-                    await self.read_pgn_file(l_pgn_file_name)
+                    journal_game = await asyncio.to_thread(read_unfinished_game, self.state.game_journal.path)
+                    if journal_game is not None:
+                        # bulk load of the journaled moves and clocks - survives a power loss mid game
+                        await self.restore_journal_game(journal_game)
+                    else:
+                        l_pgn_file_name = "last_game.pgn"
+                        await self.read_pgn_file(l_pgn_file_name)
 
                 # elif False:
                 # issue #78 - this causes crash if user analyses on DGT eboard
@@ -2560,7 +2778,7 @@ async def main() -> None:
                                 pgn_result,
                                 pgn_white,
                                 pgn_black,
-                            ) = read_pgn_info()
+                            ) = read_pgn_info(self.state.engine_channel)
 
                             update_speed = 1.0
                             if pgn_white:
@@ -2589,58 +2807,85 @@ async def main() -> None:
             self.state.newgame_happened = False
             self.state.last_error_fen = external_fen
 
-        async def read_pgn_file(self, file_name: str):
-            """Read game from PGN file"""
+        async def read_pgn_file(self, file_name: str, game_index: int = 0):
+            """Read game from PGN file - the first one or number game_index of the games folder library"""
             logger.debug("molli: read game from pgn file")
 
             l_filename = "games" + os.sep + file_name
-            try:
-                l_file_pgn = open(l_filename)
-                if not l_file_pgn:
+            l_game_pgn: Game | None
+            if game_index:
+                # one seek to the indexed game offset instead of parsing all games before it
+                l_game_pgn = await asyncio.to_thread(self.state.pgn_library.read_game, file_name, game_index)
+            else:
+                try:
+                    l_file_pgn = open(l_filename)
+                    if not l_file_pgn:
+                        return
+                except OSError:
                     return
-            except OSError:
-                return
 
-            l_game_pgn: Game | None = chess.pgn.read_game(l_file_pgn)
-            l_file_pgn.close()
+                l_game_pgn = chess.pgn.read_game(l_file_pgn)
+                l_file_pgn.close()
+            if l_game_pgn is None:
+                return
 
             logger.debug("molli: read game filename %s", l_filename)
-
+            await self.load_pgn_game(l_game_pgn, animated=self.args.pgn_animate)
+
+        async def restore_journal_game(self, journal_game: JournalGame):
+            """Continue the unfinished game of the game journal - no replay, clocks as journaled"""
+            board = journal_game.board()
+            l_game_pgn = chess.pgn.Game.from_board(board)
+            l_game_pgn.headers.update(journal_game.headers)
+            l_game_pgn.headers["Result"] = "*"
+            logger.debug("restoring journal game with %d moves", len(board.move_stack))
+            await self.load_pgn_game(l_game_pgn, tc_init=journal_game.tc_init())
+            self.state.game_journal.resume(journal_game)
+
+        async def load_pgn_game(self, l_game_pgn: Game, animated: bool = False, tc_init: dict | None = None):
+            """Set up game l_game_pgn in one go - the board is built in one pass and sent once to the displays.
+
+            Animated shows the headers one after the other and replays the last move like a user move.
+            The time control and clock times come from tc_init, else from the Pico headers of the game.
+            """
             await self.stop_search_and_clock()
+            update_speed = 1.0 if animated else 0.0
 
             # forget possible previously loaded PGN game
             self.state.picotutor.set_pgn_game_to_step(None)
             if self.picotutor_mode():
                 self.state.picotutor.newgame()
 
-            self.state.game = chess.Board()
+            self.state.game = l_game_pgn.board()
             l_move = chess.Move.null()
 
-            update_speed = 1.0
             is_pico_save_game: bool = False
             if l_game_pgn.headers["Event"]:
                 event_str = l_game_pgn.headers["Event"]
                 if (event_str or "").startswith("PicoChess"):
                     is_pico_save_game = True  # game was saved by Pico
-                await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(event_str)))
-                await asyncio.sleep(update_speed)
+                if update_speed:
+                    await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(event_str)))
+                    await asyncio.sleep(update_speed)
 
-            if l_game_pgn.headers["White"]:
-                await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(l_game_pgn.headers["White"])))
-                await asyncio.sleep(update_speed)
-
-            await DisplayMsg.show(Message.SHOW_TEXT(text_string="versus"))
-            await asyncio.sleep(update_speed)
+            if update_speed:
+                if l_game_pgn.headers["White"]:
+                    await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(l_game_pgn.headers["White"])))
+                    await asyncio.sleep(update_speed)
 
-            if l_game_pgn.headers["Black"]:
-                await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(l_game_pgn.headers["Black"])))
+                await DisplayMsg.show(Message.SHOW_TEXT(text_string="versus"))
                 await asyncio.sleep(update_speed)
 
+                if l_game_pgn.headers["Black"]:
+                    await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(l_game_pgn.headers["Black"])))
+                    await asyncio.sleep(update_speed)
+
             result_header = None
             if l_game_pgn.headers["Result"]:
                 result_header = l_game_pgn.headers["Result"]
-                await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(result_header)))
-                await asyncio.sleep(update_speed)
+                if update_speed:
+                    await DisplayMsg.show(Message.SHOW_TEXT(text_string=str(result_header)))
+                    await asyncio.sleep(update_speed)
 
             await DisplayMsg.show(Message.READ_GAME)
 
@@ -2674,11 +2919,11 @@ async def main() -> None:
                         # stop loading pgn game moves... Store them so user can step through them
                         break
 
-            # take back last move in order to send it with user_move for web publishing
+            # animated: take back last move in order to send it with user_move for web publishing
             # @ todo Pico V3 made user + engine move here = unnecessary waiting for engine move
             # Pico V4 only makes an engine move... just to update the web screen and main states?
-            # maybe there is a smarter way to do this?
-            if l_move and l_stop_at_halfmove != 0:
+            # bulk load: the whole game goes to the displays with one START_NEW_GAME below
+            if animated and l_move and l_stop_at_halfmove != 0:
                 self.state.game.pop()
 
             # issue #72 - newgame sends a ucinewgame unless stopped
@@ -2692,9 +2937,12 @@ async def main() -> None:
                 self.state.interaction_mode = Mode.KIBITZ
             # else preserve previous analysis non-playing mode
 
-            if l_move and l_stop_at_halfmove != 0:
+            if animated and l_move and l_stop_at_halfmove != 0:
                 # publish current position to webserver
                 await self.user_move(l_move, sliding=True)
+            else:
+                # one message with the whole game instead of a replayed move - no engine analysis started
+                await DisplayMsg.show(Message.START_NEW_GAME(game=self.state.game.copy(), newgame=False))
 
             if result_header and result_header == "*":
                 # issue #54 game is not finished - switch back to playing mode
@@ -2771,10 +3019,11 @@ async def main() -> None:
             except ValueError:
                 lt_black = None
 
-            # send TIME_CONTROL event based on info collected above
-            tc_init = self.state.time_control.get_parameters()
-            if lt_white and lt_black:
-                tc_init["internal_time"] = {chess.WHITE: lt_white, chess.BLACK: lt_black}
+            if tc_init is None:  # else the journaled time control and clock times are sent
+                # send TIME_CONTROL event based on info collected above
+                tc_init = self.state.time_control.get_parameters()
+                if lt_white and lt_black:
+                    tc_init["internal_time"] = {chess.WHITE: lt_white, chess.BLACK: lt_black}
             text = self.state.dgttranslate.text("N00_oktime")
             await Observable.fire(Event.SET_TIME_CONTROL(tc_init=tc_init, time_text=text, show_ok=False))
             await self.state.stop_clock()
@@ -2984,10 +3233,18 @@ async def main() -> None:
             # as we wait 5 secs before exiting we only want to prevent timer actions
             await self.stop_search()
             await self.state.stop_clock()
+            logger.info("engine crash stats: %s", self.engine.get_crash_stats())
             await self.engine.quit()
             if self.state.picotutor:
                 # close all the picotutor engines
                 await self.state.picotutor.exit_or_reboot_cleanups()
+            if self.speculation is not None:
+                logger.info("speculation stats: %s", self.speculation.get_stats())
+            if self.tablebase is not None:
+                logger.info("tablebase stats: %s", self.tablebase.get_stats())
+                self.tablebase.close()
+            self.state.game_journal.close()
+            await self.state.engine_channel.close()
 
         async def final_exit_or_reboot_cleanups(self):
             """Last cleanups before exit or reboot"""
@@ -3217,7 +3474,7 @@ async def main() -> None:
                         self.self.opp_user,
                         self.game_time,
                         self.fischer_inc,
-                    ) = read_online_user_info()
+                    ) = read_online_user_info(self.state.engine_channel)
                     logger.debug("molli online login: %s", self.login)
 
                     if "ok" not in self.login:
@@ -3387,7 +3644,7 @@ async def main() -> None:
                         pgn_result,
                         pgn_white,
                         pgn_black,
-                    ) = read_pgn_info()
+                    ) = read_pgn_info(self.state.engine_channel)
                     if "mate in" in pgn_problem or "Mate in" in pgn_problem or pgn_fen != "":
                         await self.set_fen_from_pgn(pgn_fen)
                         self.state.play_mode = (
@@ -3580,7 +3837,7 @@ async def main() -> None:
                     await self.update_elo_display()
 
                     if self.online_mode():
-                        await asyncio.sleep(0.5)
+                        await self.state.engine_channel.wait(ONLINE_GAME, 0.5)  # the online engine writes the game
                         (
                             self.login,
                             own_color,
@@ -3588,7 +3845,7 @@ async def main() -> None:
                             self.opp_user,
                             self.game_time,
                             self.fischer_inc,
-                        ) = read_online_user_info()
+                        ) = read_online_user_info(self.state.engine_channel)
                         if "no_user" in self.own_user and not self.login == "ok":
                             # user login failed check login settings!!!
                             await DisplayMsg.show(Message.ONLINE_USER_FAILED())
@@ -3619,7 +3876,7 @@ async def main() -> None:
                             pgn_result,
                             pgn_white,
                             pgn_black,
-                        ) = read_pgn_info()
+                        ) = read_pgn_info(self.state.engine_channel)
                         if "mate in" in pgn_problem or "Mate in" in pgn_problem or pgn_fen != "":
                             await self.set_fen_from_pgn(pgn_fen)
                     await self.set_wait_state(Message.START_NEW_GAME(game=self.state.game.copy(), newgame=newgame))
@@ -3674,7 +3931,7 @@ async def main() -> None:
                             self.opp_user,
                             self.game_time,
                             self.fischer_inc,
-                        ) = read_online_user_info()
+                        ) = read_online_user_info(self.state.engine_channel)
                         if "no_user" in self.own_user:
                             # user login failed check login settings!!!
                             await DisplayMsg.show(Message.ONLINE_USER_FAILED())
@@ -3715,7 +3972,7 @@ async def main() -> None:
                                 pgn_result,
                                 pgn_white,
                                 pgn_black,
-                            ) = read_pgn_info()
+                            ) = read_pgn_info(self.state.engine_channel)
                             if "mate in" in pgn_problem or "Mate in" in pgn_problem or pgn_fen != "":
                                 await self.set_fen_from_pgn(pgn_fen)
                                 await self.set_wait_state(
@@ -3752,7 +4009,7 @@ async def main() -> None:
                             pgn_result,
                             pgn_white,
                             pgn_black,
-                        ) = read_pgn_info()
+                        ) = read_pgn_info(self.state.engine_channel)
 
                         update_speed = 1.0
                         if not pgn_white:
@@ -4080,8 +4337,8 @@ async def main() -> None:
                             if self.online_mode():
                                 winner = ""
                                 result_str = ""
-                                await asyncio.sleep(0.5)
-                                result_str, winner = read_online_result()
+                                await self.state.engine_channel.wait(ONLINE_GAME, 0.5)
+                                result_str, winner = read_online_result(self.state.engine_channel)
                                 logger.debug("molli result_str:%s", result_str)
                                 logger.debug("molli winner:%s", winner)
                                 gameresult_tmp: Optional[GameResult] = None
@@ -4216,7 +4473,7 @@ async def main() -> None:
                                             pgn_result,
                                             pgn_white,
                                             pgn_black,
-                                        ) = read_pgn_info()
+                                        ) = read_pgn_info(self.state.engine_channel)
                                         await DisplayMsg.show(Message.PGN_GAME_END(result=pgn_result))
                                     elif self.state.pgn_book_test:
                                         l_game_copy = self.state.game.copy()
@@ -4363,6 +4620,7 @@ async def main() -> None:
                                 self.state.game.push(self.state.done_move)  # computer move without human assistance
                                 self.state.done_computer_fen = None
                                 self.state.done_move = chess.Move.null()
+                                self.prepare_user_turn()
 
                                 if self.online_mode() or self.emulation_mode():
                                     # for online or emulation engine the user time alraedy runs with move announcement
@@ -4535,7 +4793,8 @@ async def main() -> None:
             elif isinstance(event, Event.SET_OPENING_BOOK):
                 write_picochess_ini("book", event.book["file"])
                 logger.debug("changing opening book [%s]", event.book["file"])
-                self.bookreader = chess.polyglot.open_reader(event.book["file"])
+                self.bookreader = self.book_service.reader(event.book["file"])
+                self.state.searchmoves.reset_book_replies()
                 await DisplayMsg.show(Message.OPENING_BOOK(book_text=event.book_text, show_ok=event.show_ok))
                 self.state.book_in_use = event.book["file"]
                 self.state.stop_fen_timer()
@@ -4559,7 +4818,7 @@ async def main() -> None:
             elif isinstance(event, Event.READ_GAME):
                 if event.pgn_filename:
                     await DisplayMsg.show(Message.READ_GAME(pgn_filename=event.pgn_filename))
-                    await self.read_pgn_file(event.pgn_filename)
+                    await self.read_pgn_file(event.pgn_filename, getattr(event, "game_index", 0) or 0)
                     await self._start_or_stop_analysis_as_needed()
 
             elif isinstance(event, Event.CONTLAST):
@@ -4954,6 +5213,22 @@ async def main() -> None:
                 logger.info("event not handled : [%s]", event)
                 await asyncio.sleep(0.05)  # balance message queues
 
+            self.journal_game()
+
+        def journal_game(self):
+            """Append the moves and takebacks done since the last event to the game journal"""
+            if (
+                self.state.flag_startup  # the journal may still hold the game to restore
+                or self.state.interaction_mode not in (Mode.NORMAL, Mode.TRAINING, Mode.BRAIN)
+                or self.online_mode()
+                or self.pgn_mode()
+                or self.emulation_mode()
+            ):
+                return
+            self.state.game_journal.record(
+                self.state.game, self.state.time_control.get_parameters(), self.shared.get("headers")
+            )
+
         def exit_sigterm(self, signum, frame):
             """A handler function to register for systemctl stop signal"""
             logger.debug("Received kill signal, shutting down")
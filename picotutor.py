@@ -19,10 +19,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import csv
 import logging
 from random import randint
-from typing import Tuple
+from typing import List, Tuple
 import platform
 import asyncio
 import chess  # type: ignore
@@ -31,6 +30,7 @@ import chess.engine
 import chess.pgn
 from uci.engine import UciShell, UciEngine
 from dgt.util import PicoComment, PicoCoach
+from opening_index import eco_openings, fen_openings
 
 # PicoTutor Constants
 import picotutor_constants as c
@@ -49,6 +49,7 @@ class PicoTutor:
         i_lang="en",
         i_always_run_tutor=False,
         loop=None,
+        i_adaptive_multipv=False,
     ):
         self.user_color: chess.Color = i_player_color
         self.engine_path: str = i_engine_path
@@ -76,6 +77,7 @@ class PicoTutor:
         self.pv_best_move = {color: [] for color in [chess.WHITE, chess.BLACK]}
         self.hint_move = {color: chess.Move.null() for color in [chess.WHITE, chess.BLACK]}
         self.op = []  # used for opening book
+        self.op_nodes = []  # opening trie nodes of the op moves, shorter than op once out of book
         self.last_inside_book_moveno = 0
         # alt_best_moves are filled in eval_legal_moves()
         self.alt_best_moves = {color: [] for color in [chess.WHITE, chess.BLACK]}
@@ -103,25 +105,22 @@ class PicoTutor:
         # or if you want to analyse also engine moves (like pgn_engine)
         self.analyse_both_sides = False  # analyse only user side as default
         self.always_run_tutor = i_always_run_tutor  # force deep tutor to always run
+        # adaptive multipv: deep analysis of ADAPTIVE_ROOT_MOVES only, missed user moves are searched alone
+        self.adaptive_multipv = i_adaptive_multipv
         # new feature to be able to step through a PGN game
         self.pgn_game: chess.pgn.Game | None = None
+        self.tablebase = None  # TablebaseService - solved endgames need no engine analysis
 
-        try:
-            with open("chess-eco_pos.txt") as fp:
-                self.book_data = list(csv.DictReader(filter(lambda row: row[0] != "#", fp.readlines()), delimiter="|"))
-        except EnvironmentError:
-            self.book_data = []
-
-        try:
-            with open("opening_name_fen.txt") as fp:
-                self.book_fen_data = fp.readlines()
-        except FileNotFoundError:
-            self.book_fen_data = []
+        self.openings = eco_openings()  # shared between all tutor instances
 
         self._setup_comments(i_lang, i_comment_file)
 
         self._setup_board(i_fen)
 
+    def set_tablebase(self, tablebase):
+        """use tablebase (TablebaseService) instead of the engines in solved endgames"""
+        self.tablebase = tablebase
+
     def set_pgn_game_to_step(self, pgn_game: chess.pgn.Game):
         """store a loaded PGN game here so that it can be stepped through"""
         self.pgn_game = pgn_game  # read by picochess.py read_pgn_file()
@@ -296,15 +295,25 @@ class PicoTutor:
             self.comments = []
 
     def _find_longest_matching_opening(self, played: str) -> Tuple[str, str, str]:
-        opening_name = moves = eco = ""
-        for opening in self.book_data:
-            # if len(opening.get('moves')) > 5:
-            if played[: len(opening.get("moves"))] == opening.get("moves"):
-                if len(opening.get("moves")) > len(moves):
-                    opening_name = opening.get("opening_name")
-                    moves = opening.get("moves")
-                    eco = opening.get("eco")
-        return opening_name, moves, eco
+        return self.openings.find(played)
+
+    def _push_opening_move(self, san: str):
+        """append san to op and follow it in the opening trie"""
+        in_book = len(self.op_nodes) == len(self.op)
+        self.op.append(san)
+        if in_book:
+            node = self.openings.child(self.op_nodes[-1] if self.op_nodes else self.openings.ROOT, san)
+            if node is not None:
+                self.op_nodes.append(node)
+
+    def _pop_opening_move(self):
+        self.op.pop()
+        if len(self.op_nodes) > len(self.op):
+            self.op_nodes.pop()
+
+    def _current_opening(self) -> Tuple[str, str, str]:
+        """longest opening matching op - one lookup, no matter how many openings exist"""
+        return self.openings.opening(self.op_nodes[-1] if self.op_nodes else self.openings.ROOT)
 
     def get_opening(self) -> Tuple[str, str, str, bool]:
         # check if game started really from start position
@@ -324,9 +333,7 @@ class PicoTutor:
         if self.op == [] or diff > 2:
             return eco, opening_name, moves, inside_book_opening
 
-        played = "%s" % (" ".join(self.op))
-
-        opening_name, moves, eco = self._find_longest_matching_opening(played)
+        opening_name, moves, eco = self._current_opening()
 
         if self.expl_start_position and halfmoves <= len(moves.split()):
             inside_book_opening = True
@@ -352,15 +359,7 @@ class PicoTutor:
         if not fen:
             return "", False
 
-        index = 0
-        opening_name = ""
-
-        for line in self.book_fen_data:
-            line_list = line.split()
-            if line_list[0] == fen:
-                opening_name = self.book_fen_data[index + 1]
-                break
-            index = index + 1
+        opening_name = fen_openings().get(fen, "")  # loaded at first use, shared between all tutor instances
 
         if opening_name:
             return opening_name, True
@@ -393,6 +392,7 @@ class PicoTutor:
         self.board = game.copy()
         # opening move explorer vars
         self.op = []
+        self.op_nodes = []
         if self.board.board_fen() == chess.STARTING_BOARD_FEN:
             if not new_game:
                 logger.debug("strange - tutor position set to starting without newgame")
@@ -410,6 +410,7 @@ class PicoTutor:
             self.board = game.copy()
         self._reset_color_coded_vars()  # all has to go? analysis starts over?
         self.op = []  # unfortunatly pop is out of sync so we lose this
+        self.op_nodes = []
 
     def _reset_color_coded_vars(self):
         """reset and forget all color coded variables - needs to be done on new position"""
@@ -472,7 +473,7 @@ class PicoTutor:
         returns False if tutor board is out of sync
         and caller must set_position again"""
         try:
-            self.op.append(self.board.san(i_uci_move))  # for opening matching
+            self._push_opening_move(self.board.san(i_uci_move))  # for opening matching
         except AssertionError as e:
             logger.debug("picotutor board not in sync - move %s not legal on tutor board", e)
             return False
@@ -490,6 +491,8 @@ class PicoTutor:
             # we are analysing both sides or user just made a move, evaluate move
             try:
                 await self.eval_legal_moves(self.board.turn)  # take snapshot of current evaluation
+                if self.adaptive_multipv and self.in_best_moves(i_uci_move) is None:
+                    await self._research_user_move(i_uci_move)  # narrow analysis missed the user move
                 self.eval_user_move(i_uci_move)  # determine & save evaluation of user move
             except IndexError:
                 logger.debug("program internal error - no move pushed before evaluation attempt")
@@ -537,7 +540,7 @@ class PicoTutor:
     def _update_internal_state_after_pop(self, poped_move: chess.Move) -> bool:
         """return True if history sync with board is ok after pop"""
         try:
-            self.op.pop()
+            self._pop_opening_move()
         except IndexError:
             pass
 
@@ -600,7 +603,7 @@ class PicoTutor:
                         limit = Limit(depth=self.deep_limit_depth)
                     else:
                         limit = Limit(depth=c.DEEP_DEPTH)  # default value
-                    multipv = c.VALID_ROOT_MOVES
+                    multipv = c.ADAPTIVE_ROOT_MOVES if self.adaptive_multipv else c.VALID_ROOT_MOVES
                     await self.best_engine.start_analysis(self.board, limit=limit, multipv=multipv)
             else:
                 logger.error("best engine has terminated in picotutor?")
@@ -626,6 +629,9 @@ class PicoTutor:
     async def exit_or_reboot_cleanups(self):
         """close the tutor engines and cleanup"""
         self.stop()  # stop engines if running
+        for engine in (self.best_engine, self.obvious_engine):
+            if engine:
+                logger.info("%s crash stats: %s", engine.whoami, engine.get_crash_stats())
         if self.best_engine:
             if self.best_engine.loaded_ok():
                 await self.best_engine.quit()
@@ -639,6 +645,12 @@ class PicoTutor:
         """start or stop analyser as needed"""
         # common logic for all of tutors functions to start or stop
         # determine if tutor should run and start if it should, pause if not
+        if self.tablebase is not None:
+            solved = self.tablebase.probe(self.board) is not None
+            self.tablebase.skipping("tutor", solved and self._should_run_tutor())
+            if solved:
+                self.stop()  # tablebase knows everything - engines not needed
+                return
         if self._should_run_tutor():
             await self.start()  # normal both deep and obvious analysis
         elif self.always_run_tutor:
@@ -859,17 +871,53 @@ class PicoTutor:
                 self.obvious_moves[turn].sort(key=self.sort_score, reverse=True)
         self.log_pv_lists()  # debug only - for long debugging use True
 
+    async def _research_user_move(self, user_move: chess.Move):
+        """adaptive multipv: search only the user move (searchmoves) and add it to
+        best_info and best_moves as if the wide multipv analysis had found it"""
+        turn = self.board.turn
+        if not self.best_info[turn] or not self.best_engine or not self.best_engine.loaded_ok():
+            return  # nothing to compare with - eval_user_move approximates as before
+        board_before_usermove = self.board.copy()
+        board_before_usermove.pop()
+        depth = self.best_info[turn][0].get("depth", c.LOW_DEPTH)  # same depth as the best moves
+        limit = Limit(depth=depth, time=c.ADAPTIVE_RESEARCH_TIME)
+        info = await self.best_engine.analyse_root_moves(board_before_usermove, limit, [user_move])
+        if not info or not info.get("pv") or info["pv"][0] != user_move:
+            logger.debug("searchmoves analysis failed for user move %s", user_move.uci())
+            return
+        logger.debug("user move %s searched alone to depth %s", user_move.uci(), info.get("depth"))
+        self.best_info[turn].append(info)
+        moves = []
+        PicoTutor._eval_pv_list(turn, self.best_info[turn][-1:], moves)
+        for pv_key, move, score, mate in moves:
+            self.best_moves[turn].append((len(self.best_info[turn]) - 1, move, score, mate))
+        self.best_moves[turn].sort(key=self.sort_score, reverse=True)
+
     async def get_analysis(self) -> dict:
         """get analysis info from engine - returns dict with info and fen
         the info element is a list of InfoDict
         the fen element is board position that was analysed"""
         # failed answer is empty lists
         result = {"info": [], "fen": ""}
-        if self.best_engine:
+        tb_info = self.tablebase.info(self.board) if self.tablebase is not None else None
+        if tb_info is not None:
+            result = {"info": [tb_info], "fen": self.board.fen()}
+        elif self.best_engine:
             if self.best_engine.is_analyser_running():
                 result = await self.best_engine.get_analysis(self.board)
         return result
 
+    async def get_predicted_moves(self, max_moves: int) -> List[chess.Move]:
+        """best first moves of the running deep analysis - the moves the user will likely play"""
+        result = await self.get_analysis()
+        if result.get("fen") != self.board.fen():
+            return []
+        moves = []
+        for info in result.get("info", []):
+            if info and info.get("pv") and info["pv"][0] not in moves:
+                moves.append(info["pv"][0])
+        return moves[:max_moves]
+
     def get_user_move_eval(self) -> tuple:
         """for main program to get the evaluation of the previous move
         return (str int) which is (eval sts, moves to mate"""
@@ -880,6 +928,10 @@ class PicoTutor:
         if not (self.coach_on or self.watcher_on):
             return eval_string, 0
 
+        tb_eval = self._tablebase_move_eval()
+        if tb_eval is not None:
+            return tb_eval
+
         # all history list have tuples: (pv,move,score,mate)
         # where pv can be None if score and mate are not available
         # move is always valid, even for fake history tuples
@@ -955,6 +1007,108 @@ class PicoTutor:
             eval_string = ""
             return eval_string, 0
 
+        eval_string = PicoTutor.classify_move(
+            best_deep_diff,
+            deep_low_diff,
+            score_hist_diff,
+            legal_no,
+            approximations_in_use=approximations_in_use,
+            history_in_use=history_in_use,
+            forced_mate=best_score == 99999 and best_mate == current_mate,
+        )
+
+        # remember this evaluation for later pgn generation in PgnDisplay
+        # key to find evaluation later =(ply halfmove number: int, move: chess.Move)
+        # not always unique if we have takeback sequence with other moves
+        # should work since we evaluate all moves and remove if no evaluation
+        e_key = (self.board.ply(), current_move, self.board.turn)  # ply, turn is AFTER current_move
+        e_value = {}  # collect eval values for the move here
+        e_value["nag"] = PicoTutor.symbol_to_nag(eval_string)
+        try:
+            # board_before_usermove is where we have popped the user move above
+            e_value["best_move"] = board_before_usermove.san(best_move)
+            e_value["user_move"] = board_before_usermove.san(current_move)
+            logger.debug("best move: %s, user move: %s", e_value["best_move"], e_value["user_move"])
+        except (KeyError, ValueError, AttributeError):
+            logger.warning("picotutor failed to convert to san for %s", current_move)
+        if e_value["nag"] == chess.pgn.NAG_NULL:
+            # no NAG to store, due to takeback make sure this e_key eval is empty
+            self.evaluated_moves.pop(e_key, None)  # None prevents KeyError
+            # special case, if inaccurate move store DS, also when approximated
+            if best_deep_diff > c.INACCURACY_TH:
+                e_value["CPL"] = best_deep_diff  # lost centipawns
+                if current_pv is not None:
+                    e_value["score"] = current_score
+                self.evaluated_moves[e_key] = e_value  # ok with current_pv None (approx)
+        elif current_pv is not None:
+            # user move identified, not approximated, ok to log to PGN file
+            e_value["CPL"] = best_deep_diff  # lost centipawns
+            if current_mate != 0:
+                e_value["mate"] = current_mate
+            e_value["score"] = current_score  # eval score
+            if low_pv is not None:  # low also identified, needs both current_pv AND low
+                e_value["deep_low_diff"] = deep_low_diff  # Cambridge delta S
+            if before_score is not None:  # not approximated, need both current_pv AND history
+                e_value["score_hist_diff"] = score_hist_diff
+            self.evaluated_moves[e_key] = e_value
+
+        self.log_sync_info()  # debug only
+
+        # information return in addition:
+        # threat move / bestmove/ pv line of user and best pv line so picochess can comment on that as well
+        # or call a pico talker method with that information
+        self.hint_move[self.board.turn] = best_move
+
+        logger.debug("evaluation %s", eval_string)
+        return eval_string, current_mate
+
+    def _tablebase_move_eval(self) -> tuple | None:
+        """evaluate the last move by its tablebase result - None if the position is not solved"""
+        if self.tablebase is None or not self.board.move_stack:
+            return None
+        board_before_usermove = self.board.copy()
+        user_move = board_before_usermove.pop()
+        before = self.tablebase.probe(board_before_usermove)
+        after = self.tablebase.probe(self.board)
+        best = self.tablebase.best_move(board_before_usermove)
+        if before is None or after is None or best is None:
+            return None
+        wdl_before, wdl_after = before[0], -after[0]
+        eval_string = ""
+        if board_before_usermove.legal_moves.count() > 1 and wdl_after < wdl_before:
+            # win or draw given away is a blunder, losing only the 50 move rule race a mistake
+            if (wdl_before > 1 and wdl_after <= 1) or (wdl_before > -2 and wdl_after == -2):
+                eval_string = "??"
+            else:
+                eval_string = "?"
+        e_key = (self.board.ply(), user_move, self.board.turn)  # ply, turn is AFTER user move
+        if eval_string:
+            self.evaluated_moves[e_key] = {
+                "nag": PicoTutor.symbol_to_nag(eval_string),
+                "best_move": board_before_usermove.san(best[0]),
+                "user_move": board_before_usermove.san(user_move),
+            }
+        else:
+            self.evaluated_moves.pop(e_key, None)
+        self.hint_move[self.board.turn] = best[0]
+        logger.debug("tablebase evaluation %s for wdl %d -> %d", eval_string, wdl_before, wdl_after)
+        return eval_string, 0
+
+    @staticmethod
+    def classify_move(
+        best_deep_diff: int,
+        deep_low_diff: int,
+        score_hist_diff: int,
+        legal_no: int,
+        approximations_in_use: bool = False,
+        history_in_use: bool = True,
+        forced_mate: bool = False,
+    ) -> str:
+        """evaluation string (??, ?, ?!, !!, ! or !?) of a move from its centipawn differences
+        best_deep_diff: deep score of best move minus deep score of the move (CPL)
+        deep_low_diff: deep minus shallow score of the move
+        score_hist_diff: deep score of the move minus that of the previous move of the same side
+        forced_mate: best move and move mate in the same number of moves"""
         ###############################################################
         # 1. bad moves
         ##############################################################
@@ -987,7 +1141,7 @@ class PicoTutor:
         if not approximations_in_use:
             # very good moves
             if best_deep_diff <= c.VERY_GOOD_MOVE_TH and (deep_low_diff > c.VERY_GOOD_IMPROVE_TH):
-                if (best_score == 99999 and (best_mate == current_mate)) and legal_no <= 2:
+                if forced_mate and legal_no <= 2:
                     pass
                 else:
                     eval_string2 = "!!"
@@ -1009,50 +1163,7 @@ class PicoTutor:
             if eval_string == "":
                 eval_string = eval_string2
 
-        # remember this evaluation for later pgn generation in PgnDisplay
-        # key to find evaluation later =(ply halfmove number: int, move: chess.Move)
-        # not always unique if we have takeback sequence with other moves
-        # should work since we evaluate all moves and remove if no evaluation
-        e_key = (self.board.ply(), current_move, self.board.turn)  # ply, turn is AFTER current_move
-        e_value = {}  # collect eval values for the move here
-        e_value["nag"] = PicoTutor.symbol_to_nag(eval_string)
-        try:
-            # board_before_usermove is where we have popped the user move above
-            e_value["best_move"] = board_before_usermove.san(best_move)
-            e_value["user_move"] = board_before_usermove.san(current_move)
-            logger.debug("best move: %s, user move: %s", e_value["best_move"], e_value["user_move"])
-        except (KeyError, ValueError, AttributeError):
-            logger.warning("picotutor failed to convert to san for %s", current_move)
-        if e_value["nag"] == chess.pgn.NAG_NULL:
-            # no NAG to store, due to takeback make sure this e_key eval is empty
-            self.evaluated_moves.pop(e_key, None)  # None prevents KeyError
-            # special case, if inaccurate move store DS, also when approximated
-            if best_deep_diff > c.INACCURACY_TH:
-                e_value["CPL"] = best_deep_diff  # lost centipawns
-                if current_pv is not None:
-                    e_value["score"] = current_score
-                self.evaluated_moves[e_key] = e_value  # ok with current_pv None (approx)
-        elif current_pv is not None:
-            # user move identified, not approximated, ok to log to PGN file
-            e_value["CPL"] = best_deep_diff  # lost centipawns
-            if current_mate != 0:
-                e_value["mate"] = current_mate
-            e_value["score"] = current_score  # eval score
-            if low_pv is not None:  # low also identified, needs both current_pv AND low
-                e_value["deep_low_diff"] = deep_low_diff  # Cambridge delta S
-            if before_score is not None:  # not approximated, need both current_pv AND history
-                e_value["score_hist_diff"] = score_hist_diff
-            self.evaluated_moves[e_key] = e_value
-
-        self.log_sync_info()  # debug only
-
-        # information return in addition:
-        # threat move / bestmove/ pv line of user and best pv line so picochess can comment on that as well
-        # or call a pico talker method with that information
-        self.hint_move[self.board.turn] = best_move
-
-        logger.debug("evaluation %s", eval_string)
-        return eval_string, current_mate
+        return eval_string
 
     @staticmethod
     def symbol_to_nag(eval_string: str) -> int:
@@ -1227,6 +1338,10 @@ class PicoTutor:
 
         # in this get_pos_analysis there is no user move to pop, send opposite turn and False
         turn: chess.Color = chess.WHITE if self.board.turn == chess.BLACK else chess.BLACK
+        tb_info = self.tablebase.info(self.board) if self.tablebase is not None else None
+        if tb_info is not None and "pv" in tb_info:
+            (best_move, score, mate) = PicoTutor.get_score(tb_info)
+            return best_move, score / 100.0, mate, []
         await self.eval_legal_moves(turn, False)  # take snapshot of analysis before user move
         info: InfoDict = self.best_info[turn][0] if self.best_info[turn] else None
         if not info:
@@ -9,6 +9,9 @@ NUM_THREADS = 1  # threads for deep - 1 to save CPU, 2 to have faster analysis
 # but not so high that depth on PI 4 is as low as 5 or LOW_DEPTH
 VALID_ROOT_MOVES = 50  # number of multipv best moves
 LOW_ROOT_MOVES = 50  # number of obvious multipv root moves
+# adaptive mode: deep analysis of only the top moves, a missed user move is searched separately
+ADAPTIVE_ROOT_MOVES = 5  # number of deep multipv best moves in adaptive mode
+ADAPTIVE_RESEARCH_TIME = 3.0  # max seconds for searching a missed user move (searchmoves)
 
 VERY_BAD_MOVE_TH = 250  # difference user to best move ??
 BAD_MOVE_TH = 150  # difference user to best move ?
@@ -19,9 +19,8 @@
 import datetime
 import logging
 from collections import OrderedDict
-from typing import Set
+from typing import Optional, Set
 import asyncio
-import platform
 
 import chess  # type: ignore
 import chess.pgn as pgn  # type: ignore
@@ -39,6 +38,12 @@ from dgt.util import PlayMode, Mode, ClockSide, GameResult
 from dgt.iface import DgtIface
 from eboard.eboard import EBoard
 from pgn import ModeInfo
+from pgn_index import PAGE_SIZE, PgnLibrary
+from engine_channel import EngineChannel, read_state_file, PGN_GAME_INFO, PGN_GAME_INFO_FILE
+
+# version of the game messages (event "Fen"): the moves are sent as deltas (move, san, fen, ply),
+# the whole game (pgn) only in snapshots - on connect, resync, new game and take back
+GAME_PROTOCOL_VERSION = 2
 
 # This needs to be reworked to be session based (probably by token)
 # Otherwise multiple clients behind a NAT can all play as the 'player'
@@ -48,27 +53,24 @@ client_ips = []
 logger = logging.getLogger(__name__)
 
 
-def read_pgn_info():
+def read_pgn_info(channel: Optional[EngineChannel] = None):
+    """Info of the game the pgn engine replays - as pushed on the engine channel, else from its info file."""
+    info = channel.get(PGN_GAME_INFO) if channel else None
+    if info is None:
+        info = read_state_file(PGN_GAME_INFO_FILE)
+    if info is not None:
+        return dict(info)
+    logger.error("Could not read pgn_game_info file")
     info = {}
-    arch = platform.machine()
-    pgn_info_path = "/opt/picochess/engines/" + arch + "/extra/pgn_game_info.txt"
-    try:
-        with open(pgn_info_path) as info_file:
-            for line in info_file:
-                name, value = line.partition("=")[::2]
-                info[name.strip()] = value.strip()
-        return info
-    except (OSError, KeyError):
-        logger.error("Could not read pgn_game_info file")
-        info["PGN_GAME"] = "Game Error"
-        info["PGN_PROBLEM"] = ""
-        info["PGN_FEN"] = ""
-        info["PGN_RESULT"] = "*"
-        info["PGN_White"] = ""
-        info["PGN_Black"] = ""
-        info["PGN_White_ELO"] = ""
-        info["PGN_Black_ELO"] = ""
-        return info
+    info["PGN_GAME"] = "Game Error"
+    info["PGN_PROBLEM"] = ""
+    info["PGN_FEN"] = ""
+    info["PGN_RESULT"] = "*"
+    info["PGN_White"] = ""
+    info["PGN_Black"] = ""
+    info["PGN_White_ELO"] = ""
+    info["PGN_Black_ELO"] = ""
+    return info
 
 
 class ServerRequestHandler(tornado.web.RequestHandler):
@@ -177,7 +179,11 @@ class DGTHandler(ServerRequestHandler):
     async def get(self, *args, **kwargs):
         action = self.get_argument("action")
         if action == "get_last_move":
-            if "last_dgt_move_msg" in self.shared:
+            if "game_snapshot" in self.shared:
+                snapshot = self.shared["game_snapshot"]()
+                if snapshot:
+                    self.write(snapshot)
+            elif "last_dgt_move_msg" in self.shared:
                 self.write(self.shared["last_dgt_move_msg"])
 
 
@@ -219,12 +225,93 @@ class UploadPageHandler(tornado.web.RequestHandler):
         self.render("web/picoweb/templates/upload.html")
 
 
+class OpeningStatsHandler(tornado.web.RequestHandler):
+    """Answer the obooksrv queries of the web page (port 7777) from opening.data."""
+
+    def initialize(self, explorer=None):
+        self.explorer = explorer
+
+    def set_default_headers(self):
+        self.set_header("Access-Control-Allow-Origin", "*")  # page is served from the main web server port
+
+    async def get(self, *args, **kwargs):
+        action = self.get_argument("action", "")
+        if action == "get_book_moves":
+            self.write(await self.explorer.get_book_moves(self.get_argument("fen", chess.STARTING_FEN)))
+        elif action == "get_stats":
+            self.write(self.explorer.get_stats())
+        else:
+            self.write({"data": []})
+
+
+class GamesDbHandler(tornado.web.RequestHandler):
+    """Answer the games database queries of the web page (port 7778) from the games index."""
+
+    def initialize(self, explorer=None):
+        self.explorer = explorer
+
+    def set_default_headers(self):
+        self.set_header("Access-Control-Allow-Origin", "*")
+
+    async def get(self, *args, **kwargs):
+        action = self.get_argument("action", "")
+        if action == "get_games" and self.get_argument("fen", ""):
+            self.write(await self.explorer.get_games(self.get_argument("fen")))
+        elif action == "get_stats":
+            self.write(self.explorer.get_stats())
+        else:
+            self.write({})
+
+
+class GamesLibraryHandler(tornado.web.RequestHandler):
+    """Paged listing of the pgn files in the games folder, loading a game by its number."""
+
+    def initialize(self, library=None):
+        self.library = library
+
+    async def get(self, *args, **kwargs):
+        action = self.get_argument("action", "get_page")
+        name = self.get_argument("file", "games.pgn")
+        try:
+            if action == "get_files":
+                self.write({"files": self.library.files()})
+            elif action == "get_page":
+                page = int(self.get_argument("page", "0"))
+                page_size = min(100, max(1, int(self.get_argument("page_size", str(PAGE_SIZE)))))
+                query = self.get_argument("query", "")
+                self.write(await asyncio.to_thread(self.library.page, name, page, page_size, query))
+            elif action == "get_game":
+                game_index = int(self.get_argument("game"))
+                game = await asyncio.to_thread(self.library.read_game, name, game_index)
+                if game is None:
+                    raise tornado.web.HTTPError(404)
+                self.write({"file": name, "index": game_index, "pgn": str(game) + "\n"})
+            else:
+                raise tornado.web.HTTPError(400)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+
+    async def post(self, *args, **kwargs):
+        if self.get_argument("action", "") != "read_game":
+            raise tornado.web.HTTPError(400)
+        name = self.get_argument("file", "games.pgn")
+        try:
+            game_index = int(self.get_argument("game"))
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        index = await asyncio.to_thread(self.library.index, name)
+        if index is None or not 0 <= game_index < len(index):
+            raise tornado.web.HTTPError(404)
+        await Observable.fire(Event.READ_GAME(pgn_filename=name, game_index=game_index))
+
+
 class WebServer:
     def __init__(self):
         pass
 
-    def make_app(self, theme: str, shared: dict) -> tornado.web.Application:
+    def make_app(self, theme: str, shared: dict, library: PgnLibrary = None) -> tornado.web.Application:
         """define web pages and their handlers"""
+        library = library or PgnLibrary()
         wsgi_app = tornado.wsgi.WSGIContainer(pw)
         return tornado.web.Application(
             [
@@ -234,12 +321,21 @@ class WebServer:
                 (r"/info", InfoHandler, dict(shared=shared)),
                 (r"/help", HelpHandler, dict(theme=theme)),
                 (r"/channel", ChannelHandler, dict(shared=shared)),
-                (r"/upload-pgn", UploadHandler),
+                (r"/upload-pgn", UploadHandler, dict(library=library)),
                 (r"/upload", UploadPageHandler),
+                (r"/games", GamesLibraryHandler, dict(library=library)),
                 (r".*", tornado.web.FallbackHandler, {"fallback": wsgi_app}),
             ]
         )
 
+    def make_opening_app(self, explorer) -> tornado.web.Application:
+        """opening statistics service, same url as the former obooksrv binary"""
+        return tornado.web.Application([(r"/query", OpeningStatsHandler, dict(explorer=explorer))])
+
+    def make_games_app(self, explorer) -> tornado.web.Application:
+        """games database service, same urls as the former tcscid gamesdb server"""
+        return tornado.web.Application([(r"/.*", GamesDbHandler, dict(explorer=explorer))])
+
 
 class WebVr(DgtIface):
     """Handle the web (clock) communication."""
@@ -448,6 +544,41 @@ class WebDisplay(DisplayMsg):
         self.shared = shared
         self._task = None  # task for message consumer
         self.starttime = datetime.datetime.now().strftime("%H:%M:%S")
+        self.explorer = None  # ExplorerCache of the opening statistics and games services
+        self.engine_channel = None  # EngineChannel the pgn engine pushes its game info on
+        self._game: Optional[chess.Board] = None  # of the last game message, for snapshots
+        self._snapshot: Optional[dict] = None  # last snapshot sent, until the game or its headers change
+        self.shared["game_snapshot"] = self.game_snapshot
+
+    def set_explorer(self, explorer):
+        """Assign the explorer cache which prefetches the web page lookups after each move."""
+        self.explorer = explorer
+
+    def set_engine_channel(self, engine_channel):
+        """Assign the channel of the helper engines, the pgn game info is read from there."""
+        self.engine_channel = engine_channel
+
+    def _prefetch_explorer(self, game: chess.Board, pv: list = None):
+        if self.explorer is not None:
+            self.explorer.prefetch(game, pv)
+
+    def _export_game(self, game: chess.Board) -> str:
+        """Whole game as pgn, rebuilds the game headers."""
+        pgn_game = pgn.Game().from_board(game)
+        self._build_game_header(pgn_game)
+        self.shared["headers"] = pgn_game.headers
+        return pgn_game.accept(pgn.StringExporter(headers=True, comments=False, variations=False))
+
+    def game_snapshot(self) -> Optional[dict]:
+        """Last game message with the whole game - a (re)connecting client loads it, the moves follow as deltas."""
+        if "last_dgt_move_msg" not in self.shared:
+            return None
+        result = self.shared["last_dgt_move_msg"]
+        if "pgn" not in result and self._game is not None:
+            if self._snapshot is None:
+                self._snapshot = dict(result, pgn=self._export_game(self._game))
+            result = self._snapshot
+        return result
 
     def _create_game_info(self):
         if "game_info" not in self.shared:
@@ -524,7 +655,7 @@ class WebDisplay(DisplayMsg):
                     pgn_game.headers["BlackElo"] = str(user_elo)
             if "PGN Replay" in WebDisplay.engine_name:
                 info = {}
-                info = read_pgn_info()
+                info = read_pgn_info(self.engine_channel)
                 pgn_game.headers["Event"] = WebDisplay.engine_name + engine_level
                 pgn_game.headers["Date"] = datetime.datetime.today().strftime("%Y.%m.%d")
                 pgn_game.headers["Site"] = "picochess.org"
@@ -562,6 +693,7 @@ class WebDisplay(DisplayMsg):
             pgn_game = pgn.Game()
             self._build_game_header(pgn_game)  # rebuilds game headers
             self.shared["headers"].update(pgn_game.headers)
+            self._snapshot = None
 
         def _send_headers():
             EventHandler.write_to_clients({"event": "Header", "headers": dict(self.shared["headers"])})
@@ -570,14 +702,39 @@ class WebDisplay(DisplayMsg):
             if "ip_info" in self.shared:
                 EventHandler.write_to_clients({"event": "Title", "ip_info": self.shared["ip_info"]})
 
-        def _transfer(game: chess.Board, keep_these_headers: dict = None):
-            pgn_game = pgn.Game().from_board(game)
-            # if keep_these_headers is None:
-            self._build_game_header(pgn_game)
-            self.shared["headers"] = pgn_game.headers
-            # else:
-            # self.shared["headers"].update(keep_these_headers)  # overwrite with the ones to keep
-            return pgn_game.accept(pgn.StringExporter(headers=True, comments=False, variations=False))
+        def _snapshot_message(game: chess.Board, mov: str, play: str, event: str = "Fen", fen: str = "") -> dict:
+            """Game message with the whole game, the client reloads it."""
+            self._game = game
+            self._snapshot = None
+            return {
+                "pgn": self._export_game(game),
+                "fen": fen or _oldstyle_fen(game),
+                "event": event,
+                "move": mov,
+                "play": play,
+                "ply": game.ply(),
+                "v": GAME_PROTOCOL_VERSION,
+            }
+
+        def _move_message(game: chess.Board, play: str) -> dict:
+            """Game message of the last move in game only, the client adds it to the game it has."""
+            self._game = game
+            self._snapshot = None
+            board = game.copy(stack=1)
+            try:
+                move = board.pop()
+                san = board.san(move)
+            except IndexError:
+                move, san = chess.Move.null(), ""
+            return {
+                "fen": _oldstyle_fen(game),
+                "event": "Fen",
+                "move": move.uci(),
+                "san": san,
+                "play": play,
+                "ply": game.ply(),
+                "v": GAME_PROTOCOL_VERSION,
+            }
 
         def peek_uci(game: chess.Board):
             """Return last move in uci format."""
@@ -590,20 +747,18 @@ class WebDisplay(DisplayMsg):
         if isinstance(message, Message.START_NEW_GAME):
             WebDisplay.result_sav = ""
             self.starttime = datetime.datetime.now().strftime("%H:%M:%S")
-            pgn_str = _transfer(message.game)
-            fen = message.game.fen()
-            result = {
-                "pgn": pgn_str,
-                "fen": fen,
-                "event": "Game",
-                "move": "0000",
-                "play": "newgame",
-            }
+            result = _snapshot_message(message.game, "0000", "newgame", "Game", message.game.fen())
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            if message.game.move_stack:
+                # a loaded game - the client starts a new board on "Game", the reload brings the moves
+                result = _snapshot_message(message.game, peek_uci(message.game), "reload")
+                self.shared["last_dgt_move_msg"] = result
+                EventHandler.write_to_clients(result)
             _build_headers()
             _send_headers()
             _send_title()
+            self._prefetch_explorer(message.game)
 
         elif isinstance(message, Message.IP_INFO):
             self.shared["ip_info"] = message.info
@@ -742,11 +897,9 @@ class WebDisplay(DisplayMsg):
             if not message.is_user_move:
                 game_copy = message.game.copy()
                 game_copy.push(message.move)
-                pgn_str = _transfer(game_copy)
-                fen = _oldstyle_fen(game_copy)
-                mov = message.move.uci()
-                result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "computer"}
+                result = _move_message(game_copy, "computer")
                 self.shared["last_dgt_move_msg"] = result  # not send => keep it for COMPUTER_MOVE_DONE
+                self._prefetch_explorer(game_copy)  # ready before the move is done on the board
 
         elif isinstance(message, Message.COMPUTER_MOVE_DONE):
             WebDisplay.result_sav = ""
@@ -755,44 +908,37 @@ class WebDisplay(DisplayMsg):
 
         elif isinstance(message, Message.USER_MOVE_DONE):
             WebDisplay.result_sav = ""
-            pgn_str = _transfer(message.game, self.shared["headers"])  # dont remake headers every move
-            fen = _oldstyle_fen(message.game)
-            mov = message.move.uci()
-            result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "user"}
+            result = _move_message(message.game, "user")  # the headers stay as they are
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            self._prefetch_explorer(message.game)
 
         elif isinstance(message, Message.REVIEW_MOVE_DONE):
-            pgn_str = _transfer(message.game, self.shared["headers"])  # dont remake headers every move
-            fen = _oldstyle_fen(message.game)
-            mov = message.move.uci()
-            result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "review"}
+            result = _move_message(message.game, "review")  # the headers stay as they are
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            self._prefetch_explorer(message.game)
 
         elif isinstance(message, Message.ALTERNATIVE_MOVE):
-            pgn_str = _transfer(message.game, self.shared["headers"])  # dont remake headers every move
-            fen = _oldstyle_fen(message.game)
-            mov = peek_uci(message.game)
-            result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "reload"}
+            result = _snapshot_message(message.game, peek_uci(message.game), "reload")
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            self._prefetch_explorer(message.game)
 
         elif isinstance(message, Message.SWITCH_SIDES):
-            pgn_str = _transfer(message.game)
-            fen = _oldstyle_fen(message.game)
-            mov = message.move.uci()
-            result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "reload"}
+            result = _snapshot_message(message.game, message.move.uci(), "reload")
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            self._prefetch_explorer(message.game)
 
         elif isinstance(message, Message.TAKE_BACK):
-            pgn_str = _transfer(message.game)
-            fen = _oldstyle_fen(message.game)
-            mov = peek_uci(message.game)
-            result = {"pgn": pgn_str, "fen": fen, "event": "Fen", "move": mov, "play": "reload"}
+            result = _snapshot_message(message.game, peek_uci(message.game), "reload")
             self.shared["last_dgt_move_msg"] = result
             EventHandler.write_to_clients(result)
+            self._prefetch_explorer(message.game)
+
+        elif isinstance(message, Message.NEW_PV):
+            self._prefetch_explorer(message.game, message.pv)
 
         elif isinstance(message, Message.PROMOTION_DIALOG):
             result = {"event": "PromotionDlg", "move": message.move}
@@ -810,6 +956,7 @@ class WebDisplay(DisplayMsg):
                     WebDisplay.result_sav = "1-0"
             else:
                 WebDisplay.result_sav = ""
+            self._snapshot = None  # with the result
             # dont rebuild headers here, use existing one
 
     async def message_consumer(self):
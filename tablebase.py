@@ -0,0 +1,171 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import chess  # type: ignore
+import chess.polyglot  # type: ignore
+import chess.syzygy  # type: ignore
+from chess.engine import Cp, InfoDict, PovScore
+
+SYZYGY_PATH = "tablebases/syzygy"
+MAX_PIECES = 5  # positions with more pieces are not probed
+CACHE_SIZE = 4096  # probed positions kept
+TB_WIN_SCORE = 20000  # centipawns of a tablebase win, minus the distance to zeroing
+
+logger = logging.getLogger(__name__)
+
+Probe = Tuple[int, int]  # wdl, dtz - seen from the side to move
+
+
+class TablebaseService(object):
+    """Syzygy probing for engine, tutor and analysis with an LRU of the wdl/dtz results.
+
+    probe() answers positions with at most max_pieces pieces and no castling
+    rights, None otherwise. The users of the service report with skipping()
+    when they do without an engine search, get_stats() sums up the probes and
+    the engine time saved.
+    """
+
+    def __init__(self, tablebase, max_pieces: int = MAX_PIECES, cache_size: int = CACHE_SIZE):
+        self.tablebase = tablebase  # chess.syzygy.Tablebase
+        self.max_pieces = max_pieces
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()  # zobrist hash -> Probe or None (table missing)
+        self._skip_since: dict = {}  # user -> monotonic time its engine search was skipped from
+        self.probes = 0
+        self.cache_hits = 0
+        self.probe_time = 0.0
+        self.skipped: dict = {}  # user -> number of skipped searches
+        self.time_saved: dict = {}  # user -> seconds of skipped engine search
+
+    def probe(self, board: chess.Board) -> Optional[Probe]:
+        """Return (wdl, dtz) of board from the side to move, None if the tablebases do not know it."""
+        if chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+        key = chess.polyglot.zobrist_hash(board)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._cache[key]
+        started = time.monotonic()
+        try:
+            result: Optional[Probe] = (self.tablebase.probe_wdl(board), self.tablebase.probe_dtz(board))
+        except KeyError:  # missing table
+            result = None
+        self.probes += 1
+        self.probe_time += time.monotonic() - started
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def best_move(self, board: chess.Board) -> Optional[Tuple[chess.Move, int, int]]:
+        """Return the best move with wdl and dtz after it (from the mover's side), None if not solved."""
+        if self.probe(board) is None:
+            return None
+        best = None
+        best_rank: tuple = ()
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    return move, 2, 1
+                result = self.probe(board)
+            finally:
+                board.pop()
+            if result is None:
+                return None
+            wdl, dtz = -result[0], -result[1]
+            if wdl > 0:
+                rank = (wdl, zeroing, -abs(dtz))  # win: reset the 50 move counter, else the shortest way
+            elif wdl < 0:
+                rank = (wdl, not zeroing, abs(dtz))  # loss: the longest way
+            else:
+                rank = (wdl, False, 0)
+            if best is None or rank > best_rank:
+                best, best_rank = (move, wdl, dtz), rank
+        return best
+
+    def info(self, board: chess.Board) -> Optional[InfoDict]:
+        """Return an engine like InfoDict (score and best move) for board, None if not solved."""
+        result = self.probe(board)
+        if result is None:
+            return None
+        wdl, dtz = result
+        if wdl > 1:
+            score = TB_WIN_SCORE - abs(dtz)
+        elif wdl < -1:
+            score = -TB_WIN_SCORE + abs(dtz)
+        else:
+            score = 0  # draw - or a result the 50 move rule turns into one
+        info: InfoDict = {"score": PovScore(Cp(score), board.turn), "tbhits": 1}
+        best = self.best_move(board) if not board.is_game_over() else None
+        if best is not None:
+            info["pv"] = [best[0]]
+        return info
+
+    def skipping(self, user: str, skipped: bool, saved: float = 0.0):
+        """User (tutor, analysis, engine) does (not) skip its engine search now.
+
+        The time from skipping=True to the next call counts as saved, saved adds
+        an estimate for a single search that was skipped.
+        """
+        now = time.monotonic()
+        since = self._skip_since.pop(user, None)
+        if since is not None:
+            self.time_saved[user] = self.time_saved.get(user, 0.0) + now - since
+        if skipped:
+            self.skipped[user] = self.skipped.get(user, 0) + 1
+            self.time_saved[user] = self.time_saved.get(user, 0.0) + saved
+            if not saved:
+                self._skip_since[user] = now
+
+    def get_stats(self) -> dict:
+        """Return probe counters and the engine time saved per user."""
+        now = time.monotonic()
+        time_saved = dict(self.time_saved)
+        for user, since in self._skip_since.items():
+            time_saved[user] = time_saved.get(user, 0.0) + now - since
+        return {
+            "probes": self.probes,
+            "cache_hits": self.cache_hits,
+            "probe_time": round(self.probe_time, 3),
+            "skipped": dict(self.skipped),
+            "time_saved": {user: round(seconds, 1) for user, seconds in time_saved.items()},
+        }
+
+    def close(self):
+        self.tablebase.close()
+
+
+def open_tablebase_service(path: str = SYZYGY_PATH, max_pieces: int = MAX_PIECES) -> Optional[TablebaseService]:
+    """Open the syzygy tables in path - returns None if there are none."""
+    if not path or not os.path.isdir(path):
+        return None
+    tablebase = chess.syzygy.Tablebase()
+    try:
+        tables = tablebase.add_directory(path)
+    except OSError as exc:
+        logger.warning("could not read syzygy tables from %s: %s", path, exc)
+        tables = 0
+    if not tables:
+        tablebase.close()
+        return None
+    logger.info("%d syzygy tables opened in %s", tables, path)
+    return TablebaseService(tablebase, max_pieces=max_pieces)
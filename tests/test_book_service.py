@@ -0,0 +1,76 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import chess
+import chess.polyglot
+
+from book_service import BookService
+
+ENTRY = struct.Struct(">QHHI")
+
+
+def raw_move(uci: str) -> int:
+    move = chess.Move.from_uci(uci)
+    return move.to_square | (move.from_square << 6)
+
+
+class TestBookService(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        start = chess.Board()
+        after_e4 = chess.Board()
+        after_e4.push_san("e4")
+        self.start_key = chess.polyglot.zobrist_hash(start)
+        self.e4_key = chess.polyglot.zobrist_hash(after_e4)
+        self.book_a = self._write_book("a.bin", [(self.start_key, "e2e4", 10), (self.start_key, "d2d4", 5)])
+        self.book_b = self._write_book("b.bin", [(self.start_key, "c2c4", 3), (self.e4_key, "e7e5", 7)])
+        self.book_empty = self._write_book("empty.bin", [])
+        self.files = [self.book_a, self.book_b, self.book_empty]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_book(self, name, entries):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as file:
+            for key, uci, weight in sorted(entries):
+                file.write(ENTRY.pack(key, raw_move(uci), weight, 0))
+        return path
+
+    def test_merged_lookup(self):
+        service = BookService(self.files, background=False)
+        rows = service.lookup_key(self.start_key)
+        self.assertEqual(rows, {0: (0, 2), 1: (0, 1)})
+        self.assertEqual(service.lookup_key(self.e4_key), {1: (1, 1)})
+        self.assertEqual(service.lookup_key(12345), {})
+
+    def test_weights_and_coverage(self):
+        service = BookService(self.files, background=False)
+        weights = service.weights(chess.Board())
+        self.assertEqual(
+            weights[self.book_a], {chess.Move.from_uci("e2e4"): 10, chess.Move.from_uci("d2d4"): 5}
+        )
+        self.assertEqual(weights[self.book_b], {chess.Move.from_uci("c2c4"): 3})
+        self.assertEqual(service.coverage(chess.Board()), {self.book_a: 2, self.book_b: 1})
+
+    def test_reader_uses_index(self):
+        service = BookService(self.files, background=False)
+        board = chess.Board()
+        board.push_san("e4")
+        reader = service.reader(self.book_b)
+        self.assertEqual(reader.weighted_choice(board).move, chess.Move.from_uci("e7e5"))
+        with self.assertRaises(IndexError):
+            service.reader(self.book_a).weighted_choice(board)
+        self.assertIs(service.reader(self.book_b), reader)
+
+    def test_index_is_cached(self):
+        BookService(self.files, background=False)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp.name, "books.idx")))
+        with patch.object(BookService, "_build_index") as build_mock:
+            service = BookService(self.files, background=False)
+            build_mock.assert_not_called()
+        self.assertTrue(service.is_ready())
+        self.assertEqual(service.lookup_key(self.e4_key), {1: (1, 1)})
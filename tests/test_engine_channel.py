@@ -0,0 +1,108 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import picochess
+import server
+from engine_channel import ChannelClient, EngineChannel, CHANNEL_ENV, ONLINE_GAME, PGN_GAME_INFO
+
+PGN_INFO = {
+    "PGN_GAME": "SaveGame_1",
+    "PGN_GAME_INDEX": "3",
+    "PGN_PROBLEM": "",
+    "PGN_White": "Carlsen",
+    "PGN_Black": "Nepo",
+    "PGN_FEN": "",
+    "PGN_RESULT": "1-0",
+    "PGN_White_ELO": "2850",
+    "PGN_Black_ELO": "2790",
+}
+
+
+class TestEngineChannel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "channel.sock")
+        self.channel = EngineChannel(self.path)
+        with patch.dict(os.environ):
+            self.assertTrue(await self.channel.start())
+            self.assertEqual(os.environ[CHANNEL_ENV], self.path)
+
+    async def asyncTearDown(self):
+        await self.channel.close()
+        shutil.rmtree(self.tmp_dir)
+
+    async def _send(self, client, kind, state):
+        # the client blocks like it does in the helper engine, the channel needs the loop meanwhile
+        return await asyncio.to_thread(client.send, kind, state)
+
+    async def test_pushed_state_wakes_the_waiting_reader(self):
+        client = ChannelClient(self.path)
+        waiting = asyncio.create_task(self.channel.wait(PGN_GAME_INFO, 5))
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        self.assertTrue(await self._send(client, PGN_GAME_INFO, PGN_INFO))
+        self.assertEqual(await waiting, PGN_INFO)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.channel.messages, 1)
+        client.close()
+
+    async def test_readers_use_the_pushed_states(self):
+        client = ChannelClient(self.path)
+        online = {"LOGIN": "ok", "COLOR": "B", "OWN_USER": "me", "OPPONENT_USER": "you", "GAME_TIME": "5"}
+        online.update({"FISCHER_INC": "3", "GAME_RESULT": "1-0", "WINNER": "you"})
+        await self._send(client, PGN_GAME_INFO, PGN_INFO)
+        await self._send(client, ONLINE_GAME, online)
+        await self.channel.wait(ONLINE_GAME, 2)
+        client.close()
+
+        self.assertEqual(picochess.read_pgn_info(self.channel), ("SaveGame_1", "", "", "1-0", "Carlsen", "Nepo"))
+        self.assertEqual(server.read_pgn_info(self.channel)["PGN_White_ELO"], "2850")
+        self.assertEqual(picochess.read_online_user_info(self.channel), ("ok", "B", "me", "you", 5, 3))
+        self.assertEqual(picochess.read_online_result(self.channel), ("1-0", "you"))
+
+    async def test_wait_times_out_without_push(self):
+        start = time.monotonic()
+        self.assertIsNone(await self.channel.wait(ONLINE_GAME, 0.1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    async def test_broken_message_keeps_the_connection(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        writer.write(b"no json\n")
+        writer.write(b'{"t": "pgn_game_info", "state": {"PGN_GAME": "LastGame"}}\n')
+        await writer.drain()
+        self.assertEqual(await self.channel.wait(PGN_GAME_INFO, 2), {"PGN_GAME": "LastGame"})
+        writer.close()
+
+
+class TestStateFileFallback(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.info_file = os.path.join(self.tmp_dir, "pgn_game_info.txt")
+        with open(self.info_file, "w") as info_file:
+            for name, value in PGN_INFO.items():
+                info_file.write("%s=%s\n" % (name, value))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_client_without_channel(self):
+        client = ChannelClient(os.path.join(self.tmp_dir, "missing.sock"))
+        self.assertFalse(client.send(PGN_GAME_INFO, PGN_INFO))
+        client.close()
+
+    def test_readers_fall_back_to_the_file(self):
+        channel = EngineChannel(os.path.join(self.tmp_dir, "channel.sock"))  # never started, nothing pushed
+        with patch("picochess.PGN_GAME_INFO_FILE", self.info_file), patch("server.PGN_GAME_INFO_FILE", self.info_file):
+            self.assertEqual(picochess.read_pgn_info(channel), ("SaveGame_1", "", "", "1-0", "Carlsen", "Nepo"))
+            self.assertEqual(server.read_pgn_info(channel)["PGN_Black"], "Nepo")
+        with patch("picochess.PGN_GAME_INFO_FILE", os.path.join(self.tmp_dir, "missing.txt")):
+            self.assertEqual(picochess.read_pgn_info(channel), ("Game Error", "", "", "*", "", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
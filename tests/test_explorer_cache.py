@@ -0,0 +1,90 @@
+import unittest
+
+import chess
+
+from explorer_cache import ExplorerCache, normalize_fen
+
+
+class FakeOpeningStats(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_book_moves(self, fen):
+        self.calls.append(fen)
+        if chess.Board(fen).board_fen() == chess.Board().board_fen():
+            rows = [("e2e4", 1000), ("d2d4", 900), ("g1f3", 10)]
+        else:
+            rows = []
+        return {"data": [{"move": move, "count": count} for move, count in rows]}
+
+
+class FakeGamesIndex(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_games(self, fen):
+        self.calls.append(fen)
+        return {"data": [{"white": "a", "black": "b", "result": "*", "event": "x", "pgn": fen}]}
+
+
+class TestExplorerCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stats = FakeOpeningStats()
+        self.games = FakeGamesIndex()
+        self.explorer = ExplorerCache(opening_stats=self.stats, games_index=self.games, cache_size=10)
+
+    def test_normalize_fen(self):
+        self.assertEqual(normalize_fen(chess.STARTING_FEN), "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -")
+
+    async def test_cache_hits(self):
+        await self.explorer.get_book_moves(chess.STARTING_FEN)
+        await self.explorer.get_book_moves(chess.STARTING_FEN.replace("0 1", "4 7"))
+        await self.explorer.get_games(chess.STARTING_FEN)
+        self.assertEqual(len(self.stats.calls), 1)
+        self.assertEqual(len(self.games.calls), 1)
+        stats = self.explorer.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["hit_rate"], 0.333)
+
+    async def test_lru_bound(self):
+        explorer = ExplorerCache(opening_stats=self.stats, cache_size=1)  # two entries, one per service
+        board = chess.Board()
+        for move in ("e2e4", "e7e5", "g1f3"):
+            board.push_uci(move)
+            await explorer.get_book_moves(board.fen())
+        self.assertEqual(explorer.get_stats()["size"], 2)
+        await explorer.get_book_moves(board.fen())
+        self.assertEqual(explorer.get_stats()["hits"], 1)
+
+    async def test_prefetch_book_and_pv(self):
+        board = chess.Board()
+        self.explorer.prefetch(board, [chess.Move.from_uci("c2c4"), chess.Move.from_uci("e7e5")])
+        await self.explorer._prefetch_task
+        # start position, three book moves and two pv plies - for both services
+        self.assertEqual(self.explorer.get_stats()["prefetches"], 12)
+        after_e4 = chess.Board()
+        after_e4.push_uci("e2e4")
+        after_c4_e5 = chess.Board()
+        after_c4_e5.push_uci("c2c4")
+        after_c4_e5.push_uci("e7e5")
+        await self.explorer.get_book_moves(after_e4.fen())
+        await self.explorer.get_games(after_c4_e5.fen())
+        stats = self.explorer.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["prefetch_hits"]), (2, 0, 2))
+        self.assertEqual(len(self.stats.calls), 6)
+
+    async def test_pv_does_not_interrupt_prefetch(self):
+        self.explorer.prefetch(chess.Board())
+        task = self.explorer._prefetch_task
+        self.explorer.prefetch(chess.Board(), [chess.Move.from_uci("c2c4")])
+        self.assertIs(self.explorer._prefetch_task, task)
+        await task
+
+    async def test_missing_services(self):
+        explorer = ExplorerCache()
+        self.assertEqual(await explorer.get_book_moves(chess.STARTING_FEN), {"data": []})
+        self.assertEqual(await explorer.get_games(chess.STARTING_FEN), {"data": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+import chess
+
+from dgt.util import TimeMode
+from game_journal import GameJournal, read_journal, read_unfinished_game
+from timecontrol import TimeControl
+
+
+def _tc_init(white=300, black=300):
+    tc_init = TimeControl(TimeMode.FISCHER, blitz=5, fischer=3).get_parameters()
+    tc_init["internal_time"] = {chess.WHITE: white, chess.BLACK: black}
+    return tc_init
+
+
+class TestGameJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "game_journal.jsonl")
+        self.journal = GameJournal(self.path, sync_interval=0)
+        self.board = chess.Board()
+        self.journal.record(self.board, _tc_init(), {"White": "Player"})
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def _play(self, *sans, white=300, black=300):
+        for san in sans:
+            self.board.push_san(san)
+        self.journal.record(self.board, _tc_init(white, black), {"White": "Player"})
+
+    def _records(self):
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_moves_and_clock(self):
+        self._play("e4", white=290)
+        self._play("e5", white=290, black=280)
+        self._play()  # nothing changed, nothing written
+        self.assertEqual([record["t"] for record in self._records()], ["game", "move", "move"])
+        game = read_unfinished_game(self.path)
+        self.assertEqual(game.moves, ["e2e4", "e7e5"])
+        self.assertEqual(game.headers, {"White": "Player"})
+        self.assertEqual(game.board().fen(), self.board.fen())
+        tc_init = game.tc_init()
+        self.assertEqual(tc_init["mode"], TimeMode.FISCHER)
+        self.assertEqual(tc_init["fischer"], 3)
+        self.assertEqual(tc_init["internal_time"], {chess.WHITE: 290, chess.BLACK: 280})
+        self.assertEqual(TimeControl(**tc_init).internal_time[chess.BLACK], 280)
+
+    def test_takeback(self):
+        self._play("e4", "e5", "Nf3")
+        self.board.pop()
+        self.board.pop()
+        self._play("c5", black=250)
+        game = read_journal(self.path)
+        self.assertEqual(game.moves, ["e2e4", "c7c5"])
+        self.assertEqual(game.tc_init()["internal_time"][chess.BLACK], 250)
+        self.assertIn({"t": "takeback", "ply": 1}, self._records())
+
+    def test_new_game_compacts(self):
+        self._play("e4", "e5")
+        self.board = chess.Board()
+        self._play()
+        self.assertEqual([record["t"] for record in self._records()], ["game"])
+        self.assertIsNone(read_unfinished_game(self.path))
+        self.board = chess.Board("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")
+        self._play("e4")
+        game = read_unfinished_game(self.path)
+        self.assertEqual(game.fen, "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")
+        self.assertEqual(game.moves, ["e2e4"])
+
+    def test_end(self):
+        self._play("f3", "e5", "g4")
+        self.board.push_san("Qh4")  # the mating move reaches the journal with the end
+        self.journal.end(self.board, _tc_init(), "0-1")
+        game = read_journal(self.path)
+        self.assertEqual(game.moves[-1], "d8h4")
+        self.assertEqual(game.result, "0-1")
+        self.assertIsNone(read_unfinished_game(self.path))
+        self.board.pop()  # taken back, the game goes on
+        self._play()
+        self.assertIsNone(read_journal(self.path).result)
+        self.assertEqual(len(read_unfinished_game(self.path).moves), 3)
+
+    def test_end_of_other_game(self):
+        self._play("e4")
+        other = chess.Board()
+        other.push_san("d4")
+        self.journal.end(other, _tc_init(), "1-0")
+        self.assertEqual(read_unfinished_game(self.path).moves, ["e2e4"])
+
+    def test_torn_record(self):
+        self._play("e4", "e5", "Nf3")
+        self.journal.close()
+        with open(self.path, "a") as file:
+            file.write('{"t": "move", "ply": 3, "uci": "b8')  # power lost while writing
+        game = read_unfinished_game(self.path)
+        self.assertEqual(game.moves, ["e2e4", "e7e5", "g1f3"])
+
+    def test_resume(self):
+        self._play("e4", "e5")
+        self.journal.close()
+        journal = GameJournal(self.path, sync_interval=0)
+        journal.resume(read_unfinished_game(self.path))
+        self.board.push_san("Nf3")
+        journal.record(self.board, _tc_init(), {"White": "Player"})
+        journal.close()
+        self.assertEqual([record["t"] for record in self._records()], ["game", "move", "move", "move"])
+
+    def test_batched_sync(self):
+        async def play():
+            journal = GameJournal(self.path, sync_interval=0.05)
+            board = chess.Board()
+            journal.record(board, _tc_init())
+            for san in ("e4", "e5", "Nf3", "Nc6"):
+                board.push_san(san)
+                journal.record(board, _tc_init())
+            syncs = journal.syncs
+            await asyncio.sleep(0.1)
+            return journal, syncs
+
+        journal, syncs = asyncio.run(play())
+        self.assertLessEqual(syncs, 1)
+        self.assertEqual(journal.syncs, syncs + 1)  # the rest synced once by the timer
+        self.assertEqual(journal.records, 5)
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+import unittest
+
+import chess
+from tornado.testing import AsyncHTTPTestCase
+
+import games_index
+from explorer_cache import ExplorerCache
+from games_index import GamesIndex, iter_pgn_games
+from server import WebServer
+
+GAME_1 = """[Event "Candidates"]
+[Date "2012.06.07"]
+[White "Carlsen, M."]
+[Black "Aronian, L."]
+[Result "1-0"]
+[WhiteElo "2835"]
+[BlackElo "0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+"""
+
+GAME_2 = """[Event "Club"]
+[White "Me"]
+[Black "Pico"]
+[Result "*"]
+
+1. e4 c5 (1... e5 2. Nf3) 2. Nf3 *
+"""
+
+GAME_3 = """[Event "Later"]
+[White "Me"]
+[Black "Pico"]
+[Result "0-1"]
+
+1. d4 d5 0-1
+
+"""
+
+
+def board_after(*sans) -> chess.Board:
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return board
+
+
+class TestGamesIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pgn_file = os.path.join(self.tmp.name, "games.pgn")
+        self.index_file = os.path.join(self.tmp.name, "games.idx")
+        with open(self.pgn_file, "w") as file:
+            file.write(GAME_1 + GAME_2)  # no empty line between the games
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _index(self) -> GamesIndex:
+        return GamesIndex([self.pgn_file], index_file=self.index_file, background=False)
+
+    def test_iter_pgn_games(self):
+        with open(self.pgn_file, "rb") as file:
+            games = list(iter_pgn_games(file))
+        self.assertEqual([offset for offset, _ in games], [0, len(GAME_1)])
+        self.assertTrue(games[1][1].startswith('[Event "Club"]'))
+
+    def test_find_games(self):
+        index = self._index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.find_games(chess.Board()), [0, 1])
+        self.assertEqual(index.find_games(board_after("e4", "e5")), [0])  # variations are not indexed
+        self.assertEqual(index.find_games(board_after("e4", "c5", "Nf3")), [1])
+        self.assertEqual(index.find_games(board_after("d4")), [])
+
+    def test_get_games_json(self):
+        data = self._index().get_games(board_after("e4", "e5").fen())["data"]
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["white"], "Carlsen, M. (2835)")
+        self.assertEqual(data[0]["black"], "Aronian, L.")
+        self.assertEqual(data[0]["result"], "1-0")
+        self.assertEqual(data[0]["event"], "2012, Candidates")
+        self.assertIn("1. e4 e5 2. Nf3 Nc6 1-0", data[0]["pgn"])
+        self.assertEqual(self._index().get_games("no fen"), {"data": []})
+
+    def test_max_ply(self):
+        with patch_max_ply(2):
+            index = self._index()
+        self.assertEqual(index.find_games(board_after("e4", "e5")), [0])
+        self.assertEqual(index.find_games(board_after("e4", "e5", "Nf3")), [])
+
+    def test_incremental_update(self):
+        index = self._index()
+        with open(self.pgn_file, "a") as file:
+            file.write(GAME_3)
+        self.assertEqual(index.update(self.pgn_file), 1)
+        self.assertEqual(index.find_games(board_after("d4", "d5")), [2])
+        self.assertEqual(index.find_games(chess.Board()), [0, 1, 2])
+        self.assertEqual(index.update(self.pgn_file), 0)
+        index._merge_appended()
+        self.assertEqual(index.find_games(board_after("d4", "d5")), [2])
+
+    def test_cached_index(self):
+        self._index()
+        with open(self.pgn_file, "a") as file:
+            file.write(GAME_3)
+        index = self._index()  # loads the cache, parses only the appended game
+        self.assertEqual(index._appended_count, 3)
+        self.assertEqual(index.get_games(board_after("d4").fen())["data"][0]["event"], "Later")
+
+    def test_rewritten_file(self):
+        index = self._index()
+        with open(self.pgn_file, "w") as file:
+            file.write(GAME_3)
+        index.update(self.pgn_file)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.find_games(chess.Board()), [0])
+
+
+class patch_max_ply(object):
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+
+    def __enter__(self):
+        self.old, games_index.MAX_PLY = games_index.MAX_PLY, self.max_ply
+
+    def __exit__(self, *args):
+        games_index.MAX_PLY = self.old
+
+
+class TestGamesDbHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pgn_file = os.path.join(self.tmp.name, "games.pgn")
+        with open(pgn_file, "w") as file:
+            file.write(GAME_1)
+        index = GamesIndex([pgn_file], index_file=os.path.join(self.tmp.name, "games.idx"), background=False)
+        return WebServer().make_games_app(ExplorerCache(games_index=index))
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def test_query(self):
+        response = self.fetch("/?action=get_games&fen=" + chess.STARTING_FEN.replace(" ", "%20"))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Access-Control-Allow-Origin"], "*")
+        self.assertEqual(json.loads(response.body)["data"][0]["black"], "Aronian, L.")
+        self.assertEqual(json.loads(self.fetch("/query?action=other").body), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
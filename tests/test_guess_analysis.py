@@ -0,0 +1,116 @@
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+import chess
+
+from guess_analysis import GuessAnalyzer
+
+# uci engine scoring each legal move by the material it wins, multipv best first, counting its searches
+MULTIPV_ENGINE = textwrap.dedent(
+    """\
+    #!{python}
+    import sys
+    import chess
+
+    VALUES = {{chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900}}
+
+    def gain(board, move):
+        captured = board.piece_at(move.to_square)
+        return VALUES.get(captured.piece_type, 0) if captured else 0
+
+    board = chess.Board()
+    multipv = 1
+    for line in sys.stdin:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "uci":
+            print("id name multipv")
+            print("option name MultiPV type spin default 1 min 1 max 10")
+            print("uciok")
+        elif words[0] == "isready":
+            print("readyok")
+        elif words[:3] == ["setoption", "name", "MultiPV"]:
+            multipv = int(words[4])
+        elif words[0] == "position":
+            board = chess.Board(" ".join(words[2:8])) if words[1] == "fen" else chess.Board()
+            if "moves" in words:
+                for uci in words[words.index("moves") + 1:]:
+                    board.push_uci(uci)
+        elif words[0] == "go":
+            with open({log!r}, "a") as log:
+                log.write(board.fen() + "\\n")
+            moves = sorted(board.legal_moves, key=lambda move: (-gain(board, move), move.uci()))[:multipv]
+            for number, move in enumerate(moves, 1):
+                print("info depth 3 multipv {{}} score cp {{}} pv {{}}".format(number, gain(board, move), move.uci()))
+            print("bestmove {{}}".format(moves[0].uci()))
+        elif words[0] == "quit":
+            break
+        sys.stdout.flush()
+    """
+)
+
+
+class TestGuessAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = os.path.join(self.tmp.name, "multipv.py")
+        self.log = os.path.join(self.tmp.name, "searches.txt")
+        with open(self.engine, "w") as file:
+            file.write(MULTIPV_ENGINE.format(python=sys.executable, log=self.log))
+        os.chmod(self.engine, os.stat(self.engine).st_mode | stat.S_IEXEC)
+        self.analyzer = GuessAnalyzer(self.engine, think_time=0.01, lookahead=2, multipv=3)
+
+    def tearDown(self):
+        self.analyzer.close()
+        self.tmp.cleanup()
+
+    def _searches(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as file:
+            return len(file.readlines())
+
+    def _until(self, condition, timeout=10.0):
+        started = time.monotonic()
+        while not condition():
+            self.assertLess(time.monotonic() - started, timeout)
+            time.sleep(0.01)
+
+    def test_pre_analysis(self):
+        board = chess.Board("4k3/8/8/3p4/4P3/8/8/4K3 w - - 0 1")
+        self.analyzer.schedule(board, ["e4d5", "e8d7", "e1e2"])
+        self._until(lambda: self.analyzer.analysed == 3)  # the position and the ones after two master moves
+        searches = self._searches()
+        # the master move and a top alternative answered from the cache, without searching
+        self.assertEqual(self.analyzer.move_score(board, chess.Move.from_uci("e4d5")), 100)
+        guess, master = chess.Move.from_uci("e1d1"), chess.Move.from_uci("e4d5")
+        self.assertEqual(self.analyzer.compare(board, guess, master), (0, 100))
+        after = board.copy()
+        after.push_uci("e4d5")
+        self.assertEqual(self.analyzer.evaluation(after)["score"], 0)
+        self.assertEqual(self._searches(), searches)
+        self.assertEqual(self.analyzer.get_stats()["misses"], 0)
+
+    def test_other_move_analysed_on_demand(self):
+        board = chess.Board()
+        self.analyzer.schedule(board, [])
+        self._until(lambda: self.analyzer.analysed == 1)
+        move = chess.Move.from_uci("h2h3")  # no top move: its position is analysed now
+        self.assertIsNone(self.analyzer.move_score(board, move))
+        self.assertEqual(self.analyzer.move_score(board, move, wait=5), 0)
+        self.assertEqual(self.analyzer.analysed, 2)
+
+    def test_no_engine(self):
+        analyzer = GuessAnalyzer(os.path.join(self.tmp.name, "none"), think_time=0.01)
+        analyzer.schedule(chess.Board(), ["e2e4"])
+        self.assertIsNone(analyzer.evaluation(chess.Board(), wait=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import email
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from aiosmtpd.controller import Controller
+
+from mail_outbox import MailOutbox
+from pgn import Emailer
+
+
+class Collector:
+    """aiosmtpd handler keeping the received mails and the smtp sessions they came in."""
+
+    def __init__(self):
+        self.mails = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.mails.append(email.message_from_bytes(envelope.content))
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestMailOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.tmp.name, "outbox")
+        self.pgn_file = os.path.join(self.tmp.name, "games.pgn")
+        with open(self.pgn_file, "w") as file:
+            file.write('[Event "a"]\n\n1. e4 *\n')
+        self.port = _free_port()
+        self.collector = Collector()
+        self.controller = None
+
+    def tearDown(self):
+        if self.controller is not None:
+            self.controller.stop()
+        self.tmp.cleanup()
+
+    def _start_server(self):
+        self.controller = Controller(self.collector, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def _outbox(self, **kwargs):
+        emailer = Emailer(email="player@example.com")
+        emailer.set_smtp(sserver="127.0.0.1:{}".format(self.port), sfrom="pico@example.com")
+        return MailOutbox(emailer, spool_dir=self.spool_dir, **kwargs)
+
+    def _spooled(self):
+        return sorted(os.listdir(self.spool_dir)) if os.path.isdir(self.spool_dir) else []
+
+    async def _until(self, condition, timeout=5.0):
+        started = time.monotonic()
+        while not condition():
+            if time.monotonic() - started > timeout:
+                raise AssertionError("timeout")
+            await asyncio.sleep(0.02)
+
+    def test_batched_games(self):
+        self._start_server()
+
+        async def run():
+            outbox = self._outbox(batch_delay=0.3)
+            outbox.start()
+            outbox.queue("Game PGN", "1. e4 e5 1-0", self.pgn_file)
+            outbox.queue("Game PGN", "1. d4 d5 0-1", self.pgn_file)
+            self.assertEqual(len(self._spooled()), 2)
+            await self._until(lambda: not self._spooled())
+            await outbox.close()
+            return outbox
+
+        outbox = asyncio.run(run())
+        self.assertEqual(len(self.collector.mails), 1)
+        mail = self.collector.mails[0]
+        self.assertEqual(mail["Subject"], "Game PGN (2 games)")
+        self.assertEqual(mail["To"], "player@example.com")
+        parts = mail.get_payload()
+        self.assertIn("1. e4 e5 1-0", parts[0].get_payload())
+        self.assertIn("1. d4 d5 0-1", parts[0].get_payload())
+        self.assertEqual(len(parts), 2)  # the games file attached once
+        self.assertEqual(parts[1].get_filename(), "games.pgn")
+        self.assertEqual(outbox.get_stats()["sent"], 1)
+
+    def test_connection_reused(self):
+        self._start_server()
+
+        async def run():
+            outbox = self._outbox(batch_delay=0)
+            outbox.start()
+            outbox.queue("Game PGN", "1. e4 e5 1-0", self.pgn_file)
+            await self._until(lambda: len(self.collector.mails) == 1 and not self._spooled())
+            outbox.queue("Game PGN", "1. d4 d5 0-1", self.pgn_file)
+            await self._until(lambda: len(self.collector.mails) == 2 and not self._spooled())
+            await outbox.close()
+            return outbox
+
+        outbox = asyncio.run(run())
+        self.assertEqual(outbox.get_stats()["smtp_connects"], 1)
+        self.assertEqual(len(self.collector.sessions), 1)
+        self.assertEqual(self.collector.mails[1]["Subject"], "Game PGN")
+
+    def test_retry_and_restart(self):
+        async def fail():
+            outbox = self._outbox(batch_delay=0, retry_delay=0.05, max_retry_delay=0.1)
+            outbox.start()
+            outbox.queue("Game PGN", "1. e4 e5 1-0", self.pgn_file)
+            await self._until(lambda: outbox.failed >= 3)  # no server: retried with backoff
+            await outbox.close()
+
+        asyncio.run(fail())
+        self.assertEqual(len(self._spooled()), 1)  # the mail survived
+
+        self._start_server()
+
+        async def resend():
+            outbox = self._outbox(batch_delay=30)  # old mails do not wait for the batch
+            outbox.start()
+            await self._until(lambda: not self._spooled())
+            await outbox.close()
+
+        asyncio.run(resend())
+        self.assertEqual(len(self.collector.mails), 1)
+        self.assertEqual(self.collector.mails[0]["Subject"], "Game PGN")
+
+    def test_broken_spool_file(self):
+        os.makedirs(self.spool_dir)
+        with open(os.path.join(self.spool_dir, "1.json"), "w") as file:
+            file.write('{"subject": "Game')  # torn write
+        outbox = self._outbox()
+        self.assertEqual(outbox._read_spool(), [])
+        self.assertEqual(self._spooled(), ["1.json.bad"])
+
+    def test_not_configured(self):
+        outbox = MailOutbox(Emailer(), spool_dir=self.spool_dir)
+        self.assertIsNone(outbox.queue("Game PGN", "1. e4 *", self.pgn_file))
+        self.assertEqual(self._spooled(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,14 @@
+import asyncio
 import os
+import tempfile
 
 import unittest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from dgt.menu import DgtMenu, MenuState
 from dgt.translate import DgtTranslate
-from dgt.util import PicoComment, EBoard
+from dgt.util import GameRead, PicoComment, EBoard
+from pgn_index import PgnLibrary
 from uci.read import read_engine_ini
 from uci.engine_provider import EngineProvider
 
@@ -361,3 +364,31 @@ class TestDgtMenu(unittest.TestCase):
         self.assertEqual("Nodes  5", menu.main_right().large_text.strip())
         self.assertEqual("Nodes  1", menu.main_left().large_text.strip())
         self.assertEqual("Nodes 500", menu.main_left().large_text.strip())
+
+    @patch("platform.machine")
+    def test_game_archive_menu(self, machine_mock):
+        menu = self.create_menu(machine_mock)
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "games.pgn"), "w") as file:
+                for number in range(25):
+                    file.write('[White "White{0}, A."]\n[Black "Black{0}"]\n'.format(number))
+                    file.write('[Result "1-0"]\n\n1. e4 1-0\n\n')
+            menu.pgn_library = PgnLibrary(tmp)
+            menu.state = MenuState.GAME_GAMEREAD_GAME3
+            menu.menu_game_read = GameRead.GAME3
+            self.assertEqual("Archive", menu.main_right().large_text.strip())
+            self.assertEqual(MenuState.GAME_GAMEREAD_ARCHIVE, menu.state)
+            text = asyncio.run(menu.main_down())
+            self.assertEqual(MenuState.GAME_GAMEREAD_ARCHIVE_GAME, menu.state)
+            self.assertEqual("25 White24-Black24 1-0", text.web_text)
+            self.assertEqual("1 White0-Black0 1-0", menu.main_right().web_text)  # wraps around
+            self.assertEqual("25 White24-Black24 1-0", menu.main_left().web_text)
+            self.assertEqual("20 White19-Black19 1-0", [menu.main_left() for _ in range(5)][-1].web_text)
+            with patch("dgt.menu.Observable.fire", new_callable=AsyncMock) as fire:
+                with patch("dgt.menu.DispatchDgt.fire", new_callable=AsyncMock):
+                    asyncio.run(menu.main_down())
+            event = fire.call_args[0][0]
+            self.assertEqual((event.pgn_filename, event.game_index), ("games.pgn", 19))
+            menu.state = MenuState.GAME_GAMEREAD_ARCHIVE_GAME
+            menu.main_up()
+            self.assertEqual(MenuState.GAME_GAMEREAD_ARCHIVE, menu.state)
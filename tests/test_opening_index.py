@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import chess
+
+import opening_index
+from opening_index import OpeningTrie, fen_openings
+
+ROWS = [
+    {"eco": "A00", "opening_name": "Start position", "moves": ""},
+    {"eco": "B00", "opening_name": "Kings Pawn", "moves": "e4"},
+    {"eco": "C20", "opening_name": "Open Game", "moves": "e4 e5"},
+    {"eco": "C20", "opening_name": "Open Game again", "moves": "e4 e5"},
+    {"eco": "C50", "opening_name": "Italian Game", "moves": "e4 e5 Nf3 Nc6 Bc4"},
+]
+
+
+class TestOpeningTrie(unittest.TestCase):
+    def test_find(self):
+        trie = OpeningTrie(ROWS)
+        self.assertEqual(trie.find(""), ("", "", ""))
+        self.assertEqual(trie.find("e4 e5"), ("Open Game", "e4 e5", "C20"))
+        self.assertEqual(trie.find("e4 e5 Nf3 Nc6"), ("Open Game", "e4 e5", "C20"))
+        self.assertEqual(trie.find("e4 e5 Nf3 Nc6 Bc4 Bc5"), ("Italian Game", "e4 e5 Nf3 Nc6 Bc4", "C50"))
+        self.assertEqual(trie.find("e4 e5 Nf3+"), ("Open Game", "e4 e5", "C20"))  # whole moves only
+        self.assertEqual(trie.find("d4"), ("", "", ""))
+
+    def test_child(self):
+        trie = OpeningTrie(ROWS)
+        node = trie.child(trie.child(trie.ROOT, "e4"), "e5")
+        self.assertEqual(trie.opening(node)[0], "Open Game")
+        self.assertIsNone(trie.child(node, "Qh5"))
+
+    def test_check_suffix(self):
+        # eco rows do not always write the check of a move, played moves always have it
+        trie = OpeningTrie(
+            [
+                {"eco": "A00", "opening_name": "Grob", "moves": "g4"},
+                {"eco": "D45", "opening_name": "Semi-Slav", "moves": "d4 d5 c4 e6 Nc3 c6 e4 Bb4"},
+                {"eco": "A00", "opening_name": "Grob mate", "moves": "f3 e5 g4 Qh4#"},
+                {"eco": "E81", "opening_name": "Queenswap", "moves": "d4 Nf6 Qd3 d5 Qxd5 Nxd5+"},
+            ]
+        )
+        self.assertEqual(trie.find("d4 d5 c4 e6 Nc3 c6 e4 Bb4+")[0], "Semi-Slav")
+        self.assertEqual(trie.find("f3 e5 g4 Qh4#")[0], "Grob mate")
+        self.assertEqual(trie.find("f3 e5 g4 Qh4")[0], "Grob mate")
+        self.assertEqual(trie.find("d4 Nf6 Qd3 d5 Qxd5 Nxd5")[0], "Queenswap")
+        self.assertIsNotNone(trie.child(trie.ROOT, "g4+"))
+
+
+class TestFenOpenings(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fen_file = os.path.join(self.tmp.name, "opening_name_fen.txt")
+        board = chess.Board()
+        board.push_san("e4")
+        self.fen = board.board_fen()
+        with open(self.fen_file, "w") as file:
+            file.write("{} b KQkq -\nKings Pawn  \n{} b KQkq -\nduplicate\n".format(self.fen, self.fen))
+        fen_openings.cache_clear()
+
+    def tearDown(self):
+        fen_openings.cache_clear()
+        self.tmp.cleanup()
+
+    def test_lookup_and_index_file(self):
+        self.assertEqual(fen_openings(self.fen_file), {self.fen: "Kings Pawn  \n"})
+        self.assertIs(fen_openings(self.fen_file), fen_openings(self.fen_file))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "opening_name_fen.idx")))
+        fen_openings.cache_clear()
+        old_parse = opening_index._parse_fen_openings
+        opening_index._parse_fen_openings = None  # must come from the index file now
+        try:
+            self.assertEqual(fen_openings(self.fen_file), {self.fen: "Kings Pawn  \n"})
+        finally:
+            opening_index._parse_fen_openings = old_parse
+
+    def test_changed_file(self):
+        fen_openings(self.fen_file)
+        fen_openings.cache_clear()
+        with open(self.fen_file, "w") as file:
+            file.write("{} b KQkq -\nOther\n".format(self.fen))
+        self.assertEqual(fen_openings(self.fen_file), {self.fen: "Other\n"})
+
+    def test_missing_file(self):
+        self.assertEqual(fen_openings(os.path.join(self.tmp.name, "none.txt")), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+import chess
+import chess.polyglot
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+import opening_stats
+from explorer_cache import ExplorerCache
+from opening_stats import OpeningStats, benchmark, benchmark_http, open_opening_stats, opening_fens
+from server import WebServer
+
+ENTRY = struct.Struct(">QHBBI")
+
+
+def raw_move(uci: str) -> int:
+    move = chess.Move.from_uci(uci)
+    return move.to_square | (move.from_square << 6)
+
+
+def board_after(*sans) -> chess.Board:
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return board
+
+
+def write_opening_data(path, entries):
+    """entries: (board, uci, white wins, draws, count) - polyglot castling is king takes rook"""
+    with open(path, "wb") as file:
+        rows = [(chess.polyglot.zobrist_hash(board), raw_move(uci), w, d, c) for board, uci, w, d, c in entries]
+        for row in sorted(rows):
+            file.write(ENTRY.pack(*row))
+
+
+class TestOpeningStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_file = os.path.join(self.tmp.name, "opening.data")
+        castle = board_after("e4", "e5", "Nf3", "Nc6", "Bc4", "Bc5")
+        write_opening_data(
+            self.data_file,
+            [
+                (chess.Board(), "e2e4", 32, 44, 218543),
+                (chess.Board(), "d2d4", 32, 47, 205407),
+                (board_after("e4"), "e7e5", 30, 40, 1000),
+                (board_after("e4"), "e2e4", 30, 40, 1),  # illegal - skipped
+                (castle, "e1h1", 35, 40, 500),
+            ],
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_book_moves(self):
+        stats = OpeningStats(self.data_file)
+        moves = stats.get_book_moves(chess.STARTING_FEN)["data"]
+        self.assertEqual(
+            sorted(moves, key=lambda row: row["move"]),
+            [
+                {"move": "d2d4", "whitewins": 32, "draws": 47, "blackwins": 21, "count": 205407},
+                {"move": "e2e4", "whitewins": 32, "draws": 44, "blackwins": 24, "count": 218543},
+            ],
+        )
+        self.assertEqual([row["move"] for row in stats.get_book_moves(board_after("e4").fen())["data"]], ["e7e5"])
+        stats.close()
+
+    def test_castling_and_unknown_positions(self):
+        stats = OpeningStats(self.data_file)
+        castle = board_after("e4", "e5", "Nf3", "Nc6", "Bc4", "Bc5")
+        self.assertEqual(stats.get_book_moves(castle.fen())["data"][0]["move"], "e1g1")
+        self.assertEqual(stats.get_book_moves(board_after("a3").fen()), {"data": []})
+        self.assertEqual(stats.get_book_moves("no fen"), {"data": []})
+        stats.close()
+
+    def test_cache_ignores_move_counters(self):
+        stats = OpeningStats(self.data_file)
+        stats.get_rows(chess.STARTING_FEN)
+        stats.get_rows("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 5 9")
+        self.assertEqual(stats.get_stats(), {"hits": 1, "misses": 1, "size": 1})
+        stats.close()
+
+    def test_bisect_without_numpy(self):
+        numpy_support = opening_stats.numpy_support
+        opening_stats.numpy_support = False
+        try:
+            stats = OpeningStats(self.data_file)
+        finally:
+            opening_stats.numpy_support = numpy_support
+        self.assertIsNone(stats._keys)
+        self.assertEqual(len(stats.get_rows(chess.STARTING_FEN)), 2)
+        stats.close()
+
+    def test_missing_file(self):
+        self.assertIsNone(open_opening_stats(os.path.join(self.tmp.name, "missing.data")))
+
+    def test_benchmark(self):
+        stats = OpeningStats(self.data_file)
+        fens = opening_fens(stats)
+        self.assertEqual(len(fens), 4)  # start, e4, d4, e4 e5
+        result = benchmark(stats, fens, rounds=2)
+        self.assertEqual(result["positions"], 4)
+        self.assertGreater(result["cached_per_second"], 0)
+        stats.close()
+
+
+class TestOpeningStatsHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        data_file = os.path.join(self.tmp.name, "opening.data")
+        write_opening_data(data_file, [(chess.Board(), "g1f3", 30, 49, 53980)])
+        self.stats = OpeningStats(data_file)
+        return WebServer().make_opening_app(ExplorerCache(opening_stats=self.stats))
+
+    def tearDown(self):
+        super().tearDown()
+        self.stats.close()
+        self.tmp.cleanup()
+
+    def test_query(self):
+        response = self.fetch(
+            "/query?action=get_book_moves&fen=rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR%20w%20KQkq%20-%200%201"
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Access-Control-Allow-Origin"], "*")
+        self.assertEqual(
+            json.loads(response.body),
+            {"data": [{"move": "g1f3", "whitewins": 30, "draws": 49, "blackwins": 21, "count": 53980}]},
+        )
+
+    @gen_test
+    async def test_benchmark_http(self):
+        fens = [chess.STARTING_FEN, board_after("e4").fen()]
+        result = await benchmark_http(self.get_url(""), fens, self.stats)
+        self.assertEqual(result["positions"], 2)
+        self.assertGreater(result["per_second"], 0)
+        self.assertEqual(result["mismatches"], 0)
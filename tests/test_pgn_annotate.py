@@ -0,0 +1,171 @@
+import io
+import json
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import chess
+import chess.pgn
+
+from build import pgn_annotate
+from pgn import add_evaluations
+
+# uci engine scoring positions by material after its best capture, deep enough to see a hung queen
+MATERIAL_ENGINE = textwrap.dedent(
+    """\
+    #!{python}
+    import sys
+    import chess
+
+    VALUES = {{chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900}}
+
+    def material(board):
+        score = sum(VALUES.get(p.piece_type, 0) * (1 if p.color == board.turn else -1)
+                    for p in board.piece_map().values())
+        return score
+
+    def best(board):
+        result = (material(board), None)
+        for move in board.legal_moves:
+            if board.is_capture(move):
+                board.push(move)
+                score = -material(board)
+                board.pop()
+                if score > result[0]:
+                    result = (score, move)
+        return result
+
+    board = chess.Board()
+    for line in sys.stdin:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "uci":
+            print("id name material")
+            print("option name Threads type spin default 1 min 1 max 8")
+            print("uciok")
+        elif words[0] == "isready":
+            print("readyok")
+        elif words[0] == "position":
+            board = chess.Board(" ".join(words[2:8])) if words[1] == "fen" else chess.Board()
+            if "moves" in words:
+                for uci in words[words.index("moves") + 1:]:
+                    board.push_uci(uci)
+        elif words[0] == "go":
+            score, move = best(board)
+            move = move or next(iter(board.legal_moves))
+            print("info depth 1 score cp {{}} pv {{}}".format(score, move.uci()))
+            print("bestmove {{}}".format(move.uci()))
+        elif words[0] == "quit":
+            break
+        sys.stdout.flush()
+    """
+)
+
+GAMES = """[Event "hung queen"]
+[Result "*"]
+
+1. e4 e5 2. Qh5 Nc6 3. Qxe5+ Nxe5 *
+
+[Event "quiet"]
+[Result "*"]
+
+1. d4 d5 *
+
+[Event "three"]
+[Result "*"]
+
+1. c4 *
+"""
+
+
+class TestPgnAnnotate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = os.path.join(self.tmp.name, "material.py")
+        with open(self.engine, "w") as file:
+            file.write(MATERIAL_ENGINE.format(python=sys.executable))
+        os.chmod(self.engine, os.stat(self.engine).st_mode | stat.S_IEXEC)
+        self.pgn_file = os.path.join(self.tmp.name, "games.pgn")
+        with open(self.pgn_file, "w") as file:
+            file.write(GAMES)
+        self.output = os.path.join(self.tmp.name, "games-annotated.pgn")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _annotate(self, **kwargs):
+        return pgn_annotate.annotate_file(
+            self.pgn_file, self.output, self.engine, deep_depth=2, low_depth=1, max_workers=2, verbose=False, **kwargs
+        )
+
+    def _games(self):
+        games = []
+        with open(self.output) as file:
+            while True:
+                game = chess.pgn.read_game(file)
+                if game is None:
+                    return games
+                games.append(game)
+
+    def test_annotate_file(self):
+        result = self._annotate()
+        self.assertEqual(result["games"], 3)
+        games = self._games()
+        self.assertEqual([game.headers["Event"] for game in games], ["hung queen", "quiet", "three"])
+        nodes = list(games[0].mainline())
+        queen_takes = nodes[4]  # 3. Qxe5+ loses the queen
+        self.assertEqual(queen_takes.san(), "Qxe5+")
+        self.assertIn(chess.pgn.NAG_BLUNDER, queen_takes.nags)
+        self.assertIn("CPL: ", queen_takes.comment)
+        self.assertEqual(games[0].headers["Annotator"], "PicoTutor")
+        self.assertGreaterEqual(result["moves"], 1)
+        with open(self.output + pgn_annotate.CHECKPOINT_SUFFIX) as file:
+            self.assertEqual(json.load(file)["games"], 3)
+
+    def test_resume_from_checkpoint(self):
+        self._annotate(checkpoint_every=1)
+        with open(self.output, "rb") as file:
+            annotated = file.read()
+        # interrupted after the first game, the second half written
+        first = annotated.index(b'[Event "quiet"]')
+        with open(self.output, "wb") as file:
+            file.write(annotated[: first + 20])
+        pgn_annotate.write_checkpoint(self.pgn_file, self.output, 1, first)
+        result = self._annotate()
+        self.assertEqual(result["skipped"], 1)
+        self.assertEqual(result["games"], 2)
+        with open(self.output, "rb") as file:
+            self.assertEqual(file.read(), annotated)
+
+    def test_tutor_engine_from_ini(self):
+        ini_file = os.path.join(self.tmp.name, "picochess.ini")
+        with open(ini_file, "w") as file:
+            file.write("# tutor-engine = /commented\ntutor-engine = /opt/engines/tutor\n")
+        self.assertEqual(pgn_annotate.tutor_engine(ini_file), "/opt/engines/tutor")
+        self.assertEqual(pgn_annotate.tutor_engine(os.path.join(self.tmp.name, "none.ini")), pgn_annotate.TUTOR_ENGINE)
+
+
+class TestAddEvaluations(unittest.TestCase):
+    def test_game_from_fen(self):
+        game = chess.pgn.read_game(io.StringIO('[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 30"]\n\n30. e4 Kd7 31. Kd2 *'))
+        board = game.board()
+        board.push_san("e4")
+        board.push_san("Kd7")
+        kd7 = board.peek()
+        evaluations = {
+            (board.ply(), kd7, board.turn): {"nag": chess.pgn.NAG_MISTAKE, "CPL": 160, "best_move": "Kd8"},
+            (board.ply(), chess.Move.from_uci("e8f7"), board.turn): {"nag": chess.pgn.NAG_MISTAKE},  # other move
+            (board.ply() + 5, kd7, board.turn): {"nag": chess.pgn.NAG_MISTAKE},  # beyond the game
+        }
+        self.assertEqual(add_evaluations(game, evaluations), 1)
+        node = list(game.mainline())[1]
+        self.assertEqual(node.nags, {chess.pgn.NAG_MISTAKE})
+        self.assertEqual(node.comment, "? CPL: 160 Best: Kd8")
+
+
+if __name__ == "__main__":
+    unittest.main()
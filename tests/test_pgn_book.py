@@ -0,0 +1,91 @@
+import configparser
+import os
+import tempfile
+import unittest
+
+import chess
+import chess.polyglot
+
+from build import pgn_book
+
+GAMES = """[Event "a"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O 1-0
+
+[Event "b"]
+[Result "0-1"]
+
+1. e4 c5 0-1
+[Event "c"]
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+
+[Event "d"]
+[Result "1-0"]
+
+1. e4 e5 1-0
+"""
+
+
+class TestPgnBook(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pgn_file = os.path.join(self.tmp.name, "games.pgn")
+        with open(self.pgn_file, "w") as file:
+            file.write(GAMES)
+        self.book_file = os.path.join(self.tmp.name, "u-mygames.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _weights(self, *sans):
+        board = chess.Board()
+        for san in sans:
+            board.push_san(san)
+        with chess.polyglot.open_reader(self.book_file) as reader:
+            return {entry.move.uci(): entry.weight for entry in reader.find_all(board)}
+
+    def test_build_book(self):
+        result = pgn_book.build_book([self.pgn_file], self.book_file, max_workers=2, batch_games=1, verbose=False)
+        self.assertEqual(result["games"], 4)
+        self.assertEqual(result["positions"], 7 + 2 + 2 + 2)
+        # e4: win, loss, win = 4 points, d4: draw = 1 point
+        self.assertEqual(self._weights(), {"e2e4": 4, "d2d4": 1})
+        # black lost both games with e5, c5 won
+        self.assertEqual(self._weights("e4"), {"c7c5": 2})
+        self.assertEqual(self._weights("e4", "e5", "Nf3", "Nc6", "Bc4", "Bc5"), {"e1g1": 2})
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if name.startswith("pgnbook-")])
+
+    def test_polyglot_castling_move(self):
+        board = chess.Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        self.assertEqual(pgn_book.polyglot_move(board, chess.Move.from_uci("e1g1")), 7 | (4 << 6))
+        self.assertEqual(pgn_book.polyglot_move(board, chess.Move.from_uci("e1c1")), 0 | (4 << 6))
+
+    def test_options(self):
+        pgn_book.build_book([self.pgn_file], self.book_file, max_ply=1, min_games=2, max_workers=1, verbose=False)
+        self.assertEqual(self._weights(), {"e2e4": 4})
+        self.assertEqual(self._weights("e4"), {})
+
+    def test_merge_passes(self):
+        old_fanin, pgn_book.MERGE_FANIN = pgn_book.MERGE_FANIN, 2
+        try:
+            pgn_book.build_book([self.pgn_file], self.book_file, max_workers=1, batch_games=1, verbose=False)
+        finally:
+            pgn_book.MERGE_FANIN = old_fanin
+        self.assertEqual(self._weights(), {"e2e4": 4, "d2d4": 1})
+
+    def test_register_book(self):
+        books_ini = os.path.join(self.tmp.name, "books.ini")
+        with open(books_ini, "w") as file:
+            file.write("[a-nobook.bin]\nsmall = nobook\nmedium = Nobook\nlarge = Nobook\n")
+        pgn_book.register_book(self.book_file, books_ini)
+        config = configparser.ConfigParser()
+        config.read(books_ini)
+        self.assertEqual(config.sections(), ["a-nobook.bin", "u-mygames.bin"])
+        self.assertEqual(config["u-mygames.bin"]["large"], "Mygames")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from dgt.api import Event
+from pgn_index import GameSequence, PgnIndex, PgnIndexBuilder, PgnLibrary, count_plies
+from server import GamesLibraryHandler
+
+GAMES = """[Event "Mate in 2"]
+[White "Mate in 2, \\"white\\""]
+[FEN "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"]
+
+1. Rd8# 1-0
+
+[Event "Second"]
+[White "Me"]
+[Black "Pico"]
+
+1. e4 e5 (1... c5) 2. Nf3 *
+[Event "Third"]
+
+1. d4 d5 *
+"""
+
+
+class TestPgnIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pgn_file = os.path.join(self.tmp.name, "puzzles.pgn")
+        with open(self.pgn_file, "w") as file:
+            file.write(GAMES)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_index(self):
+        index = PgnIndex(self.pgn_file)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.headers(0)["White"], 'Mate in 2, "white"')
+        self.assertEqual(index.headers(2), {"Event": "Third", "PlyCount": "2"})
+        self.assertEqual(index.headers(1)["PlyCount"], "3")
+        game = index.read_game(1)
+        self.assertEqual(game.headers["Black"], "Pico")
+        self.assertEqual([move.uci() for move in game.mainline_moves()], ["e2e4", "e7e5", "g1f3"])
+        self.assertEqual(index.read_game(0).board().fen(), "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        self.assertTrue(os.path.isfile(self.pgn_file + ".idx"))
+
+    def test_sidecar_reused_until_file_changes(self):
+        PgnIndex(self.pgn_file)
+        with patch.object(PgnIndex, "_scan") as scan:
+            index = PgnIndex(self.pgn_file)
+            scan.assert_not_called()
+        self.assertEqual(len(index), 3)
+        self.assertFalse(index.refresh())
+        with open(self.pgn_file, "w") as file:
+            file.write(GAMES.split("[Event \"Third\"]")[0])
+        stat = os.stat(self.pgn_file)
+        os.utime(self.pgn_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertTrue(index.refresh())
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(PgnIndex(self.pgn_file)), 2)
+
+    def test_append_is_indexed_incrementally(self):
+        index = PgnIndex(self.pgn_file)
+        size = os.path.getsize(self.pgn_file)
+        with open(self.pgn_file, "a") as file:
+            file.write('\n[Event "Fourth"]\n[White "Carlsen"]\n\n1. c4 *\n')
+        with patch.object(PgnIndex, "_scan", wraps=index._scan) as scan:
+            self.assertTrue(index.refresh())
+            self.assertEqual(scan.call_args[0][0], size)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.read_game(3).headers["White"], "Carlsen")
+        self.assertEqual(len(PgnIndex(self.pgn_file)), 4)
+
+    def test_grown_rewrite_is_rebuilt(self):
+        index = PgnIndex(self.pgn_file)
+        with open(self.pgn_file, "w") as file:
+            file.write('[Event "New"]\n\n1. e4 *\n\n' + GAMES.replace("Mate in 2", "Mate in 3"))
+        self.assertTrue(index.refresh())
+        events = [index.headers(game_no)["Event"] for game_no in range(len(index))]
+        self.assertEqual(events, ["New", "Mate in 3", "Second", "Third"])
+
+    def test_page(self):
+        index = PgnIndex(self.pgn_file)
+        page = index.page(1, page_size=2)
+        self.assertEqual((page["page"], page["pages"], page["total"]), (1, 2, 3))
+        self.assertEqual([game["index"] for game in page["games"]], [2])
+        page = index.page(0, query="pico")
+        self.assertEqual([game["Event"] for game in page["games"]], ["Second"])
+        self.assertEqual(index.page(5, page_size=2)["page"], 1)
+
+    def test_count_plies(self):
+        self.assertEqual(count_plies("1. e4 e5 (1... c5 2. Nf3 (2. c3)) 2.Nf3 {a (b)} Nc6 $1 3. Bb5 a6!? ; x\n1-0"), 6)
+        self.assertEqual(count_plies("1...e5 2. Nf3 *"), 2)
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            PgnIndex(os.path.join(self.tmp.name, "none.pgn"))
+
+
+class TestPgnLibrary(unittest.TestCase):
+    def test_library(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "games.pgn"), "w") as file:
+                file.write(GAMES)
+            library = PgnLibrary(tmp)
+            self.assertEqual(library.files(), ["games.pgn"])
+            self.assertEqual(library.page("games.pgn", 0)["total"], 3)
+            self.assertEqual(library.read_game("games.pgn", 2).headers["Event"], "Third")
+            self.assertIsNone(library.read_game("games.pgn", 3))
+            self.assertIsNone(library.index("../games.pgn"))
+            self.assertIsNone(library.index("none.pgn"))
+            self.assertEqual(library.page("none.pgn", 0)["games"], [])
+            with open(os.path.join(tmp, "games.pgn"), "a") as file:
+                file.write('[Event "Fourth"]\n\n1. c4 *\n')
+            library.update(os.path.join(tmp, "games.pgn"))
+            self.assertEqual(len(library.index("games.pgn")), 4)
+
+
+class TestPgnIndexBuilder(unittest.TestCase):
+    def test_same_as_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            scanned = PgnIndex(os.path.join(tmp, "scanned.pgn"), refresh=False)
+            with open(scanned.pgn_file, "w") as file:
+                file.write(GAMES)
+            scanned.refresh()
+            data = GAMES.encode("utf-8")
+            for chunk_size in (1, 7, len(data)):
+                pgn_file = os.path.join(tmp, "built{}.pgn".format(chunk_size))
+                builder = PgnIndexBuilder(pgn_file)
+                with open(pgn_file, "wb") as file:
+                    for start in range(0, len(data), chunk_size):
+                        file.write(data[start : start + chunk_size])
+                        builder.feed(data[start : start + chunk_size])
+                self.assertEqual(len(builder), 2)  # the last game ends with the data
+                index = builder.finish()
+                self.assertEqual(list(index._offsets), list(scanned._offsets))
+                self.assertEqual(index.page(0)["games"], scanned.page(0)["games"])
+                self.assertEqual(index.read_game(2).headers["Event"], "Third")
+                self.assertFalse(PgnIndex(pgn_file).refresh())  # the saved index fits the file
+
+
+class TestGamesLibraryHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, "games.pgn"), "w") as file:
+            file.write(GAMES)
+        library = PgnLibrary(self.tmp.name)
+        return tornado.web.Application([(r"/games", GamesLibraryHandler, dict(library=library))])
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def test_browse(self):
+        self.assertEqual(json.loads(self.fetch("/games?action=get_files").body), {"files": ["games.pgn"]})
+        page = json.loads(self.fetch("/games?file=games.pgn&page=1&page_size=2").body)
+        self.assertEqual((page["page"], page["total"], page["games"][0]["Event"]), (1, 3, "Third"))
+        game = json.loads(self.fetch("/games?action=get_game&file=games.pgn&game=1").body)
+        self.assertIn("1. e4 e5", game["pgn"])
+        self.assertEqual(self.fetch("/games?action=get_game&file=games.pgn&game=7").code, 404)
+        self.assertEqual(self.fetch("/games?action=get_game&file=games.pgn&game=x").code, 400)
+
+    def test_read_game(self):
+        with patch("server.Observable.fire", new_callable=AsyncMock) as fire:
+            response = self.fetch("/games", method="POST", body="action=read_game&file=games.pgn&game=2")
+            self.assertEqual(response.code, 200)
+            event = fire.call_args[0][0]
+            self.assertIsInstance(event, Event.READ_GAME)
+            self.assertEqual((event.pgn_filename, event.game_index), ("games.pgn", 2))
+            self.assertEqual(self.fetch("/games", method="POST", body="action=read_game&file=x.pgn&game=0").code, 404)
+
+
+class TestGameSequence(unittest.TestCase):
+    def test_forward_backward(self):
+        forward = GameSequence(3, "forward")
+        self.assertEqual([forward.next() for _ in range(4)], [0, 1, 2, 0])
+        backward = GameSequence(3, "backward")
+        self.assertEqual([backward.next() for _ in range(4)], [2, 1, 0, 2])
+        self.assertEqual(len(backward), 2)
+
+    def test_random_plays_every_game_once(self):
+        sequence = GameSequence(100, "random")
+        self.assertEqual(sorted(sequence.next() for _ in range(100)), list(range(100)))
+        self.assertEqual(len(sequence), 0)
+        self.assertIn(sequence.next(), range(100))
+        unknown = GameSequence(5, "shuffle")
+        self.assertEqual(sorted(unknown.next() for _ in range(5)), list(range(5)))
+
+    def test_no_games(self):
+        with self.assertRaises(IndexError):
+            GameSequence(0).next()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -105,6 +105,52 @@ class TestAlternativeMover(unittest.TestCase):
         self.assertFalse(self.testee.check_book(bookreader, self.game))
 
 
+class TestAlternativeMoverBookReplies(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.testee = AlternativeMover()
+        self.game = chess.Board()
+        self.bookreader = mock.create_autospec(chess.polyglot.MemoryMappedReader)
+        self.bookreader.weighted_choice.side_effect = self._weighted_choice
+
+    @staticmethod
+    def _weighted_choice(board, exclude_moves=()):
+        # book knows one reply: 1. e4 e5, and after that Nf3
+        replies = {"e2e4": "e7e5", "e2e4 e7e5": "g1f3"}
+        reply = replies.get(" ".join(move.uci() for move in board.move_stack))
+        if reply is None:
+            raise IndexError()
+        return chess.polyglot.Entry(1, 0, 1, 0, chess.Move.from_uci(reply))
+
+    async def _prepare(self):
+        self.testee.prepare_book(self.bookreader, self.game)
+        await self.testee._book_task
+        self.bookreader.weighted_choice.reset_mock()
+
+    async def test_book_reply_without_lookup(self):
+        await self._prepare()
+        self.game.push_uci("e2e4")
+        move = self.testee.book(self.bookreader, self.game.copy())
+        self.assertEqual((move.move, move.ponder), (chess.Move.from_uci("e7e5"), chess.Move.from_uci("g1f3")))
+        self.bookreader.weighted_choice.assert_not_called()
+        self.assertEqual(self.testee.book_reply_hits, 1)
+        self.assertTrue(chess.Move.from_uci("e7e5") not in self.testee.all(self.game))
+
+    async def test_no_book_reply_without_lookup(self):
+        await self._prepare()
+        self.game.push_uci("d2d4")
+        self.assertIsNone(self.testee.book(self.bookreader, self.game.copy()))
+        self.bookreader.weighted_choice.assert_not_called()
+
+    async def test_other_book_asks_book(self):
+        await self._prepare()
+        self.game.push_uci("e2e4")
+        other_reader = mock.create_autospec(chess.polyglot.MemoryMappedReader)
+        other_reader.weighted_choice.side_effect = IndexError()
+        self.assertIsNone(self.testee.book(other_reader, self.game.copy()))
+        other_reader.weighted_choice.assert_called()
+
+
 class TestReadPGNInfo(unittest.TestCase):
     def test_read_pgn_info(self):
         game_name, problem, fen, result, white, black = read_pgn_info()
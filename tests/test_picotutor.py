@@ -1,4 +1,8 @@
 import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import chess
+from chess.engine import Cp, PovScore
 
 from picotutor import PicoTutor
 
@@ -27,3 +31,69 @@ class TestPicotutor(unittest.TestCase):
 
         opening_name, _, _ = tutor._find_longest_matching_opening("e4 e5")
         self.assertEqual(opening_name, "Open Game")
+
+    def test_openings_are_shared(self):
+        tutor = PicoTutor(i_ucishell=None)
+        other = PicoTutor(i_ucishell=None)
+        self.assertIs(tutor.openings, other.openings)
+
+    def test_opening_follows_push_and_pop(self):
+        tutor = PicoTutor(i_ucishell=None)
+        for san in ("e4", "e5", "Nf3", "Nc6", "Bc4"):
+            tutor._push_opening_move(san)
+        self.assertEqual(tutor._current_opening()[0], "Italian Game")
+        tutor._push_opening_move("h6")  # leaves the book, later moves can not match again
+        tutor._push_opening_move("Bc5")
+        self.assertEqual(tutor._current_opening()[0], "Italian Game")
+        tutor._pop_opening_move()
+        tutor._pop_opening_move()
+        tutor._pop_opening_move()
+        self.assertEqual(tutor._current_opening(), tutor._find_longest_matching_opening("e4 e5 Nf3 Nc6"))
+
+
+class TestPicotutorAdaptiveMultipv(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def _info(move: str, cp: int, board: chess.Board) -> dict:
+        return {"depth": 12, "pv": [chess.Move.from_uci(move)], "score": PovScore(Cp(cp), board.turn)}
+
+    async def test_missed_user_move_is_searched_alone(self):
+        tutor = PicoTutor(i_ucishell=None, i_adaptive_multipv=True)
+        tutor.watcher_on = True
+        board = chess.Board()
+        tutor.best_engine = MagicMock()
+        tutor.best_engine.loaded_ok.return_value = True
+        tutor.best_engine.analyse_root_moves = AsyncMock(return_value=self._info("g2g4", -90, board))
+        tutor.best_engine.get_analysis = AsyncMock(
+            return_value={"info": [self._info("e2e4", 30, board), self._info("d2d4", 25, board)], "fen": board.fen()}
+        )
+        tutor.obvious_engine = MagicMock()
+        tutor.obvious_engine.get_analysis = AsyncMock(return_value={"info": [], "fen": board.fen()})
+        tutor._start_or_stop_as_needed = AsyncMock()
+
+        board.push_uci("g2g4")
+        await tutor.push_move(chess.Move.from_uci("g2g4"), board)
+
+        limit = tutor.best_engine.analyse_root_moves.call_args.args[1]
+        self.assertEqual(limit.depth, 12)
+        self.assertEqual(tutor.best_engine.analyse_root_moves.call_args.args[2], [chess.Move.from_uci("g2g4")])
+        pv_key, move, score, _ = tutor.best_history[chess.BLACK][-1]
+        self.assertEqual((pv_key, move, score), (2, chess.Move.from_uci("g2g4"), -90))
+        self.assertEqual(tutor.pv_user_move[chess.BLACK], [chess.Move.from_uci("g2g4")])
+
+
+class TestPicotutorLoadedGame(unittest.IsolatedAsyncioTestCase):
+
+    async def test_loaded_game_stays_in_sync(self):
+        # a loaded game reaches the tutor in one set_position, not move by move
+        game = chess.Board()
+        for san in ("e4", "c5", "Nf3"):
+            game.push_san(san)
+        tutor = PicoTutor(i_ucishell=None)
+        await tutor.set_position(game, new_game=True)
+        self.assertEqual(tutor.board.move_stack, game.move_stack)
+        self.assertFalse(tutor.expl_start_position)
+
+        game.push_san("d6")
+        self.assertTrue(await tutor.push_move(game.peek(), game))
+        self.assertEqual(tutor.board.fen(), game.fen())
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+
+import chess
+
+from picotutor import PicoTutor
+from tablebase import TB_WIN_SCORE, TablebaseService, open_tablebase_service
+
+
+class FakeTablebase(object):
+    """KQ vs K: the queen side wins unless the queen hangs, dtz grows with the lone king distance to a8"""
+
+    def __init__(self):
+        self.probed = []
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        self.probed.append(board.fen())
+        if len(board.pieces(chess.ROOK, chess.WHITE)):
+            raise KeyError("no KR vs K table")
+        if board.pieces(chess.QUEEN, board.turn):
+            return 2
+        queens = board.pieces(chess.QUEEN, not board.turn)
+        if queens:
+            return 0 if board.attackers(board.turn, queens.pop()) else -2
+        return 0
+
+    def probe_dtz(self, board: chess.Board) -> int:
+        wdl = self.probe_wdl(board)
+        lone_king = board.king(chess.BLACK if board.pieces(chess.QUEEN, chess.WHITE) else chess.WHITE)
+        distance = 1 + chess.square_distance(lone_king, chess.A8)
+        return 0 if wdl == 0 else distance if wdl > 0 else -distance
+
+    def close(self):
+        pass
+
+
+class TestTablebaseService(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeTablebase()
+        self.service = TablebaseService(self.fake, cache_size=100)
+
+    def test_probe_and_cache(self):
+        board = chess.Board("8/8/8/4k3/8/8/8/Q3K3 w - - 0 1")
+        self.assertEqual(self.service.probe(board), (2, 5))
+        self.assertEqual(self.service.probe(board), (2, 5))
+        self.assertEqual((self.service.probes, self.service.cache_hits), (1, 1))
+
+    def test_not_probed(self):
+        self.assertIsNone(self.service.probe(chess.Board()))  # too many pieces
+        self.assertIsNone(self.service.probe(chess.Board("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1")))  # castling
+        self.assertEqual(self.service.probes, 0)
+        self.assertIsNone(self.service.probe(chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 0 1")))  # missing table
+        self.assertEqual(self.service.probes, 1)
+
+    def test_best_move_mates(self):
+        move, wdl, _ = self.service.best_move(chess.Board("7k/8/5K2/8/8/8/8/6Q1 w - - 0 1"))
+        self.assertEqual(move, chess.Move.from_uci("g1g7"))
+        self.assertEqual(wdl, 2)
+
+    def test_best_move_takes_queen(self):
+        move, wdl, _ = self.service.best_move(chess.Board("8/8/8/8/8/8/3Qk3/7K b - - 0 1"))
+        self.assertEqual(move, chess.Move.from_uci("e2d2"))
+        self.assertEqual(wdl, 0)
+
+    def test_best_move_loss_goes_longest(self):
+        move, wdl, _ = self.service.best_move(chess.Board("8/8/8/8/4k3/8/8/Q6K b - - 0 1"))
+        self.assertEqual(wdl, -2)
+        board = chess.Board("8/8/8/8/4k3/8/8/Q6K b - - 0 1")
+        board.push(move)
+        self.assertEqual(chess.square_distance(board.king(chess.BLACK), chess.A8), 5)  # away from a8
+
+    def test_info(self):
+        board = chess.Board("8/8/8/4k3/8/8/8/Q3K3 b - - 0 1")
+        info = self.service.info(board)
+        self.assertEqual(info["score"].white().score(), TB_WIN_SCORE - 5)
+        self.assertIn(info["pv"][0], board.legal_moves)
+        self.assertIsNone(self.service.info(chess.Board()))
+
+    def test_stats(self):
+        self.service.skipping("engine", True, 2.5)
+        self.service.skipping("tutor", True)
+        self.service.skipping("tutor", False)
+        stats = self.service.get_stats()
+        self.assertEqual(stats["skipped"], {"engine": 1, "tutor": 1})
+        self.assertEqual(stats["time_saved"]["engine"], 2.5)
+        self.assertIn("tutor", stats["time_saved"])
+
+    def test_open_without_tables(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(open_tablebase_service(tmp))
+            self.assertIsNone(open_tablebase_service(os.path.join(tmp, "none")))
+        self.assertIsNone(open_tablebase_service(""))
+
+
+class TestTutorTablebase(unittest.IsolatedAsyncioTestCase):
+    def _tutor(self, fen: str) -> PicoTutor:
+        tutor = PicoTutor(i_ucishell=None)
+        tutor.set_tablebase(TablebaseService(FakeTablebase()))
+        tutor.watcher_on = True
+        tutor.board = chess.Board(fen)
+        return tutor
+
+    def test_blunder(self):
+        tutor = self._tutor("8/8/8/8/8/4k3/8/3QK3 w - - 0 1")
+        tutor.board.push_uci("d1d3")  # queen hangs
+        self.assertEqual(tutor.get_user_move_eval(), ("??", 0))
+        value = list(tutor.get_eval_moves().values())[0]
+        self.assertEqual(value["user_move"], "Qd3+")
+
+    def test_good_enough(self):
+        tutor = self._tutor("8/8/8/8/8/4k3/8/3QK3 w - - 0 1")
+        tutor.board.push_uci("d1a4")
+        self.assertEqual(tutor.get_user_move_eval(), ("", 0))
+        self.assertEqual(tutor.get_eval_moves(), {})
+
+    async def test_analysis_without_engine(self):
+        tutor = self._tutor("8/8/8/8/8/4k3/8/3QK3 w - - 0 1")
+        result = await tutor.get_analysis()
+        self.assertEqual(result["fen"], tutor.board.fen())
+        self.assertEqual(result["info"][0]["score"].white().score(), TB_WIN_SCORE - 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
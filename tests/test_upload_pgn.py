@@ -0,0 +1,113 @@
+import base64
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from dgt.api import Event
+from pgn_index import PgnLibrary
+from upload_pgn import FIXED_FILENAME, MultipartFileReader, UploadHandler
+
+GAMES = """[Event "First"]
+
+1. e4 e5 *
+
+[Event "Second"]
+
+1. d4 d5 *
+
+[Event "Third"]
+
+1. c4 *
+"""
+
+BOUNDARY = "----picochess"
+
+
+def _multipart(filename: str, content: str, game: str = "") -> bytes:
+    parts = [
+        '--{}\r\nContent-Disposition: form-data; name="file"; filename="{}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n{}\r\n".format(BOUNDARY, filename, content)
+    ]
+    if game:
+        parts.append('--{}\r\nContent-Disposition: form-data; name="game"\r\n\r\n{}\r\n'.format(BOUNDARY, game))
+    return ("".join(parts) + "--{}--\r\n".format(BOUNDARY)).encode("utf-8")
+
+
+class TestMultipartFileReader(unittest.TestCase):
+    def test_chunks(self):
+        body = _multipart("games.pgn", GAMES, game="2")
+        for chunk_size in (1, 5, len(body)):
+            data = []
+            reader = MultipartFileReader(BOUNDARY.encode(), data.append)
+            for start in range(0, len(body), chunk_size):
+                reader.feed(body[start : start + chunk_size])
+            self.assertTrue(reader.complete)
+            self.assertEqual(b"".join(data).decode(), GAMES)
+            self.assertEqual(reader.filename, "games.pgn")
+            self.assertEqual(reader.fields, {"game": "2"})
+
+
+class TestUploadHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.library = PgnLibrary(self.tmp.name)
+        return tornado.web.Application(
+            [(r"/upload-pgn", UploadHandler, dict(library=self.library, upload_dir=self.tmp.name))]
+        )
+
+    def setUp(self):
+        super().setUp()
+        pam = patch("upload_pgn.pam.pam")
+        self.addCleanup(pam.stop)
+        pam.start().return_value.authenticate.side_effect = lambda user, password: password == "secret"
+        fire = patch("upload_pgn.Observable.fire", new_callable=AsyncMock)
+        self.addCleanup(fire.stop)
+        self.fire = fire.start()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def _upload(self, body: bytes, password: str = "secret", url: str = "/upload-pgn", content_type: str = ""):
+        auth = base64.b64encode("pi:{}".format(password).encode()).decode()
+        headers = {
+            "Authorization": "Basic " + auth,
+            "Content-Type": content_type or "multipart/form-data; boundary=" + BOUNDARY,
+        }
+        return self.fetch(url, method="POST", body=body, headers=headers)
+
+    def _leftovers(self):
+        return [name for name in os.listdir(self.tmp.name) if name.endswith(".part")]
+
+    def test_upload_collection(self):
+        response = self._upload(_multipart("my games.pgn", GAMES, game="1"))
+        self.assertEqual(response.code, 200)
+        self.assertIn(b"(3 games)", response.body)
+        event = self.fire.call_args[0][0]
+        self.assertIsInstance(event, Event.READ_GAME)
+        self.assertEqual((event.pgn_filename, event.game_index), (FIXED_FILENAME, 1))
+        with open(os.path.join(self.tmp.name, FIXED_FILENAME)) as file:
+            self.assertEqual(file.read(), GAMES)
+        self.assertEqual(self.library.read_game(FIXED_FILENAME, 2).headers["Event"], "Third")
+        self.assertEqual(self._leftovers(), [])
+
+    def test_raw_body(self):
+        response = self._upload(GAMES.encode(), url="/upload-pgn?filename=games.pgn&game=2", content_type="text/plain")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.fire.call_args[0][0].game_index, 2)
+
+    def test_refused(self):
+        self.assertEqual(self._upload(_multipart("games.pgn", GAMES), password="wrong").code, 401)
+        self.assertEqual(self._upload(_multipart("games.txt", GAMES)).code, 400)
+        self.assertEqual(self._upload(_multipart("games.pgn", GAMES, game="3")).code, 400)
+        self.fire.assert_not_called()
+        self.assertEqual(self._leftovers(), [])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, FIXED_FILENAME)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import io
+import unittest
+from unittest.mock import patch
+
+import chess
+import chess.pgn
+
+from dgt.api import Message
+from server import GAME_PROTOCOL_VERSION, WebDisplay
+from utilities import msgdisplay_devices
+
+
+class TestWebDisplayGameMessages(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.shared = {}
+        self.display = WebDisplay(self.shared, asyncio.get_running_loop())
+        self.sent = []
+        patcher = patch("server.EventHandler.write_to_clients", side_effect=self.sent.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        msgdisplay_devices.remove(self.display)
+
+    def _game_messages(self):
+        return [message for message in self.sent if message["event"] in ("Game", "Fen")]
+
+    async def _user_move(self, game: chess.Board, uci: str):
+        move = chess.Move.from_uci(uci)
+        game.push(move)
+        await self.display.task(Message.USER_MOVE_DONE(move=move, fen=game.fen(), turn=game.turn, game=game.copy()))
+
+    async def test_moves_are_sent_as_deltas(self):
+        game = chess.Board()
+        await self.display.task(Message.START_NEW_GAME(game=game.copy(), newgame=True))
+        for uci in ("e2e4", "e7e5", "g1f3"):
+            await self._user_move(game, uci)
+        before = game.copy()
+        game.push_uci("b8c6")
+        await self.display.task(
+            Message.COMPUTER_MOVE(move=game.peek(), ponder=None, game=before, wait=False, is_user_move=False)
+        )
+        await self.display.task(Message.COMPUTER_MOVE_DONE())
+
+        new_game, *moves = self._game_messages()
+        self.assertEqual(new_game["event"], "Game")
+        self.assertIn("pgn", new_game)
+        self.assertEqual([message["san"] for message in moves], ["e4", "e5", "Nf3", "Nc6"])
+        self.assertEqual([message["ply"] for message in moves], [1, 2, 3, 4])
+        for message in moves:
+            self.assertNotIn("pgn", message)
+            self.assertEqual(message["v"], GAME_PROTOCOL_VERSION)
+        self.assertEqual(moves[0]["fen"], "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        self.assertEqual(moves[-1]["play"], "computer")
+        self.assertEqual(moves[-1]["move"], "b8c6")
+
+    async def test_snapshot_holds_the_whole_game(self):
+        game = chess.Board()
+        await self.display.task(Message.START_NEW_GAME(game=game.copy(), newgame=True))
+        for uci in ("d2d4", "d7d5"):
+            await self._user_move(game, uci)
+
+        snapshot = self.display.game_snapshot()
+        self.assertEqual(snapshot["ply"], 2)
+        self.assertTrue(snapshot["pgn"].rstrip().endswith("1. d4 d5 *"))
+        self.assertIs(self.display.game_snapshot(), snapshot)  # exported once per move
+        self.assertNotIn("pgn", self.shared["last_dgt_move_msg"])
+
+        game.pop()
+        await self.display.task(Message.TAKE_BACK(game=game.copy()))
+        take_back = self._game_messages()[-1]
+        self.assertEqual(take_back["play"], "reload")
+        self.assertTrue(take_back["pgn"].rstrip().endswith("1. d4 *"))
+
+    async def test_loaded_game_is_reloaded_with_its_moves(self):
+        # a pgn or journal game is loaded in one go - one START_NEW_GAME holding all moves
+        game = chess.pgn.read_game(io.StringIO("1. e4 c5 2. Nf3 d6 *")).end().board()
+        await self.display.task(Message.START_NEW_GAME(game=game.copy(), newgame=False))
+
+        new_game, reload = self._game_messages()
+        self.assertEqual(new_game["event"], "Game")
+        self.assertEqual(reload["event"], "Fen")
+        self.assertEqual(reload["play"], "reload")
+        self.assertEqual(reload["move"], "d7d6")
+        self.assertEqual(reload["ply"], 4)
+        web_game = chess.pgn.read_game(io.StringIO(reload["pgn"])).end().board()
+        self.assertEqual(web_game.move_stack, game.move_stack)
+        self.assertIs(self.shared["last_dgt_move_msg"], reload)
+
+    async def test_new_game_is_not_reloaded(self):
+        await self.display.task(Message.START_NEW_GAME(game=chess.Board(), newgame=True))
+        self.assertEqual([message["event"] for message in self._game_messages()], ["Game"])
+
+
+if __name__ == "__main__":
+    unittest.main()
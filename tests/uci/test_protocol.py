@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import chess
+import chess.engine
+
+from uci.protocol import ThrottledUciProtocol, popen_uci_throttled
+
+# sends 3 multipv lines per depth plus currmove noise, depth 1..8
+CHATTY_ENGINE = """#!{python}
+import sys
+moves = ["e2e4", "d2d4", "g1f3"]
+while True:
+    cmd = sys.stdin.readline().strip()
+    if cmd == "uci":
+        print("id name Chatty 1")
+        print("option name MultiPV type spin default 1 min 1 max 500")
+        print("uciok")
+    elif cmd == "isready":
+        print("readyok")
+    elif cmd.startswith("go"):
+        print("info string starting")
+        for depth in range(1, 9):
+            print("info depth %d currmove e2e4 currmovenumber 1" % depth)
+            for multipv, move in enumerate(moves, 1):
+                print("info depth %d multipv %d score cp %d nodes 10 pv %s" % (depth, multipv, depth * 10 - multipv, move))
+        print("bestmove e2e4")
+    elif cmd == "quit" or not cmd:
+        break
+    sys.stdout.flush()
+"""
+
+
+class TestThrottledUciProtocol(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine_file = os.path.join(self.tmp.name, "chatty")
+        with open(self.engine_file, "w") as file:
+            file.write(CHATTY_ENGINE.format(python=sys.executable))
+        os.chmod(self.engine_file, os.stat(self.engine_file).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def _analyse(self):
+        transport, engine = await popen_uci_throttled([self.engine_file])
+        posted = []
+        with await engine.analysis(chess.Board(), chess.engine.Limit(depth=8), multipv=3) as analysis:
+            async for info in analysis:
+                posted.append(info)
+            multipv = analysis.multipv
+        await engine.quit()
+        return engine, posted, multipv
+
+    async def test_first_and_final_set_with_long_interval(self):
+        with patch.object(ThrottledUciProtocol, "info_interval", 3600):
+            engine, posted, multipv = await self._analyse()
+        # string info, the first complete set (depth 1) at once and the final set of depth 8
+        self.assertEqual([info.get("depth") for info in posted], [None, 1, 1, 1, 8, 8, 8])
+        self.assertEqual([info["pv"][0].uci() for info in multipv], ["e2e4", "d2d4", "g1f3"])
+        self.assertEqual(multipv[0]["score"].white(), chess.engine.Cp(79))
+        self.assertEqual(engine.passed_infos, 6)
+        self.assertEqual(engine.dropped_infos, 8 + 6 * 3)
+
+    async def test_pending_set_goes_after_the_interval(self):
+        engine = ThrottledUciProtocol()
+        engine.command = object()  # a running search
+        passed = []
+        clock = [100.0]
+
+        def info(depth, multipv):
+            return "info depth %d multipv %d score cp 10 pv e2e4" % (depth, multipv)
+
+        interval = patch.object(ThrottledUciProtocol, "info_interval", 10)
+        monotonic = patch("uci.protocol.time.monotonic", side_effect=lambda: clock[0])
+        handed_over = patch.object(chess.engine.UciProtocol, "_line_received", side_effect=passed.append)
+        with interval, monotonic, handed_over:
+            for depth in (1, 2, 3):
+                engine._line_received(info(depth, 1))
+                engine._line_received(info(depth, 2))
+            # depth 1 went through as first set, depth 2 (complete 0 seconds later) waits
+            self.assertEqual(passed, [info(1, 1), info(1, 2)])
+            clock[0] += 10
+            engine._line_received("info depth 3 currmove e2e4 currmovenumber 1")
+            self.assertEqual(passed[2:], [info(2, 1), info(2, 2)])
+            engine._line_received("bestmove e2e4")
+            self.assertEqual(passed[4:], [info(3, 1), info(3, 2), "bestmove e2e4"])
+
+    async def test_zero_interval_passes_everything(self):
+        with patch.object(ThrottledUciProtocol, "info_interval", 0):
+            engine, posted, multipv = await self._analyse()
+        self.assertEqual(len(posted), 1 + 8 * 4)
+        self.assertEqual(multipv[2]["depth"], 8)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from uci import read
+from uci.read import CATALOGUE_SUFFIX, read_engine_ini, read_uci_file
+
+ENGINES_INI = """[a-test]
+name = Test Engine
+small = test
+medium = Test
+large = Test Eng
+elo = 2000
+"""
+
+TEST_UCI = """[Level@00]
+Skill Level = 0
+
+[Level@20]
+Skill Level = 20
+"""
+
+
+class TestEngineCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        self._write("engines.ini", ENGINES_INI)
+        self._write("a-test.uci", TEST_UCI)
+        read._uci_cache.clear()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        with open(os.path.join(self.path, name), "w") as file:
+            file.write(content)
+        # make sure a rewrite within the same clock tick still changes the mtime
+        stamp = time.time_ns() + len(content)
+        os.utime(os.path.join(self.path, name), ns=(stamp, stamp))
+
+    def test_catalogue_written_and_reused(self):
+        library = read_engine_ini(engine_path=self.path)
+        self.assertTrue(os.path.isfile(os.path.join(self.path, "engines.ini" + CATALOGUE_SUFFIX)))
+        with patch("uci.read.configparser.ConfigParser") as parser_mock:
+            cached = read_engine_ini(engine_path=self.path)
+            parser_mock.assert_not_called()
+        self.assertEqual(library[0]["level_dict"], cached[0]["level_dict"])
+        self.assertEqual(cached[0]["level_dict"]["Level@20"], {"Skill Level": "20"})
+        self.assertEqual(cached[0]["text"].large_text, "Test Eng")
+        self.assertEqual(cached[0]["text"].web_text, "Test Eng")
+        self.assertEqual(cached[0]["name"], "Test Engine")
+
+    def test_catalogue_invalidated_by_uci_change(self):
+        read_engine_ini(engine_path=self.path)
+        self._write("a-test.uci", "[Level@05]\nSkill Level = 5\n")
+        library = read_engine_ini(engine_path=self.path)
+        self.assertEqual(library[0]["level_dict"], {"Level@05": {"Skill Level": "5"}})
+        self.assertEqual(read_uci_file(library[0]["file"] + ".uci"), {"Level@05": {"Skill Level": "5"}})
+
+    def test_catalogue_invalidated_by_ini_change(self):
+        read_engine_ini(engine_path=self.path)
+        self._write("engines.ini", ENGINES_INI.replace("elo = 2000", "elo = 2100"))
+        library = read_engine_ini(engine_path=self.path)
+        self.assertEqual(library[0]["elo"], "2100")
+
+    def test_broken_catalogue_is_ignored(self):
+        self._write("engines.ini" + CATALOGUE_SUFFIX, "{not json")
+        library = read_engine_ini(engine_path=self.path)
+        self.assertEqual(library[0]["name"], "Test Engine")
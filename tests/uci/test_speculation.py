@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+import chess
+from chess.engine import Limit
+
+from uci.engine import UciEngine, UciShell
+from uci.speculation import Speculation
+
+# logs the commands it gets, always answers e7e5
+LOGGING_ENGINE = """#!{python}
+import sys
+log = open({log!r}, "a")
+while True:
+    cmd = sys.stdin.readline().strip()
+    log.write(cmd + "\\n")
+    log.flush()
+    if cmd == "uci":
+        print("id name Logger 1")
+        print("option name Hash type spin default 16 min 1 max 1024")
+        print("uciok")
+    elif cmd == "isready":
+        print("readyok")
+    elif cmd.startswith("go"):
+        print("info depth 5 score cp 20 pv e7e5 g1f3")
+        print("bestmove e7e5 ponder g1f3")
+    elif cmd == "quit" or not cmd:
+        break
+    sys.stdout.flush()
+"""
+
+# searches until it gets a stop
+STOPPING_ENGINE = """#!{python}
+import sys
+while True:
+    cmd = sys.stdin.readline().strip()
+    if cmd == "uci":
+        print("id name Stopper 1")
+        print("uciok")
+    elif cmd == "isready":
+        print("readyok")
+    elif cmd.startswith("go"):
+        print("info depth 1 score cp 20 pv e7e5")
+    elif cmd == "stop":
+        print("bestmove e7e5")
+    elif cmd == "quit" or not cmd:
+        break
+    sys.stdout.flush()
+"""
+
+E2E4 = chess.Move.from_uci("e2e4")
+D2D4 = chess.Move.from_uci("d2d4")
+
+
+class FakeEngine(object):
+    """searches for the limit time, answers e7e5 / d7d5"""
+
+    def __init__(self):
+        self.searches = []  # (fen, time)
+        self.busy = 0.0
+
+    async def speculate(self, game: chess.Board, limit):
+        self.searches.append((game.fen(), limit.time))
+        started = time.monotonic()
+        await asyncio.sleep(limit.time)
+        self.busy += time.monotonic() - started
+        reply = "e7e5" if game.piece_at(chess.E4) else "d7d5"
+        return {"pv": [chess.Move.from_uci(reply)], "depth": 10}
+
+
+async def predict_e4_d4():
+    return [E2E4, D2D4, chess.Move.from_uci("g1f3")]
+
+
+def board_after(*moves) -> chess.Board:
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+    return board
+
+
+class TestSpeculation(unittest.IsolatedAsyncioTestCase):
+    async def test_hit_and_miss(self):
+        engine = FakeEngine()
+        speculation = Speculation(max_moves=2, cpu_share=100, slice_time=0.01)
+        speculation.start(engine, chess.Board(), predict_e4_d4, max_time=0.04)
+        await asyncio.sleep(0.3)
+        # only the top two moves, each search twice as long until max_time
+        self.assertEqual({fen for fen, _ in engine.searches}, {board_after(E2E4).fen(), board_after(D2D4).fen()})
+        self.assertEqual(sorted({search_time for _, search_time in engine.searches}), [0.01, 0.02, 0.04])
+        info, search_time = await speculation.take(board_after(E2E4))
+        self.assertEqual(info["pv"][0], chess.Move.from_uci("e7e5"))
+        self.assertEqual(search_time, 0.04)
+        self.assertTrue(speculation._task is None)
+
+        e7e5 = chess.Move.from_uci("e7e5")
+        speculation.start(engine, board_after(E2E4, e7e5), predict_e4_d4)
+        self.assertIsNone(await speculation.take(board_after(E2E4, e7e5, chess.Move.from_uci("a2a3"))))
+        self.assertEqual(speculation.get_stats()["hits"], 1)
+        self.assertEqual(speculation.get_stats()["misses"], 1)
+        self.assertEqual(speculation.get_stats()["hit_rate"], 0.5)
+
+    async def test_take_without_speculation_is_not_counted(self):
+        speculation = Speculation(max_moves=2)
+        self.assertIsNone(await speculation.take(board_after(E2E4)))
+        self.assertEqual(speculation.get_stats()["moves"], 0)
+
+    async def test_cpu_share(self):
+        engine = FakeEngine()
+        speculation = Speculation(max_moves=2, cpu_share=25, slice_time=0.02)
+        speculation.start(engine, chess.Board(), predict_e4_d4, max_time=10.0)
+        started = time.monotonic()
+        await asyncio.sleep(0.5)
+        await speculation.stop()
+        self.assertLess(engine.busy / (time.monotonic() - started), 0.4)
+
+    async def test_busy_engine_ends_speculation(self):
+        class BusyEngine(object):
+            async def speculate(self, game, limit):
+                return None
+
+        speculation = Speculation(max_moves=2, slice_time=0.01)
+        speculation.start(BusyEngine(), chess.Board(), predict_e4_d4)
+        await asyncio.sleep(0.05)
+        self.assertTrue(speculation._task.done())
+
+
+class TestEngineSpeculate(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine_file = os.path.join(self.tmp.name, "logger")
+        self.log_file = os.path.join(self.tmp.name, "commands.log")
+        with open(self.engine_file, "w") as file:
+            file.write(LOGGING_ENGINE.format(python=sys.executable, log=self.log_file))
+        os.chmod(self.engine_file, os.stat(self.engine_file).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_engine(self, script: str) -> str:
+        engine_file = os.path.join(self.tmp.name, "stopper")
+        with open(engine_file, "w") as file:
+            file.write(script.format(python=sys.executable))
+        os.chmod(engine_file, os.stat(engine_file).st_mode | stat.S_IXUSR)
+        return engine_file
+
+    async def test_new_game_during_speculation(self):
+        engine = UciEngine(self._write_engine(STOPPING_ENGINE), UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        await engine.startup({})
+        speculation = Speculation(max_moves=1, slice_time=30.0)
+        speculation.start(engine, chess.Board(), predict_e4_d4, max_time=30.0)
+        while not engine.engine_lock.locked():
+            await asyncio.sleep(0.01)
+        self.assertTrue(engine.is_waiting())  # the speculative search does not count as thinking
+
+        # what stop_search_and_clock does before a new game
+        started = time.monotonic()
+        await speculation.stop()
+        await asyncio.wait_for(engine.newgame(chess.Board()), 5)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertIsNone(speculation._task)
+        await engine.quit()
+
+    async def test_speculate_keeps_engine_game(self):
+        engine = UciEngine(self.engine_file, UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        await engine.startup({})
+        info = await engine.speculate(board_after(E2E4), Limit(time=0.1))
+        self.assertEqual(info["pv"][0], chess.Move.from_uci("e7e5"))
+        result_queue = asyncio.Queue()
+        await engine.go({"movetime": 100}, board_after(E2E4), result_queue, None)
+        result = await asyncio.wait_for(result_queue.get(), 10)
+        self.assertEqual(result.move, chess.Move.from_uci("e7e5"))
+        await engine.quit()
+        with open(self.log_file) as file:
+            commands = file.read().splitlines()
+        # hash survives: no ucinewgame between the speculative search and the engine move
+        self.assertEqual(commands.count("ucinewgame"), 1)
+        self.assertLess(commands.index("ucinewgame"), commands.index("go movetime 100"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+import chess
+
+from uci.engine import UciEngine, UciShell
+from uci.supervisor import corrected_time_dict
+
+# crashes on its first go, plays e2e4 once it was restarted
+CRASHING_ENGINE = """#!{python}
+import os, sys
+marker = {marker!r}
+while True:
+    cmd = sys.stdin.readline().strip()
+    if cmd == "uci":
+        print("id name Crashy 1")
+        print("option name Hash type spin default 16 min 1 max 1024")
+        print("uciok")
+    elif cmd == "isready":
+        print("readyok")
+    elif cmd.startswith("go"):
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            os._exit(3)
+        print("bestmove e2e4")
+    elif cmd == "quit" or not cmd:
+        break
+    sys.stdout.flush()
+"""
+
+# counts the isready commands it gets, like pgn_engine answers them with its name first
+PGN_ENGINE = """#!{python}
+import sys
+pings = 0
+while True:
+    cmd = sys.stdin.readline().strip()
+    if cmd == "uci":
+        print("id name PGN Replay")
+        print("uciok")
+    elif cmd == "isready":
+        pings += 1
+        with open({pings!r}, "w") as file:
+            file.write(str(pings))
+        print("id name PGN Replay")
+        print("readyok")
+    elif cmd == "quit" or not cmd:
+        break
+    sys.stdout.flush()
+"""
+
+
+class TestCorrectedTimeDict(unittest.TestCase):
+    def test_time_spent_is_taken_from_side_to_move(self):
+        board = chess.Board()
+        corrected = corrected_time_dict({"wtime": "60000", "btime": 50000, "winc": 0}, board, 2.5)
+        self.assertEqual(corrected, {"wtime": 57500, "btime": 50000, "winc": 0})
+        board.push_san("e4")
+        corrected = corrected_time_dict({"wtime": 60000, "btime": 50000}, board, 1.0)
+        self.assertEqual(corrected["btime"], 49000)
+
+    def test_clock_never_goes_below_minimum(self):
+        corrected = corrected_time_dict({"movetime": 1000}, chess.Board(), 5.0)
+        self.assertEqual(corrected["movetime"], 100)
+
+
+class TestEngineSupervisor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine_file = os.path.join(self.tmp.name, "crashy")
+        with open(self.engine_file, "w") as file:
+            file.write(CRASHING_ENGINE.format(python=sys.executable, marker=self.engine_file + ".crashed"))
+        os.chmod(self.engine_file, os.stat(self.engine_file).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_pending_go_survives_crash(self):
+        engine = UciEngine(self.engine_file, UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        self.assertTrue(engine.loaded_ok())
+        await engine.startup({"Hash": "32"})
+        result_queue = asyncio.Queue()
+        await engine.go({"wtime": 60000, "btime": 60000}, chess.Board(), result_queue, None)
+        result = await asyncio.wait_for(result_queue.get(), 10)
+        self.assertIsNotNone(result)
+        self.assertEqual(result.move, chess.Move.from_uci("e2e4"))
+        self.assertEqual(engine.get_crash_stats(), {"crashes": 1, "respawns": 1})
+        await engine.quit()
+
+    async def test_go_during_respawn_is_answered(self):
+        open(self.engine_file + ".crashed", "w").close()  # no crash, just the respawn
+        engine = UciEngine(self.engine_file, UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        await engine.startup({"Hash": "16"})
+        respawn = asyncio.create_task(engine.respawn())
+        await asyncio.sleep(0)  # the respawn holds the engine lock now
+        result_queue = asyncio.Queue()
+        await engine.go({"movetime": 100}, chess.Board(), result_queue, None)
+        self.assertTrue(await respawn)
+        result = await asyncio.wait_for(result_queue.get(), 10)
+        self.assertEqual(result.move, chess.Move.from_uci("e2e4"))
+        await engine.quit()
+
+    async def test_unhandled_crash_answers_none(self):
+        engine = UciEngine(self.engine_file, UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        await engine.startup({"Hash": "16"})
+        engine.supervisor.stop()  # no respawn, the move task has to answer itself
+        result_queue = asyncio.Queue()
+        await engine.go({"movetime": 100}, chess.Board(), result_queue, None)
+        self.assertIsNone(await asyncio.wait_for(result_queue.get(), 10))
+        self.assertEqual(engine.get_crash_stats(), {"crashes": 0, "respawns": 0})
+
+
+class TestHelperEngineCheck(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine_file = os.path.join(self.tmp.name, "pgn_engine")
+        self.pings_file = self.engine_file + ".pings"
+        with open(self.engine_file, "w") as file:
+            file.write(PGN_ENGINE.format(python=sys.executable, pings=self.pings_file))
+        os.chmod(self.engine_file, os.stat(self.engine_file).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _pings(self) -> str:
+        with open(self.pings_file) as file:
+            return file.read()
+
+    async def test_pgn_engine_gets_no_ping(self):
+        engine = UciEngine(self.engine_file, UciShell(), "", asyncio.get_running_loop())
+        await engine.open_engine()
+        await engine.startup({})
+        self.assertTrue(engine.is_helper_engine())
+        pings = self._pings()
+        await engine.supervisor._check()
+        self.assertEqual(self._pings(), pings)
+
+        engine.transport.kill()  # the exit is still noticed
+        while engine.transport.get_returncode() is None:
+            await asyncio.sleep(0.01)
+        await engine.supervisor._check()
+        self.assertEqual(engine.get_crash_stats()["crashes"], 1)
+        await engine.quit()
+
+    def test_online_engine_is_a_helper(self):
+        engine = UciEngine("engines/x86_64/online", UciShell(), "", None)
+        self.assertFalse(engine.is_helper_engine())
+        engine.eng_long_name = "Online lichess"
+        self.assertTrue(engine.is_helper_engine())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import configparser
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from uci.write import PROBE_CACHE, write_engine_ini
+
+FAKE_ENGINE = """#!{python}
+import sys
+for line in sys.stdin:
+    cmd = line.strip()
+    if cmd == "uci":
+        print("id name Stockfish 17 Test")
+        print("option name Hash type spin default 16 min 1 max 1024")
+        print("option name Skill Level type spin default 3 min 0 max 3")
+        print("uciok")
+    elif cmd == "isready":
+        print("readyok")
+    elif cmd == "quit":
+        break
+    sys.stdout.flush()
+"""
+
+
+class TestWriteEngineIni(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        engine_file = os.path.join(self.path, "a-fake")
+        with open(engine_file, "w") as file:
+            file.write(FAKE_ENGINE.format(python=sys.executable))
+        os.chmod(engine_file, os.stat(engine_file).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read(self, name):
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read(os.path.join(self.path, name))
+        return config
+
+    def test_writes_engines_and_levels(self):
+        write_engine_ini(engine_path=self.path, max_workers=2)
+        engines = self._read("engines.ini")
+        self.assertEqual(engines["a-fake"]["name"], "Stockfish 17 Test")
+        self.assertEqual(engines["a-fake"]["elo"], "3360")
+        with open(os.path.join(self.path, "engines.ini")) as file:
+            self.assertIn(";Hash = 16", file.read())
+        levels = self._read("a-fake.uci")
+        self.assertEqual(levels.sections(), ["Level@00", "Level@01", "Level@02", "Level@03"])
+        self.assertTrue(os.path.isfile(os.path.join(self.path, PROBE_CACHE)))
+
+    def test_unchanged_engine_is_not_probed_again(self):
+        write_engine_ini(engine_path=self.path)
+        with open(os.path.join(self.path, "engines.ini")) as file:
+            first = file.read()
+        with patch("uci.write.concurrent.futures.ProcessPoolExecutor") as pool_mock:
+            write_engine_ini(engine_path=self.path)
+            pool_mock.assert_not_called()
+        with open(os.path.join(self.path, "engines.ini")) as file:
+            self.assertEqual(first, file.read())
+
+    def test_touched_engine_with_same_content_is_not_probed_again(self):
+        write_engine_ini(engine_path=self.path)
+        os.utime(os.path.join(self.path, "a-fake"), (1, 1))
+        with patch("uci.write.concurrent.futures.ProcessPoolExecutor") as pool_mock:
+            write_engine_ini(engine_path=self.path)
+            pool_mock.assert_not_called()
@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ["engine", "informer", "read", "write"]
+__all__ = ["engine", "informer", "protocol", "read", "supervisor", "write"]
 __author__ = "Jürgen Précour"
 __email__ = "LocutusOfPenguin@posteo.de"
 __version__ = "0.9m"
@@ -31,6 +31,9 @@ import chess.engine  # type: ignore
 from chess.engine import InfoDict, Limit, UciProtocol, AnalysisResult, PlayResult
 from chess import Board  # type: ignore
 from uci.rating import Rating, Result
+from uci.protocol import popen_uci_throttled
+from uci.read import read_uci_file
+from uci.supervisor import EngineSupervisor
 from utilities import write_picochess_ini
 
 FLOAT_ANALYSIS_WAIT = 0.1  # save CPU in ContinuousAnalysis
@@ -39,6 +42,8 @@ UCI_ELO = "UCI_Elo"
 UCI_ELO_NON_STANDARD = "UCI Elo"
 UCI_ELO_NON_STANDARD2 = "UCI_Limit"
 
+ONLINE_PREFIX = "Online"  # name of the online game engines
+
 logger = logging.getLogger(__name__)
 
 
@@ -143,6 +148,9 @@ class ContinuousAnalysis:
         self._idle = True  # start with Engine marked as idle
         self.game_id = 1  # signal ucinewgame to engine when this game id changes
         self.current_game_id = 1  # latest game_id being analysed
+        self.move_pending = False  # True while a play request has not been answered
+        self.crashed = False  # True when the engine died during analysis
+        self.on_terminated = None  # async callback(analyser, reason) when the engine process died
         if not self.engine:
             logger.error("%s ContinuousAnalysis initialised without engine", self.whoami)
 
@@ -161,6 +169,7 @@ class ContinuousAnalysis:
         """async task to ask the engine for a move - to avoid blocking result is put in queue"""
         try:
             self._idle = False  # engine is going to be busy now
+            self.move_pending = True
             r_info = chess.engine.INFO_SCORE | chess.engine.INFO_PV | chess.engine.INFO_BASIC
             result = await self.engine.play(
                 board=copy.deepcopy(game),
@@ -171,8 +180,16 @@ class ContinuousAnalysis:
                 root_moves=root_moves,
             )
             await result_queue.put(result)
+            self.move_pending = False
             self._idle = True  # engine idle again
+        except chess.engine.EngineTerminatedError:
+            self._idle = True
+            # a supervisor respawns the engine and either reissues the go or answers None
+            if self.on_terminated is None or not await self.on_terminated(self, "terminated while thinking"):
+                self.move_pending = False
+                await result_queue.put(None)
         except chess.engine.EngineError:
+            self.move_pending = False
             await result_queue.put(None)
             self._idle = True  # engine idle again
 
@@ -252,6 +269,9 @@ class ContinuousAnalysis:
                 # have to stop analysing
                 self._task = None
                 self._running = False
+                self.crashed = True
+                if self.on_terminated is not None:
+                    await self.on_terminated(self, "terminated while analysing")
             except chess.engine.AnalysisComplete:
                 logger.debug("ContinuousAnalyser ran out of information")
                 asyncio.sleep(self.delay * 2)  # maybe it helps to wait some extra?
@@ -451,6 +471,7 @@ class UciEngine(object):
         self.file = file
         self.mame_par = mame_par
         self.is_mame = "/mame/" in self.file
+        self.is_pgn_engine = "pgn_" in self.file  # pgn replay engine, same test as pgn_mode() of picochess
         self.transport = None  # find out correct type
         self.engine: UciProtocol | None = None
         self.engine_name = "NN"
@@ -461,6 +482,7 @@ class UciEngine(object):
         self.shell = None  # check if uci files can be used any more
         self.whoami = engine_debug_name
         self.engine_lock = asyncio.Lock()
+        self.supervisor: EngineSupervisor | None = None
 
     async def open_engine(self):
         """Open engine. Call after __init__"""
@@ -472,11 +494,17 @@ class UciEngine(object):
                 mfile = [self.file]
             logger.info("mfile %s", mfile)
             logger.info("opening engine")
-            self.transport, self.engine = await chess.engine.popen_uci(mfile)
+            self.transport, self.engine = await popen_uci_throttled(mfile)
             self.analyser = ContinuousAnalysis(
                 engine=self.engine, delay=FLOAT_ANALYSIS_WAIT, loop=self.loop, engine_debug_name=self.whoami
             )
             if self.engine:
+                if not self.is_mame:
+                    # mame emulations are restarted by the user, all other engines are supervised
+                    if self.supervisor is None:
+                        self.supervisor = EngineSupervisor(self, self.loop)
+                    self.analyser.on_terminated = self._on_analyser_terminated
+                    self.supervisor.start()
                 if "name" in self.engine.id:
                     self.engine_name = self.eng_long_name = self.engine.id["name"]
                     i = self.engine_name.find(" ")
@@ -491,6 +519,43 @@ class UciEngine(object):
         except chess.engine.EngineTerminatedError:
             logger.exception("engine terminated - could not execute file %s", self.file)
 
+    async def _on_analyser_terminated(self, analyser: ContinuousAnalysis, reason: str) -> bool:
+        """forward a dead engine to the supervisor - unless it was an old, already replaced process
+        returns True if the supervisor answers the pending go"""
+        if self.supervisor is not None and analyser is self.analyser:
+            return await self.supervisor.on_crash(reason)
+        return False
+
+    async def respawn(self) -> bool:
+        """Restart a dead engine process with the same options and restore its analysis.
+        The engine lock is held throughout - a go waits for the new process instead of finding none."""
+        async with self.engine_lock:
+            old_analyser = self.analyser
+            restore = old_analyser is not None and (old_analyser.is_running() or old_analyser.crashed)
+            if old_analyser is not None and old_analyser.is_running():
+                old_analyser.cancel()
+            if self.transport is not None:
+                try:
+                    self.transport.close()  # kills a hung process
+                except OSError:
+                    pass
+            self.engine = None
+            await self.open_engine()
+            if not self.loaded_ok():
+                return False
+            await self.send()  # same options as before the crash
+            if old_analyser is not None:
+                self.analyser.game_id = old_analyser.game_id
+                if restore and old_analyser.game is not None:
+                    self.analyser.start(old_analyser.game, limit=old_analyser.limit, multipv=old_analyser.multipv)
+            return True
+
+    def get_crash_stats(self) -> dict:
+        """Return how often the engine crashed and was respawned."""
+        if self.supervisor is None:
+            return {"crashes": 0, "respawns": 0}
+        return self.supervisor.get_stats()
+
     def loaded_ok(self) -> bool:
         """check if engine was loaded ok"""
         return self.engine is not None
@@ -556,6 +621,13 @@ class UciEngine(object):
         """Return engine strength support."""
         return "Strength" in self.engine.options
 
+    def plays_full_strength(self) -> bool:
+        """Return True if no level option weakens the engine - its search result is then the move it plays."""
+        for option in ("Skill Level", "Handicap Level", "Strength", "PicoDepth", "PicoNode"):
+            if option in self.options:
+                return False
+        return str(self.options.get("UCI_LimitStrength", "false")).lower() == "false"
+
     def has_chess960(self):
         """Return chess960 support."""
         return "UCI_Chess960" in self.engine.options
@@ -570,6 +642,8 @@ class UciEngine(object):
 
     async def quit(self):
         """Quit engine."""
+        if self.supervisor is not None:
+            self.supervisor.stop()  # quitting on purpose is no crash
         if self.analyser.is_running():
             self.analyser.cancel()  # quit can force full cancel
         await self.engine.quit()  # Ask nicely
@@ -679,15 +753,18 @@ class UciEngine(object):
     ) -> None:
         """Go engine.
         parameter game will not change, it is deep copied"""
-        if self.engine:
-            async with self.engine_lock:
-                limit: Limit = self.get_engine_limit(time_dict)  # time restrictions
-                self.get_engine_uci_options(time_dict, limit)  # possibly restrict Node/Depth
-                await self.analyser.play_move(
-                    game, limit=limit, ponder=self.pondering, result_queue=result_queue, root_moves=root_moves
-                )
-        else:
-            logger.error("go called but no engine loaded")
+        async with self.engine_lock:  # waits for a respawn in progress
+            if not self.engine:
+                logger.error("go called but no engine loaded")
+                await result_queue.put(None)  # the caller waits for an answer
+                return
+            limit: Limit = self.get_engine_limit(time_dict)  # time restrictions
+            self.get_engine_uci_options(time_dict, limit)  # possibly restrict Node/Depth
+            if self.supervisor is not None:
+                self.supervisor.remember_go(time_dict, game, result_queue, root_moves)
+            await self.analyser.play_move(
+                game, limit=limit, ponder=self.pondering, result_queue=result_queue, root_moves=root_moves
+            )
 
     async def start_analysis(self, game: chess.Board, limit: Limit | None = None, multipv: int | None = None) -> bool:
         """start analyser - returns True if if it was already running
@@ -759,6 +836,33 @@ class UciEngine(object):
             info = None
         return info
 
+    async def analyse_root_moves(
+        self, game: Board, limit: Limit, root_moves: Iterable[chess.Move]
+    ) -> InfoDict | None:
+        """One-off analysis restricted to root_moves (uci searchmoves).
+        The background analyser is stopped - restart it with start_analysis"""
+        self.stop_analysis()
+        try:
+            async with self.engine_lock:
+                info = await self.engine.analyse(copy.deepcopy(game), limit, root_moves=list(root_moves))
+        except chess.engine.EngineError as e:
+            logger.warning("%s searchmoves analysis failed: %s", self.whoami, e)
+            info = None
+        return info
+
+    async def speculate(self, game: Board, limit: Limit) -> InfoDict | None:
+        """Short search on a position the user may create, returns None if the engine is busy.
+        Sent as the same uci game as the engine moves, so the engine keeps its hash"""
+        if not self.engine or not self.analyser.is_idle() or self.analyser.is_running():
+            return None
+        try:
+            async with self.engine_lock:
+                info = await self.engine.analyse(copy.deepcopy(game), limit, game=self.analyser.game_id)
+        except chess.engine.EngineError as e:
+            logger.debug("speculative search failed: %s", e)
+            info = None
+        return info
+
     def is_thinking(self):
         """Engine thinking."""
         # @ todo check if self.pondering should be removed
@@ -775,6 +879,10 @@ class UciEngine(object):
         """Engine waiting."""
         return self.analyser.is_idle()
 
+    def is_helper_engine(self) -> bool:
+        """pgn replay and online game engines - they do not search, isready runs their game logic again"""
+        return self.is_pgn_engine or self.eng_long_name.startswith(ONLINE_PREFIX)
+
     def is_ready(self):
         """Engine waiting."""
         return True  # should not be needed any more
@@ -807,20 +915,20 @@ class UciEngine(object):
 
     async def startup(self, options: dict, rating: Optional[Rating] = None):
         """Startup engine."""
-        parser = configparser.ConfigParser()
-
         if not options:
             if self.shell is None:
-                success = bool(parser.read(self.get_file() + ".uci"))
+                # same parse as the engine catalogue, reused while the .uci file is unchanged
+                level_dict = read_uci_file(self.get_file() + ".uci")
+                if level_dict:
+                    options = dict(level_dict[list(level_dict).pop()])
             else:
+                parser = configparser.ConfigParser()
                 try:
                     with self.shell.open(self.get_file() + ".uci", "r") as file:
                         parser.read_file(file)
-                    success = True
+                    options = dict(parser[parser.sections().pop()])
                 except FileNotFoundError:
-                    success = False
-            if success:
-                options = dict(parser[parser.sections().pop()])
+                    pass
 
         self.level_support = bool(options)
 
@@ -0,0 +1,121 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import time
+from typing import List, Union
+
+from chess.engine import UciProtocol  # type: ignore
+
+INFO_INTERVAL = 0.5  # default seconds between two parsed multipv sets, 0 passes every info line
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottledUciProtocol(UciProtocol):
+    """UciProtocol that only lets complete multipv sets through to python-chess.
+
+    Info lines are kept as raw strings per multipv index. When a new depth starts
+    the previous set is complete. The first complete set of a search is handed
+    over (and parsed) at once, later ones wait as pending set until info_interval
+    seconds passed since the last hand over - a newer complete set replaces the
+    pending one, the pending one goes with the first engine line after the
+    interval. The latest lines are always handed over before any other engine
+    output (bestmove).
+    """
+
+    info_interval: float = INFO_INTERVAL  # picochess sets this from the ini file
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._infos: dict[int, str] = {}  # multipv index -> latest raw info line
+        self._pending: dict[int, str] = {}  # newest complete set not handed over yet
+        self._infos_depth = -1
+        self._infos_command = None
+        self._last_flush = 0.0
+        self.passed_infos = 0
+        self.dropped_infos = 0
+
+    def _line_received(self, line: str) -> None:
+        if self.info_interval > 0 and self.command is not None:
+            if line.startswith("info "):
+                self._throttle_info(line)
+                return
+            self._flush_infos(final=True)  # final set before bestmove, readyok, ...
+        super()._line_received(line)
+
+    def _throttle_info(self, line: str) -> None:
+        if self._infos_command is not self.command:
+            self._infos.clear()  # left over from a search that ended without bestmove
+            self._pending.clear()
+            self._infos_depth = -1
+            self._infos_command = self.command
+            self._last_flush = float("-inf")  # the first complete set of a search goes through at once
+        if self._pending and time.monotonic() - self._last_flush >= self.info_interval:
+            self._flush_infos()
+        tokens = line.split()
+        if len(tokens) > 1 and tokens[1] == "string":
+            super()._line_received(line)
+            return
+        if "pv" not in tokens:
+            self.dropped_infos += 1  # currmove, nodes, hashfull... nothing the analysis keeps
+            return
+        depth = self._token_int(tokens, "depth", self._infos_depth)
+        multipv = self._token_int(tokens, "multipv", 1)
+        if depth != self._infos_depth and multipv == 1 and self._infos:
+            # previous depth is complete, it replaces an older set still waiting
+            self.dropped_infos += len(self._pending)
+            self._pending, self._infos = self._infos, {}
+            if time.monotonic() - self._last_flush >= self.info_interval:
+                self._flush_infos()
+        self._infos_depth = depth
+        if multipv in self._infos:
+            self.dropped_infos += 1
+        self._infos[multipv] = line
+
+    @staticmethod
+    def _token_int(tokens: List[str], name: str, default: int) -> int:
+        try:
+            return int(tokens[tokens.index(name) + 1])
+        except (ValueError, IndexError):
+            return default
+
+    def _flush_infos(self, final: bool = False) -> None:
+        """Hand over the pending set - the final flush adds the lines of the current depth."""
+        lines = self._pending
+        if final:
+            self.dropped_infos += len(lines.keys() & self._infos.keys())
+            lines.update(self._infos)  # the newer depth wins, multipv lines it has not reached yet stay
+            self._infos.clear()
+        if not lines:
+            return
+        infos = [lines[multipv] for multipv in sorted(lines)]
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self.passed_infos += len(infos)
+        for info in infos:
+            super()._line_received(info)
+
+
+async def popen_uci_throttled(
+    command: Union[str, List[str]], **popen_args
+) -> tuple[asyncio.SubprocessTransport, ThrottledUciProtocol]:
+    """Same as chess.engine.popen_uci but with the info throttling protocol."""
+    transport, protocol = await ThrottledUciProtocol.popen(command, **popen_args)
+    try:
+        await protocol.initialize()
+    except:  # noqa - same cleanup as chess.engine.popen_uci
+        transport.close()
+        raise
+    return transport, protocol
@@ -15,28 +15,132 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
 import platform
 import configparser
 import os
+from typing import Optional
+
 from dgt.api import Dgt
 
 
 logger = logging.getLogger(__name__)
 
+CATALOGUE_VERSION = 1  # bump when the layout of the compiled catalogue changes
+CATALOGUE_SUFFIX = ".cache.json"
+
+# parsed .uci files of this process: path -> (mtime_ns, level_dict)
+_uci_cache: dict[str, tuple[Optional[int], dict[str, dict]]] = {}
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _make_text(text: dict) -> Dgt.DISPLAY_TEXT:
+    return Dgt.DISPLAY_TEXT(
+        web_text=text["web_text"],
+        large_text=text["large_text"],
+        medium_text=text["medium_text"],
+        small_text=text["small_text"],
+        wait=True,
+        beep=False,
+        maxtime=0,
+        devs={"ser", "i2c", "web"},
+    )
+
 
-def read_engine_ini(engine_shell=None, engine_path=None, filename=None) -> list[dict[str, str]]:
+def _parse_uci_file(uci_file: str) -> dict[str, dict]:
+    """Parse a local .uci file into a {level: {option: value}} dict (empty if missing)."""
+    parser = configparser.ConfigParser()
+    parser.optionxform = str  # type: ignore
+    level_dict: dict[str, dict] = {}
+    if parser.read(uci_file):
+        for p_section in parser.sections():
+            level_dict[p_section] = dict(parser[p_section])
+    return level_dict
+
+
+def read_uci_file(uci_file: str) -> dict[str, dict]:
+    """Return the levels of a local .uci file, reparsing it only when its mtime changed."""
+    mtime = _mtime_ns(uci_file)
+    cached = _uci_cache.get(uci_file)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, _parse_uci_file(uci_file) if mtime is not None else {})
+        _uci_cache[uci_file] = cached
+    return cached[1]
+
+
+def _load_catalogue(engine_path: str, filename: str) -> Optional[list[dict]]:
+    """Load the compiled catalogue if neither the ini nor any of its .uci files changed."""
+    try:
+        with open(engine_path + os.sep + filename + CATALOGUE_SUFFIX, "r", encoding="utf-8") as cache_file:
+            catalogue = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(catalogue, dict) or catalogue.get("version") != CATALOGUE_VERSION:
+        return None
+    if catalogue.get("ini_mtime") != _mtime_ns(engine_path + os.sep + filename):
+        return None
+    for entry in catalogue["engines"]:
+        if entry["uci_mtime"] != _mtime_ns(entry["file"] + ".uci"):
+            return None
+    return catalogue["engines"]
+
+
+def _save_catalogue(engine_path: str, filename: str, ini_mtime: Optional[int], entries: list[dict]):
+    """Write the compiled catalogue next to the ini file - failing to do so is not fatal."""
+    cache_name = engine_path + os.sep + filename + CATALOGUE_SUFFIX
+    catalogue = {"version": CATALOGUE_VERSION, "ini_mtime": ini_mtime, "engines": entries}
+    try:
+        with open(cache_name + ".tmp", "w", encoding="utf-8") as cache_file:
+            json.dump(catalogue, cache_file)
+        os.replace(cache_name + ".tmp", cache_name)
+    except OSError as exc:
+        logger.debug("could not write engine catalogue %s: %s", cache_name, exc)
+
+
+def _library_from_catalogue(entries: list[dict]) -> list[dict]:
+    library = []
+    for entry in entries:
+        if entry["uci_mtime"] is not None:
+            _uci_cache[entry["file"] + ".uci"] = (entry["uci_mtime"], entry["level_dict"])
+        library.append(
+            {
+                "file": entry["file"],
+                "level_dict": entry["level_dict"],
+                "text": _make_text(entry["text"]),
+                "name": entry["name"],
+                "elo": entry["elo"],
+            }
+        )
+    return library
+
+
+def read_engine_ini(engine_shell=None, engine_path=None, filename=None, use_cache=True) -> list[dict[str, str]]:
     l_web_text = ""
     """Read engine.ini and create a library list out of it."""
     if filename is None:
         filename = "engines.ini"
+    ini_mtime: Optional[int] = None
+    if engine_shell is None:
+        if not engine_path:
+            program_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+            engine_path = program_path + os.sep + "engines" + os.sep + platform.machine()
+        ini_mtime = _mtime_ns(engine_path + os.sep + filename)
+        if use_cache and ini_mtime is not None:
+            entries = _load_catalogue(engine_path, filename)
+            if entries is not None:
+                logger.debug("using compiled engine catalogue for %s", filename)
+                return _library_from_catalogue(entries)
     config = configparser.ConfigParser()
     config.optionxform = str  # type: ignore
     try:
         if engine_shell is None:
-            if not engine_path:
-                program_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-                engine_path = program_path + os.sep + "engines" + os.sep + platform.machine()
             logger.debug("complete path without shell: %s", str(engine_path + os.sep + filename))
             config.read(engine_path + os.sep + filename)
         else:
@@ -46,46 +150,40 @@ def read_engine_ini(engine_shell=None, engine_path=None, filename=None) -> list[
     except FileNotFoundError:
         pass
 
-    library = []
+    entries = []
     for section in config.sections():
-        parser = configparser.ConfigParser()
-        parser.optionxform = str  # type: ignore
-
+        uci_file = engine_path + os.sep + section + ".uci"
         level_dict: dict[str, dict] = {}
         if engine_shell is None:
-            success = bool(parser.read(engine_path + os.sep + section + ".uci"))
+            level_dict = read_uci_file(uci_file)
         else:
+            parser = configparser.ConfigParser()
+            parser.optionxform = str  # type: ignore
             try:
-                with engine_shell.open(engine_path + os.sep + section + ".uci", "r") as file:
+                with engine_shell.open(uci_file, "r") as file:
                     parser.read_file(file)
-                success = True
+                for p_section in parser.sections():
+                    level_dict[p_section] = dict(parser[p_section])
             except FileNotFoundError:
-                success = False
-        if success:
-            for p_section in parser.sections():
-                level_dict[p_section] = {}
-                for option in parser.options(p_section):
-                    level_dict[p_section][option] = parser[p_section][option]
+                pass
 
         confsect = config[section]
         l_web_text = confsect["web"] if "web" in confsect else confsect["large"]
-        text = Dgt.DISPLAY_TEXT(
-            web_text=l_web_text,
-            large_text=confsect["large"],
-            medium_text=confsect["medium"],
-            small_text=confsect["small"],
-            wait=True,
-            beep=False,
-            maxtime=0,
-            devs={"ser", "i2c", "web"},
-        )
-        library.append(
+        entries.append(
             {
                 "file": engine_path + os.sep + section,
+                "uci_mtime": _mtime_ns(uci_file) if engine_shell is None else None,
                 "level_dict": level_dict,
-                "text": text,
+                "text": {
+                    "web_text": l_web_text,
+                    "large_text": confsect["large"],
+                    "medium_text": confsect["medium"],
+                    "small_text": confsect["small"],
+                },
                 "name": confsect["name"],
                 "elo": confsect["elo"],
             }
         )
-    return library
+    if engine_shell is None and use_cache and ini_mtime is not None:
+        _save_catalogue(engine_path, filename, ini_mtime, entries)
+    return _library_from_catalogue(entries)
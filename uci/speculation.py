@@ -0,0 +1,142 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import chess  # type: ignore
+from chess.engine import InfoDict, Limit
+
+SLICE_TIME = 0.25  # seconds of the first search of a position, doubled for every further search
+MAX_SEARCH_TIME = 8.0  # longest search of one position when no fixed move time is set
+CPU_SHARE = 50  # percent of one core the speculative searches may use
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation(object):
+    """Short searches of the playing engine on the positions after the likely user moves.
+
+    While the user thinks the playing engine is idle. Every round asks predict()
+    for the likely user moves (the tutor's best moves) and searches each resulting
+    position once, twice as long as before, sleeping in between so that the
+    engine uses at most cpu_share percent of a core. The searches fill the
+    engine hash. take() ends the speculation when the user has moved and returns
+    the search of the new position - if it was as long as a fixed move time the
+    engine move can be played right away.
+    """
+
+    def __init__(self, max_moves: int, cpu_share: int = CPU_SHARE, slice_time: float = SLICE_TIME):
+        self.max_moves = max_moves
+        self.cpu_share = min(100, max(1, cpu_share))
+        self.slice_time = slice_time
+        self._task: Optional[asyncio.Task] = None
+        self._fen = ""  # position the user is thinking about
+        self._results: Dict[str, Tuple[InfoDict, float]] = {}  # fen -> (info, seconds) of longest search
+        self.searches = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(
+        self,
+        engine,
+        game: chess.Board,
+        predict: Callable[[], Awaitable[List[chess.Move]]],
+        max_time: float = MAX_SEARCH_TIME,
+    ):
+        """Start speculating with engine (the playing UciEngine) on the user moves predict() returns for game."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._fen = game.fen()
+        self._results = {}
+        self._task = asyncio.create_task(self._speculate(engine, game.copy(), predict, max_time))
+
+    async def _speculate(
+        self, engine, game: chess.Board, predict: Callable[[], Awaitable[List[chess.Move]]], max_time: float
+    ):
+        try:
+            while True:
+                searched = False
+                for move in (await predict())[: self.max_moves]:
+                    if not game.is_legal(move):
+                        continue
+                    board = game.copy()
+                    board.push(move)
+                    searched_time = self._results.get(board.fen(), ({}, 0.0))[1]
+                    if searched_time >= max_time:
+                        continue
+                    search_time = min(max_time, max(self.slice_time, 2 * searched_time))
+                    started = time.monotonic()
+                    info = await engine.speculate(board, Limit(time=search_time))
+                    elapsed = time.monotonic() - started
+                    if info is None:
+                        return  # engine busy or gone - think() will do without
+                    if "pv" in info:
+                        self._results[board.fen()] = (info, search_time)
+                    self.searches += 1
+                    searched = True
+                    await asyncio.sleep(elapsed * (100 - self.cpu_share) / self.cpu_share)
+                if not searched:
+                    await asyncio.sleep(self.slice_time)  # wait for (new) tutor predictions
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:  # noqa - never let a speculation error reach the event loop
+            logger.debug("speculation failed: %s", exc)
+
+    async def stop(self):
+        """Stop the running speculative search, the engine is free afterwards."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def take(self, game: chess.Board) -> Optional[Tuple[InfoDict, float]]:
+        """Stop speculating - return (info, seconds) of the search of game if there was one."""
+        await self.stop()
+        result = self._results.pop(game.fen(), None)
+        self._results = {}
+        parent = game.copy()
+        if parent.move_stack and self._fen:
+            parent.pop()
+            speculated, self._fen = parent.fen() == self._fen, ""
+        else:
+            speculated = False
+        if speculated:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            stats = self.get_stats()
+            logger.info(
+                "speculation %s - hit rate %.2f of %d moves",
+                "hit" if result else "miss",
+                stats["hit_rate"],
+                stats["moves"],
+            )
+        return result
+
+    def get_stats(self) -> dict:
+        """Return the speculation counters and the hit rate."""
+        moves = self.hits + self.misses
+        return {
+            "searches": self.searches,
+            "hits": self.hits,
+            "misses": self.misses,
+            "moves": moves,
+            "hit_rate": round(self.hits / moves, 3) if moves else 0.0,
+        }
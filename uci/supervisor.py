@@ -0,0 +1,164 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import logging
+import time
+
+import chess  # type: ignore
+import chess.engine  # type: ignore
+
+from utilities import AsyncRepeatingTimer
+
+CHECK_INTERVAL = 5.0  # seconds between two health checks
+PING_TIMEOUT = 10.0  # seconds an idle engine has to answer isready
+MAX_RESPAWNS = 3  # give up when the engine crashes more often than this ...
+RESPAWN_WINDOW = 120.0  # ... within this many seconds
+MIN_CLOCK_MS = 100  # never send less than this to a respawned engine
+
+logger = logging.getLogger(__name__)
+
+
+def corrected_time_dict(time_dict: dict, board: chess.Board, elapsed: float) -> dict:
+    """Return a copy of the uci time_dict with the time spent before the crash taken from the engines clock."""
+    corrected = dict(time_dict)
+    spent_ms = int(elapsed * 1000)
+    for key in ("wtime" if board.turn == chess.WHITE else "btime", "movetime"):
+        if key in corrected:
+            try:
+                corrected[key] = max(int(float(corrected[key])) - spent_ms, MIN_CLOCK_MS)
+            except ValueError:
+                pass  # leave broken values to get_engine_limit
+    return corrected
+
+
+class EngineSupervisor(object):
+    """Watch a UciEngine and respawn it after the process died or stopped answering isready."""
+
+    def __init__(self, uci_engine, loop: asyncio.AbstractEventLoop, interval: float = CHECK_INTERVAL):
+        self.uci_engine = uci_engine
+        self.loop = loop
+        self.crash_count = 0
+        self.respawn_count = 0
+        self.pending_go: dict | None = None  # last go request, reissued if the engine dies while thinking
+        self._crash_times: collections.deque = collections.deque(maxlen=MAX_RESPAWNS + 1)
+        self._respawning = False
+        self._reissue = False  # the respawn in progress answers the pending go
+        self._stopped = True
+        self.timer = AsyncRepeatingTimer(interval, self._check, loop)
+
+    def start(self):
+        """Start the periodic health check."""
+        self._stopped = False
+        if not self.timer.is_running():
+            self.timer.start()
+
+    def stop(self):
+        """Stop supervising - call before quitting the engine on purpose."""
+        self._stopped = True
+        if self.timer.is_running():
+            self.timer.stop()
+
+    def remember_go(self, time_dict: dict, game: chess.Board, result_queue: asyncio.Queue, root_moves):
+        """Store the go request so that it can be reissued after a respawn."""
+        self.pending_go = {
+            "time_dict": dict(time_dict),
+            "game": game.copy(),
+            "result_queue": result_queue,
+            "root_moves": root_moves,
+            "started": time.monotonic(),
+        }
+
+    def get_stats(self) -> dict:
+        """Return crash and respawn counters."""
+        return {"crashes": self.crash_count, "respawns": self.respawn_count}
+
+    def _process_exited(self) -> bool:
+        transport = self.uci_engine.transport
+        return transport is not None and transport.get_returncode() is not None
+
+    async def _check(self):
+        """Periodic check: dead process at any time, hung isready while the engine is idle (not for helper engines)."""
+        if self._stopped or self._respawning or not self.uci_engine.loaded_ok():
+            return
+        if self._process_exited():
+            await self.on_crash("process exited with code {}".format(self.uci_engine.transport.get_returncode()))
+            return
+        if self.uci_engine.is_helper_engine():
+            return  # isready would run the pgn or online game logic again - the exit check is enough
+        analyser = self.uci_engine.analyser
+        if analyser is None or analyser.is_running() or not analyser.is_idle():
+            return  # isready would disturb the running search
+        lock = self.uci_engine.engine_lock
+        if lock.locked():
+            return
+        async with lock:
+            try:
+                await asyncio.wait_for(self.uci_engine.engine.ping(), PING_TIMEOUT)
+            except asyncio.TimeoutError:
+                hung = True
+            except chess.engine.EngineTerminatedError:
+                hung = True
+            except chess.engine.EngineError:
+                hung = False  # engine is alive, it just did not like the timing
+            else:
+                hung = False
+        if hung:
+            await self.on_crash("no readyok within {}s".format(PING_TIMEOUT))
+
+    async def on_crash(self, reason: str) -> bool:
+        """Respawn the engine with the same options, restore analysis and a pending go.
+        Returns True if the pending go gets an answer (reissued or None), else the caller has to answer it."""
+        if self._stopped:
+            return False
+        if self._respawning:
+            return self._reissue  # the go died with the process that is respawned right now
+        self._respawning = True
+        pending_go = self.pending_go
+        was_thinking = pending_go is not None and self.uci_engine.analyser.move_pending
+        self._reissue = was_thinking
+        try:
+            self.crash_count += 1
+            now = time.monotonic()
+            self._crash_times.append(now)
+            logger.error("%s crashed: %s (crash %d)", self.uci_engine.whoami, reason, self.crash_count)
+            if len(self._crash_times) > MAX_RESPAWNS and now - self._crash_times[0] < RESPAWN_WINDOW:
+                logger.error("%s crashes too often - not respawning", self.uci_engine.whoami)
+                await self._fail_pending_go(was_thinking)
+                self.stop()
+                return was_thinking
+            if not await self.uci_engine.respawn():
+                logger.error("%s could not be respawned", self.uci_engine.whoami)
+                await self._fail_pending_go(was_thinking)
+                return was_thinking
+            self.respawn_count += 1
+            logger.info("%s respawned (respawn %d)", self.uci_engine.whoami, self.respawn_count)
+            if was_thinking:
+                time_dict = corrected_time_dict(
+                    pending_go["time_dict"], pending_go["game"], time.monotonic() - pending_go["started"]
+                )
+                logger.info("%s reissuing go with %s", self.uci_engine.whoami, time_dict)
+                await self.uci_engine.go(
+                    time_dict, pending_go["game"], pending_go["result_queue"], pending_go["root_moves"]
+                )
+            return was_thinking
+        finally:
+            self._respawning = False
+            self._reissue = False
+
+    async def _fail_pending_go(self, was_thinking: bool):
+        """Let a waiting think() continue - None is the usual engine error result."""
+        if was_thinking and self.pending_go is not None:
+            await self.pending_go["result_queue"].put(None)
+        self.pending_go = None
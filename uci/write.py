@@ -17,15 +17,129 @@
 
 import platform
 import configparser
+import concurrent.futures
+import hashlib
+import json
+import logging
 import os
-import asyncio
-from uci.engine import UciShell, UciEngine
+import time
+from typing import Optional
 
+import chess.engine  # type: ignore
 
-def write_engine_ini(engine_path=None):
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE = "engines.probe.json"  # probe results of the last run, keyed by binary file name
+PROBE_TIMEOUT = 20  # seconds an engine gets to answer the uci handshake
+MAX_WORKERS = 4  # engines probed at the same time
+
+
+def _file_hash(fpath: str) -> str:
+    digest = hashlib.sha1()
+    with open(fpath, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _probe_engine(fpath: str) -> dict:
+    """Start the engine binary, read its uci id and options (runs in a worker process)."""
+    engine = chess.engine.SimpleEngine.popen_uci(fpath, timeout=PROBE_TIMEOUT)
+    try:
+        options = {
+            name: {"default": option.default, "min": option.min, "max": option.max}
+            for name, option in engine.options.items()
+        }
+        return {"name": engine.id.get("name", os.path.basename(fpath)), "options": options}
+    finally:
+        try:
+            engine.quit()
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError):
+            engine.close()
+
+
+def _load_probe_cache(engine_path: str) -> dict:
+    try:
+        with open(engine_path + os.sep + PROBE_CACHE, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_probe_cache(engine_path: str, cache: dict):
+    try:
+        with open(engine_path + os.sep + PROBE_CACHE, "w", encoding="utf-8") as file:
+            json.dump(cache, file, indent=1, sort_keys=True)
+    except OSError as exc:
+        logger.warning("could not write %s: %s", PROBE_CACHE, exc)
+
+
+def _cached_probe(cache: dict, fpath: str, stat: os.stat_result) -> Optional[dict]:
+    """Return the cached probe of an unchanged binary (same size and mtime, or same content)."""
+    entry = cache.get(os.path.basename(fpath))
+    if not entry or entry["size"] != stat.st_size:
+        return None
+    if entry["mtime"] != stat.st_mtime_ns:
+        # touched but maybe not changed (copied, unpacked again): compare the content
+        if entry["sha1"] != _file_hash(fpath):
+            return None
+        entry["mtime"] = stat.st_mtime_ns
+    return entry["probe"]
+
+
+def probe_engines(engine_path: str, engine_files: list[str], max_workers: int = MAX_WORKERS) -> dict:
+    """Probe all (changed) engine binaries in a bounded process pool, return {file: probe}."""
+    cache = _load_probe_cache(engine_path)
+    probes: dict[str, dict] = {}
+    todo: dict[str, os.stat_result] = {}
+    for engine_file_name in engine_files:
+        fpath = engine_path + os.sep + engine_file_name
+        stat = os.stat(fpath)
+        probe = _cached_probe(cache, fpath, stat)
+        if probe is None:
+            todo[engine_file_name] = stat
+        else:
+            probes[engine_file_name] = probe
+    logger.info("engines unchanged: %d, to probe: %d", len(probes), len(todo))
+
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_probe_engine, engine_path + os.sep + engine_file_name): engine_file_name
+                for engine_file_name in todo
+            }
+            for future in concurrent.futures.as_completed(futures):
+                engine_file_name = futures[future]
+                fpath = engine_path + os.sep + engine_file_name
+                try:
+                    # a hung binary is bounded by PROBE_TIMEOUT inside the worker
+                    probe = future.result()
+                except Exception as exc:  # noqa - a broken binary must not stop the others
+                    logger.warning("engine %s could not be probed: %s", engine_file_name, exc)
+                    cache.pop(engine_file_name, None)
+                    continue
+                print(engine_file_name)
+                probes[engine_file_name] = probe
+                stat = todo[engine_file_name]
+                cache[engine_file_name] = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "sha1": _file_hash(fpath),
+                    "probe": probe,
+                }
+
+    for engine_file_name in list(cache):
+        if engine_file_name not in engine_files:
+            del cache[engine_file_name]
+    _save_probe_cache(engine_path, cache)
+    return probes
+
+
+def write_engine_ini(engine_path=None, max_workers: int = MAX_WORKERS):
     """Read the engine folder and create the engine.ini file."""
 
-    def write_level_ini(engine_filename: str):
+    def write_level_ini(engine_filename: str, options: dict):
         """Write the level part for the engine.ini file."""
 
         def calc_inc(diflevel: int):
@@ -41,11 +155,10 @@ def write_engine_ini(engine_path=None):
         parser = configparser.ConfigParser()
         parser.optionxform = str  # type: ignore
         if not parser.read(engine_path + os.sep + engine_filename + ".uci"):
-            options = engine.get_options()
-            if engine.has_limit_strength():
+            if "UCI_LimitStrength" in options and "UCI_Elo" in options:
                 uelevel = options["UCI_Elo"]
-                minelo = uelevel.min
-                maxelo = uelevel.max
+                minelo = uelevel["min"]
+                maxelo = uelevel["max"]
                 minlevel, maxlevel = min(minelo, maxelo), max(minelo, maxelo)
                 lvl_inc = calc_inc(maxlevel - minlevel)
                 level = minlevel
@@ -53,24 +166,24 @@ def write_engine_ini(engine_path=None):
                     parser["Elo@{:04d}".format(level)] = {"UCI_LimitStrength": "true", "UCI_Elo": str(level)}
                     level += lvl_inc
                 parser["Elo@{:04d}".format(maxlevel)] = {"UCI_LimitStrength": "false", "UCI_Elo": str(maxlevel)}
-            if engine.has_skill_level():
+            if "Skill Level" in options:
                 sklevel = options["Skill Level"]
-                minlevel = sklevel.min
-                maxlevel = sklevel.max
+                minlevel = sklevel["min"]
+                maxlevel = sklevel["max"]
                 minlevel, maxlevel = min(minlevel, maxlevel), max(minlevel, maxlevel)
                 for level in range(minlevel, maxlevel + 1):
                     parser["Level@{:02d}".format(level)] = {"Skill Level": str(level)}
-            if engine.has_handicap_level():
+            if "Handicap Level" in options:
                 sklevel = options["Handicap Level"]
-                minlevel = sklevel.min
-                maxlevel = sklevel.max
+                minlevel = sklevel["min"]
+                maxlevel = sklevel["max"]
                 minlevel, maxlevel = min(minlevel, maxlevel), max(minlevel, maxlevel)
                 for level in range(minlevel, maxlevel + 1):
                     parser["Level@{:02d}".format(level)] = {"Handicap Level": str(level)}
-            if engine.has_strength():
+            if "Strength" in options:
                 sklevel = options["Strength"]
-                minlevel = sklevel.min
-                maxlevel = sklevel.max
+                minlevel = sklevel["min"]
+                maxlevel = sklevel["max"]
                 minlevel, maxlevel = min(minlevel, maxlevel), max(minlevel, maxlevel)
                 lvl_inc = calc_inc(maxlevel - minlevel)
                 level = minlevel
@@ -80,8 +193,9 @@ def write_engine_ini(engine_path=None):
                     level += lvl_inc
                     count += 1
                 parser["Level@{:02d}".format(count)] = {"Strength": str(maxlevel)}
-            with open(engine_path + os.sep + engine_filename + ".uci", "w") as configfile:
-                parser.write(configfile)
+            if parser.sections():
+                with open(engine_path + os.sep + engine_filename + ".uci", "w") as configfile:
+                    parser.write(configfile)
 
     def is_exe(fpath: str):
         """Check if fpath is an executable."""
@@ -99,58 +213,49 @@ def write_engine_ini(engine_path=None):
     if not engine_path:
         program_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
         engine_path = program_path + os.sep + "engines" + os.sep + platform.machine()
-    engine_list = sorted(os.listdir(engine_path))
+    engine_list = [name for name in sorted(os.listdir(engine_path)) if is_exe(engine_path + os.sep + name)]
+    start = time.monotonic()
+    probes = probe_engines(engine_path, engine_list, max_workers)
     config = configparser.ConfigParser()
     config.optionxform = str
-    uci_shell = UciShell()
     for engine_file_name in engine_list:
-        if is_exe(engine_path + os.sep + engine_file_name):
-            mame_par = ""  # attempt a simple porting of this code
-            loop = asyncio.get_event_loop()  # _could_ work as we just ask for name
-            engine = UciEngine(
-                file=engine_path + os.sep + engine_file_name, uci_shell=uci_shell, mame_par=mame_par, loop=loop
-            )
-            if engine:
-                print(engine_file_name)
-                try:
-                    if engine.has_levels():
-                        write_level_ini(engine_file_name)
-                    engine_name = engine.get_name()
-
-                    name_parts = engine_name.replace(".", "").split(" ")
-                    name_small = name_build(name_parts, 6, engine_file_name[2:])
-                    name_medium = name_build(name_parts, 8, name_small)
-                    name_large = name_build(name_parts, 11, name_medium)
-
-                    config[engine_file_name] = {}
-
-                    # config[engine_file_name][';available options'] = 'itsDefaultValue'
-                    engine_options = engine.get_options()
-                    for option in engine_options:
-                        config[engine_file_name][str(";" + option)] = str(engine_options[option].default)
-
-                    comp_elo = 2500
-                    engine_elo = {
-                        "stockfish": 3360,
-                        "texel": 3050,
-                        "rodent": 2920,
-                        "zurichess": 2790,
-                        "wyld": 2630,
-                        "sayuri": 1850,
-                    }
-                    for name, elo in engine_elo.items():
-                        if engine_name.lower().startswith(name):
-                            comp_elo = elo
-                            break
-
-                    config[engine_file_name]["name"] = engine_name
-                    config[engine_file_name]["small"] = name_small
-                    config[engine_file_name]["medium"] = name_medium
-                    config[engine_file_name]["large"] = name_large
-                    config[engine_file_name]["elo"] = str(comp_elo)
-
-                except AttributeError:
-                    pass
-                engine.quit()
+        if engine_file_name not in probes:
+            continue
+        engine_options = probes[engine_file_name]["options"]
+        write_level_ini(engine_file_name, engine_options)
+        engine_name = probes[engine_file_name]["name"]
+
+        name_parts = engine_name.replace(".", "").split(" ")
+        name_small = name_build(name_parts, 6, engine_file_name[2:])
+        name_medium = name_build(name_parts, 8, name_small)
+        name_large = name_build(name_parts, 11, name_medium)
+
+        config[engine_file_name] = {}
+
+        # config[engine_file_name][';available options'] = 'itsDefaultValue'
+        for option in engine_options:
+            config[engine_file_name][str(";" + option)] = str(engine_options[option]["default"])
+
+        comp_elo = 2500
+        engine_elo = {
+            "stockfish": 3360,
+            "texel": 3050,
+            "rodent": 2920,
+            "zurichess": 2790,
+            "wyld": 2630,
+            "sayuri": 1850,
+        }
+        for name, elo in engine_elo.items():
+            if engine_name.lower().startswith(name):
+                comp_elo = elo
+                break
+
+        config[engine_file_name]["name"] = engine_name
+        config[engine_file_name]["small"] = name_small
+        config[engine_file_name]["medium"] = name_medium
+        config[engine_file_name]["large"] = name_large
+        config[engine_file_name]["elo"] = str(comp_elo)
+
     with open(engine_path + os.sep + "engines.ini", "w") as configfile:
         config.write(configfile)
+    logger.info("engines.ini written for %d engines in %.1fs", len(probes), time.monotonic() - start)
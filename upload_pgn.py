@@ -1,22 +1,139 @@
 # upload_handler.py
 
 import os
+import re
 import base64
+import logging
+import tempfile
+from typing import BinaryIO, Callable, Dict, Optional
+
 import pam
 import tornado.web
+from tornado.httputil import HTTPHeaders
 
 from utilities import Observable
 from dgt.api import Event
+from pgn_index import PgnIndexBuilder, PgnLibrary
 
 
 UPLOAD_DIR = "/opt/picochess/games"
 FIXED_FILENAME = "picochess_game_1.pgn"
 FIXED_PATH = os.path.join(UPLOAD_DIR, FIXED_FILENAME)
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024  # a big collection, not the whole card
+MAX_FIELD_SIZE = 1024  # form fields other than the file, like the game number
+
+logger = logging.getLogger(__name__)
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
+class MultipartFileReader(object):
+    """Incremental multipart/form-data parser, the file field goes to on_data chunk by chunk.
+
+    Only the last bytes of a chunk that might start the next boundary are held
+    back, so memory use does not grow with the size of the upload. The other
+    (small) form fields are collected in fields.
+    """
+
+    def __init__(self, boundary: bytes, on_data: Callable[[bytes], None], file_field: str = "file"):
+        self._delimiter = b"\r\n--" + boundary
+        self._on_data = on_data
+        self._file_field = file_field
+        self._buffer = b"\r\n"  # the first boundary has no line break before it
+        self._state = "preamble"  # -> headers -> body -> ... -> end
+        self._name = ""
+        self._value = b""
+        self.filename: Optional[str] = None  # of the file field, None until it arrived
+        self.fields: Dict[str, str] = {}
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        while self._step():
+            pass
+
+    def _step(self) -> bool:
+        """Parse what the buffer holds for the current state - returns True if the state changed."""
+        if self._state == "preamble":
+            found = self._buffer.find(self._delimiter)
+            if found < 0:
+                self._buffer = self._buffer[-len(self._delimiter) :]
+                return False
+            self._buffer = self._buffer[found + len(self._delimiter) :]
+            self._state = "boundary"
+        if self._state == "boundary":
+            if len(self._buffer) < 2:
+                return False
+            if self._buffer.startswith(b"--"):
+                self._state, self._buffer = "end", b""
+                return False
+            self._state = "headers"
+        if self._state == "headers":
+            end = self._buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self._buffer) > 64 * 1024:
+                    raise ValueError("multipart headers too long")
+                return False
+            headers = HTTPHeaders.parse(self._buffer[:end].decode("utf-8", errors="replace"))
+            self._buffer = self._buffer[end + 4 :]
+            disposition = headers.get("Content-Disposition", "")
+            name = re.search(r'\bname="([^"]*)"', disposition)
+            filename = re.search(r'\bfilename="([^"]*)"', disposition)
+            self._name = name.group(1) if name else ""
+            self._value = b""
+            if self._name == self._file_field:
+                self.filename = os.path.basename(filename.group(1)) if filename else ""
+            self._state = "body"
+        if self._state == "body":
+            found = self._buffer.find(self._delimiter)
+            if found < 0:
+                # the buffer end could be the start of the delimiter, it waits for the next chunk
+                keep = len(self._delimiter) - 1
+                self._data(self._buffer[:-keep])
+                self._buffer = self._buffer[-keep:]
+                return False
+            self._data(self._buffer[:found])
+            if self._name and self._name != self._file_field:
+                self.fields[self._name] = self._value.decode("utf-8", errors="replace")
+            self._buffer = self._buffer[found + len(self._delimiter) :]
+            self._state = "boundary"
+            return True
+        return False
+
+    def _data(self, data: bytes):
+        if not data:
+            return
+        if self._name == self._file_field:
+            self._on_data(data)
+        elif len(self._value) + len(data) <= MAX_FIELD_SIZE:
+            self._value += data
+
+    @property
+    def complete(self) -> bool:
+        return self._state == "end"
+
+
+@tornado.web.stream_request_body
 class UploadHandler(tornado.web.RequestHandler):
+    """Receive a pgn file (one game or a collection) and load one of its games.
+
+    The request body is streamed to a temporary file in the games folder and
+    its games are indexed while they arrive - a big collection never sits in
+    memory and needs no second scan. The file replaces picochess_game_1.pgn
+    (Game 1 of the menu), the game number "game" (0 = first, a form field or
+    url argument) is loaded with a READ_GAME event and can be changed later
+    through the games library (/games?action=read_game).
+    """
+
+    def initialize(self, library: Optional[PgnLibrary] = None, upload_dir: str = UPLOAD_DIR):
+        self.library = library or PgnLibrary(upload_dir)
+        self.upload_dir = upload_dir
+        self.pgn_path = os.path.join(upload_dir, FIXED_FILENAME)
+        self._file: Optional[BinaryIO] = None
+        self._tmp_path = ""
+        self._reader: Optional[MultipartFileReader] = None
+        self._builder: Optional[PgnIndexBuilder] = None
+        self._size = 0
+
     def prepare(self):
         auth_header = self.request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Basic "):
@@ -36,23 +153,76 @@ class UploadHandler(tornado.web.RequestHandler):
 
         self.current_user = username
 
+        if self.request.method != "POST":
+            return
+        self.request.connection.set_max_body_size(MAX_UPLOAD_SIZE)
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+            if not boundary:
+                self.set_status(400)
+                self.finish("No multipart boundary")
+                return
+            self._reader = MultipartFileReader(boundary.group(1).encode("latin-1"), self._write)
+        # else: the body is the pgn file itself, e.g. curl --data-binary @games.pgn /upload-pgn?filename=games.pgn
+        fd, self._tmp_path = tempfile.mkstemp(suffix=".part", dir=self.upload_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._builder = PgnIndexBuilder(self.pgn_path)
+
     def request_auth(self):
         self.set_status(401)
         self.set_header("WWW-Authenticate", 'Basic realm="Upload Area"')
         self.finish("Authentication required")
 
+    def data_received(self, chunk: bytes):
+        if self._file is None:
+            return  # refused in prepare
+        if self._reader is not None:
+            self._reader.feed(chunk)
+        else:
+            self._write(chunk)
+
+    def _write(self, data: bytes):
+        assert self._file is not None and self._builder is not None  # set in prepare
+        self._file.write(data)
+        self._builder.feed(data)
+        self._size += len(data)
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            self._tmp_path = ""
+
+    def on_connection_close(self):
+        self._discard()  # upload aborted
+
+    def on_finish(self):
+        self._discard()  # nothing left behind if the upload was refused
+
     async def post(self):
         if not hasattr(self, "current_user"):
             return  # Auth failed
 
-        if "file" not in self.request.files:
+        fields = self._reader.fields if self._reader else {}
+        if self._reader:
+            original_name = self._reader.filename
+        else:
+            original_name = self.get_argument("filename", FIXED_FILENAME)
+        if self._reader and not self._reader.complete:
+            self.set_status(400)
+            self.finish("Upload incomplete")
+            return
+        if original_name is None or not self._size:
             self.set_status(400)
             self.finish("No file uploaded")
             return
 
-        fileinfo = self.request.files["file"][0]
-        original_name = fileinfo["filename"]
-
         # Check if uploaded file is a PGN file (by name)
         if not original_name.lower().endswith(".pgn"):
             self.set_status(400)
@@ -60,13 +230,33 @@ class UploadHandler(tornado.web.RequestHandler):
             return
 
         try:
-            with open(FIXED_PATH, "wb") as f:
-                f.write(fileinfo["body"])
-                event = Event.READ_GAME(pgn_filename="picochess_game_1.pgn")
-                await Observable.fire(event)
+            game_index = int(fields.get("game") or self.get_argument("game", "0"))
+        except ValueError:
+            self.set_status(400)
+            self.finish("Game number is not a number.")
+            return
+
+        games = self._builder.close()
+        if not 0 <= game_index < games:
+            self.set_status(400)
+            self.finish(f"'{original_name}' has {games} games, there is no game number {game_index}.")
+            return
+
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.pgn_path)
+            self._tmp_path = ""
+            self.library.add(FIXED_FILENAME, self._builder.finish())
         except Exception as e:
             self.set_status(500)
             self.finish(f"Failed to save file: {str(e)}")
             return
+        logger.debug("upload %s: %d bytes, %d games", original_name, self._size, games)
+
+        await Observable.fire(Event.READ_GAME(pgn_filename=FIXED_FILENAME, game_index=game_index))
 
-        self.write(f"User '{self.current_user}' uploaded '{original_name}' and it was saved as Game 1.")
+        self.write(
+            f"User '{self.current_user}' uploaded '{original_name}' ({games} games) and it was saved as Game 1, "
+            f"game number {game_index} loaded."
+        )
@@ -1088,6 +1088,7 @@ function download() {
 function newBoard(fen) {
     stopAnalysis();
 
+    fenHash = {};
     currentPosition = {};
     currentPosition.fen = fen;
 
@@ -1517,26 +1518,66 @@ function analyze(position_update) {
     window.stockfish.postMessage('go infinite');
 }
 
-function updateDGTPosition(data) {
+// half moves since the game start, as python-chess Board.ply()
+function fenPly(fen) {
+    var fields = fen.split(' ');
+    return 2 * (parseInt(fields[5], 10) - 1) + (fields[1] === 'b' ? 1 : 0);
+}
+
+// add the move of a game message to the game shown - false if it is out of step with picochess
+function applyGameMove(data) {
+    if (goToPosition(data.fen)) {
+        // known position, e.g. the move was made on this board
+        fenHash['last'] = currentPosition;
+        return true;
+    }
+    var last = fenHash['last'] || gameHistory;
+    var lastFen = last.fen || setupBoardFen;
+    if (fenPly(lastFen) + 1 !== data.ply) {
+        return false;
+    }
+    var tmpGame = new Chess(lastFen, chessGameType);
+    var move = tmpGame.move(data.move, { sloppy: true });
+    if (move === null || tmpGame.fen() !== data.fen) {
+        return false;
+    }
+    stopAnalysis();
+    currentPosition = last;
+    updateCurrentPosition(move, tmpGame);
+    fenHash['last'] = currentPosition;
+    updateChessGround();
+    updateStatus();
+    if (computerside == "" || move.color != computerside) {
+        saymove(move, tmpGame); // announce user move
+    }
+    return true;
+}
+
+// game messages carry the whole game (pgn) only as snapshot, the moves come one by one
+function updateDGTPosition(data, resync = true) {
+    if (data.pgn === undefined) {
+        if (!applyGameMove(data) && resync) {
+            goToDGTFen(); // a message was missed, load a snapshot
+        }
+        return;
+    }
     if (!goToPosition(data.fen) || data.play === 'reload') {
         loadGame(data['pgn'].split("\n"));
         goToPosition(data.fen);
     }
+    if (currentPosition) {
+        fenHash['last'] = currentPosition;
+    }
 }
 
 function goToDGTFen() {
     $.get('/dgt', { action: 'get_last_move' }, function (data) {
         if (data) {
-            updateDGTPosition(data);
-            highlightBoard(data.move, data.play);
-            addArrow(data.move, data.play);
-        }
-        else {
-            data.fen = START_FEN
-            updateDGTPosition(data);
+            updateDGTPosition(data, false);
             highlightBoard(data.move, data.play);
             addArrow(data.move, data.play);
         }
+        // else: no game yet
     }).fail(function (jqXHR, textStatus) {
         dgtClockStatusEl.html(textStatus);
     });
@@ -1692,6 +1733,9 @@ $(function () {
     }
     else {
         var ws = new WebSocket('ws://' + location.host + '/event');
+        ws.onopen = function () {
+            goToDGTFen(); // snapshot of the game, the moves follow as they are made
+        };
         // Process messages from picochess
         ws.onmessage = function (e) {
             var data = JSON.parse(e.data);